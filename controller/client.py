@@ -0,0 +1,111 @@
+import asyncio
+import json
+import sys
+
+import numpy as np
+
+from controller.server import DEFAULT_HOST
+from controller.server import DEFAULT_PORT
+from controller.server import FRAME_HEADER
+from controller.server import FRAME_NAMES
+from controller.server import FRAME_REPLY
+from controller.server import FRAME_STATE
+from controller.server import STATE_HEADER
+from controller.server import STATE_RECORD
+
+
+def decode_state(payload: bytes) -> dict:
+    """
+    Decodes the payload of a state frame.
+
+    Returns:
+        dict: The simulated time, the updated train records and the keys of the removed trains
+    """
+    simulated_time, updated, removed = STATE_HEADER.unpack_from(payload)
+    offset = STATE_HEADER.size
+    records = np.frombuffer(payload, dtype=STATE_RECORD, count=updated, offset=offset)
+    offset += updated * STATE_RECORD.itemsize
+    removed_keys = np.frombuffer(payload, dtype="<u4", count=removed, offset=offset)
+    return {"time": simulated_time, "trains": records, "removed": removed_keys}
+
+
+class ControlClient:
+    """
+    A client for the ControlServer, used by dispatch tooling and for testing the server locally.
+
+    Attributes:
+        trains (dict): The latest known state of every train, by train ID
+        names (dict): The train ID of every numeric train key
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.trains = {}
+        self.names = {}
+        self.replies = asyncio.Queue()
+        self.states = asyncio.Queue()
+        self.receiver = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.receiver = asyncio.create_task(self.receive())
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.receiver.cancel()
+
+    async def send(self, commands: list) -> list:
+        """
+        Sends a batch of commands and waits for the results.
+
+        Args:
+            commands (list): The command objects of the batch
+
+        Returns:
+            list: One result per command
+        """
+        self.writer.write(json.dumps(commands).encode() + b"\n")
+        await self.writer.drain()
+        return await self.replies.get()
+
+    async def receive(self):
+        while True:
+            header = await self.reader.readexactly(FRAME_HEADER.size)
+            kind, length = FRAME_HEADER.unpack(header)
+            payload = await self.reader.readexactly(length)
+            if kind == FRAME_REPLY:
+                await self.replies.put(json.loads(payload))
+            elif kind == FRAME_NAMES:
+                self.names.update(
+                    {int(key): train_id for key, train_id in json.loads(payload).items()}
+                )
+            elif kind == FRAME_STATE:
+                state = decode_state(payload)
+                for record in state["trains"]:
+                    self.trains[self.names[int(record["key"])]] = record
+                for key in state["removed"]:
+                    self.trains.pop(self.names[int(key)], None)
+                await self.states.put(state)
+
+    async def next_state(self) -> dict:
+        return await self.states.get()
+
+
+async def main(port: int = DEFAULT_PORT, frames: int = 5):
+    client = ControlClient(port=port)
+    await client.connect()
+    print(await client.send([{"cmd": "subscribe"}]))
+    for _ in range(frames):
+        state = await client.next_state()
+        print(f"t={state['time']:.1f}s", len(state["trains"]), "updated")
+        for train_id, record in client.trains.items():
+            print(f"    {train_id}: ({record['x']:.1f}, {record['y']:.1f}) {record['velocity']:.1f} m/s")
+    await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -49,8 +49,11 @@ def handle_mouse_input(map_view, window_view):
         prev_mouse_pos = mouse_position
     elif not pygame.mouse.get_pressed()[0] and left_mouse_button_pressed:
         left_mouse_button_pressed = False
-        map_view.handle_node_collision(window_view, mouse_position, left=True)
-        window_view.handle_window_collision(mouse_position)
+        if not window_view.handle_window_collision(mouse_position):
+            if not map_view.handle_node_collision(
+                window_view, mouse_position, left=True
+            ):
+                map_view.handle_inspector_collision(window_view, mouse_position)
 
     if pygame.mouse.get_pressed()[2] and not right_mouse_button_pressed:
         right_mouse_button_pressed = True
@@ -0,0 +1,376 @@
+import asyncio
+import json
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+from model.nodes import SimpleSwitch
+from model.nodes import SWITCH_CLEARANCE
+from model.timetable import Departure
+
+"""
+Protocol
+
+Clients send one JSON batch per line, either a single command object or a list of them:
+    {"cmd": "set_switch", "node": 3, "state": 1}
+    {"cmd": "inject_train", "train_id": "X1", "type": "RegionalTrain", "origin": 0, "stops": [7]}
+    {"cmd": "subscribe"}
+    {"cmd": "unsubscribe"}
+Node and track IDs are the IDs of the simulated network, see RailNetwork.
+
+The server answers with binary frames, each starting with a FRAME_HEADER (kind, payload length):
+    FRAME_STATE:  simulated time, number of updated and removed trains (STATE_HEADER), followed by the
+                  updated trains as STATE_RECORD and the keys of the removed trains as uint32
+    FRAME_NAMES:  JSON object mapping the numeric train keys used in state frames to train IDs
+    FRAME_REPLY:  JSON list with one result per command of a batch
+"""
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_PUBLISH_RATE = 10
+MAX_CLIENT_BUFFER = 1 << 20
+# The longest command batch line in bytes, longer lines are skipped with an error reply
+MAX_LINE_LENGTH = 1 << 20
+# The seconds start waits for the server to listen
+START_TIMEOUT = 5.0
+
+FRAME_STATE = 1
+FRAME_NAMES = 2
+FRAME_REPLY = 3
+
+FRAME_HEADER = struct.Struct("<BI")
+STATE_HEADER = struct.Struct("<dII")
+STATE_RECORD = np.dtype(
+    [
+        ("key", "<u4"),
+        ("x", "<f4"),
+        ("y", "<f4"),
+        ("velocity", "<f4"),
+        ("track", "<i4"),
+    ]
+)
+
+
+def pack_frame(kind: int, payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(kind, len(payload)) + payload
+
+
+def get_train_state(train, network) -> tuple:
+    track_id = None if train.track is None else network.getTrackId(train.track)
+    track = -1 if track_id is None else track_id
+    return (
+        float(train.position[0]),
+        float(train.position[1]),
+        float(train.velocity),
+        track,
+    )
+
+
+class ControlServer:
+    """
+    A local TCP server that lets external dispatch systems control the simulation and receive its state.
+    The server runs its own asyncio event loop in a background thread. Commands are queued and applied by the
+    simulation loop through apply_commands, state is handed over through publish, so neither side ever waits
+    for the other.
+
+    Attributes:
+        host (str): The address the server listens on, localhost by default
+        port (int): The port the server listens on
+        publish_rate (float): How many state frames per second are sent to subscribers
+        commands (queue.SimpleQueue): The command batches that wait to be applied
+        subscribers (set): The writers of the clients that receive state frames
+        train_keys (dict): The numeric key of every train ID that has been published
+    """
+
+    def __init__(
+        self,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        publish_rate: float = DEFAULT_PUBLISH_RATE,
+    ):
+        self.host = host
+        self.port = port
+        self.publish_rate = publish_rate
+        self.commands = queue.SimpleQueue()
+        self.subscribers = set()
+        self.pending_keyframes = set()
+        self.train_keys = {}
+        self.names = {}
+        self.published_states = {}
+        self.last_publish = 0.0
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.error = None
+
+    def start(self, timeout: float = START_TIMEOUT):
+        """
+        Starts the event loop of the server in a daemon thread and waits until it listens
+
+        Args:
+            timeout (float, optional): The seconds to wait for the server to listen
+
+        Raises:
+            Exception: The error of the server if it could not listen, for example an OSError if the port is in use
+            TimeoutError: If the server did not listen within the timeout
+        """
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        if not self.ready.wait(timeout):
+            raise TimeoutError(f"The server did not listen within {timeout} seconds")
+        if self.error is not None:
+            self.thread.join()
+            self.loop = None
+            raise self.error
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(
+                    self.handle_client, self.host, self.port, limit=MAX_LINE_LENGTH
+                )
+            )
+            self.port = self.server.sockets[0].getsockname()[1]
+        except Exception as error:
+            self.error = error
+            self.loop.close()
+            return
+        finally:
+            self.ready.set()
+        self.loop.run_forever()
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    async def read_line(self, reader) -> bytes:
+        """
+        Reads the next line of a client. A line longer than MAX_LINE_LENGTH is read to its end and dropped.
+
+        Returns:
+            bytes: The line, b"" once the client closed the connection, None if the line was too long
+        """
+        try:
+            return await reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError as error:
+            return error.partial
+        except asyncio.LimitOverrunError as error:
+            consumed = error.consumed
+        while True:
+            await reader.readexactly(max(consumed, 1))
+            try:
+                await reader.readuntil(b"\n")
+                return None
+            except asyncio.LimitOverrunError as error:
+                consumed = error.consumed
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await self.read_line(reader)
+                if line is None:
+                    self.send(
+                        writer,
+                        FRAME_REPLY,
+                        [{"error": f"Batch longer than {MAX_LINE_LENGTH} bytes"}],
+                    )
+                    continue
+                if not line:
+                    break
+                try:
+                    batch = json.loads(line)
+                except json.JSONDecodeError as error:
+                    self.send(writer, FRAME_REPLY, [{"error": str(error)}])
+                    continue
+                if isinstance(batch, dict):
+                    batch = [batch]
+                if not isinstance(batch, list) or not all(
+                    isinstance(command, dict) for command in batch
+                ):
+                    self.send(
+                        writer,
+                        FRAME_REPLY,
+                        [{"error": "Expected a command object or a list of them"}],
+                    )
+                    continue
+                self.commands.put((writer, batch))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.subscribers.discard(writer)
+            self.pending_keyframes.discard(writer)
+            writer.close()
+
+    def send(self, writer, kind: int, content):
+        """
+        Writes a frame to a client. Must be called from the event loop of the server.
+        """
+        if writer.is_closing():
+            return
+        if kind == FRAME_STATE:
+            payload = content
+        else:
+            payload = json.dumps(content).encode()
+        writer.write(pack_frame(kind, payload))
+
+    def broadcast(self, delta: bytes, keyframe: bytes, names: dict, new_names: bool):
+        """
+        Sends a state frame to every subscriber. Clients that just subscribed or fell behind get a keyframe,
+        clients whose send buffer is full skip the frame and get a keyframe later.
+
+        Args:
+            delta (bytes): The state frame with the trains that changed
+            keyframe (bytes): The state frame with all trains, None if no client was waiting for one
+            names (dict): The train ID of every key, never modified after it was handed over
+            new_names (bool): True if names contains keys that were not sent before
+        """
+        for writer in list(self.subscribers):
+            if writer.is_closing():
+                self.subscribers.discard(writer)
+                continue
+            if writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+                self.pending_keyframes.add(writer)
+                continue
+            if writer in self.pending_keyframes:
+                # Without a keyframe in this publication the client waits for the next one
+                if keyframe is None:
+                    continue
+                self.send(writer, FRAME_NAMES, names)
+                self.send(writer, FRAME_STATE, keyframe)
+                self.pending_keyframes.discard(writer)
+            else:
+                if new_names:
+                    self.send(writer, FRAME_NAMES, names)
+                self.send(writer, FRAME_STATE, delta)
+
+    def apply_commands(self, network, dispatcher=None):
+        """
+        Applies all queued command batches to the network. Called by the simulation loop between steps.
+
+        Args:
+            network (RailNetwork): The network that is controlled
+            dispatcher (Dispatcher, optional): The dispatcher used to inject trains
+        """
+        while True:
+            try:
+                writer, batch = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            results = []
+            for command in batch:
+                # A failing command must not stop the simulation loop that applies it
+                try:
+                    results.append(
+                        self.apply_command(writer, command, network, dispatcher)
+                    )
+                except Exception as error:
+                    results.append({"error": repr(error)})
+            self.loop.call_soon_threadsafe(self.send, writer, FRAME_REPLY, results)
+
+    def apply_command(self, writer, command, network, dispatcher) -> dict:
+        try:
+            name = command["cmd"]
+            if name == "set_switch":
+                node_id = command["node"]
+                node = network.getNode(node_id)
+                if not isinstance(node, SimpleSwitch):
+                    return {"error": f"Node {node_id} is no switch"}
+                if not 0 <= command["state"] < node.getStateCount():
+                    return {"error": f"Switch {node_id} has no state {command['state']}"}
+                if node.isOccupied(SWITCH_CLEARANCE):
+                    return {"error": f"Switch {node_id} is occupied"}
+                network.setSwitchState(node, command["state"])
+                return {"ok": True}
+            if name == "inject_train":
+                if dispatcher is None:
+                    return {"error": "No dispatcher available"}
+                train = dispatcher.dispatch(
+                    Departure(
+                        command["train_id"],
+                        command.get("type", "RegionalTrain"),
+                        command["origin"],
+                        command.get("stops", []),
+                        command.get("departure", 0),
+                    )
+                )
+                return {"ok": True, "train_id": train.id}
+            if name == "subscribe":
+                self.loop.call_soon_threadsafe(self.subscribe, writer)
+                return {"ok": True}
+            if name == "unsubscribe":
+                self.loop.call_soon_threadsafe(self.subscribers.discard, writer)
+                return {"ok": True}
+            return {"error": f"Unknown command {name}"}
+        except (KeyError, IndexError, TypeError, ValueError) as error:
+            return {"error": repr(error)}
+
+    def subscribe(self, writer):
+        self.subscribers.add(writer)
+        self.pending_keyframes.add(writer)
+
+    def publish(self, network, simulated_time: float):
+        """
+        Hands the current train states to the server if the publish interval has passed. Only trains whose state
+        changed since the last publication are part of the delta frame.
+
+        Args:
+            network (RailNetwork): The network whose trains are published
+            simulated_time (float): The current simulated time in seconds
+        """
+        now = time.monotonic()
+        if self.loop is None or now - self.last_publish < 1 / self.publish_rate:
+            return
+        self.last_publish = now
+
+        new_names = False
+        states = {}
+        for train in network.trains:
+            key = self.train_keys.get(train.id)
+            if key is None:
+                key = len(self.train_keys)
+                self.train_keys[train.id] = key
+                new_names = True
+            states[key] = get_train_state(train, network)
+        if new_names:
+            self.names = {key: train_id for train_id, key in self.train_keys.items()}
+
+        changed = [
+            key
+            for key, state in states.items()
+            if self.published_states.get(key) != state
+        ]
+        removed = [key for key in self.published_states if key not in states]
+        self.published_states = states
+
+        # Frames are only packed for clients that receive them
+        if len(self.subscribers) == 0:
+            return
+        delta = self.pack_state(simulated_time, changed, removed, states)
+        keyframe = None
+        if len(self.pending_keyframes) > 0:
+            keyframe = self.pack_state(simulated_time, list(states), [], states)
+        self.loop.call_soon_threadsafe(
+            self.broadcast, delta, keyframe, self.names, new_names
+        )
+
+    def pack_state(
+        self, simulated_time: float, keys: list, removed: list, states: dict
+    ) -> bytes:
+        records = np.zeros(len(keys), dtype=STATE_RECORD)
+        for i, key in enumerate(keys):
+            records[i] = (key,) + states[key]
+        return (
+            STATE_HEADER.pack(simulated_time, len(keys), len(removed))
+            + records.tobytes()
+            + np.array(removed, dtype="<u4").tobytes()
+        )
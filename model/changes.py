@@ -0,0 +1,63 @@
+from enum import Enum
+
+import numpy as np
+
+from model.storage import STORAGE
+
+
+class ChangeKind(Enum):
+    NODE_ADDED = 1
+    NODE_REMOVED = 2
+    TRACK_ADDED = 3
+    TRACK_REMOVED = 4
+    SWITCH_CHANGED = 5
+    VELOCITY_CHANGED = 6
+
+
+class NetworkChange:
+    """
+    A NetworkChange describes one edit of a RailNetwork. Listeners use it to invalidate only the parts of their
+    caches that depend on the changed elements.
+
+    Attributes:
+        kind (ChangeKind): What happened
+        nodes (tuple): The IDs of the nodes that were changed, including the nodes of changed tracks
+        tracks (tuple): The IDs of the tracks that were changed
+        region (tuple): The lower and upper corner of the bounding box of all changed elements
+    """
+
+    def __init__(self, kind: ChangeKind, nodes: tuple = (), tracks: tuple = ()):
+        self.kind = kind
+        self.tracks = tuple(tracks)
+        node_ids = np.unique(
+            np.concatenate(
+                (
+                    np.array(nodes, dtype=np.int64),
+                    STORAGE.endpoints[np.array(self.tracks, dtype=np.int64)].ravel(),
+                )
+            )
+        )
+        self.nodes = tuple(node_ids.tolist())
+        if len(self.nodes) > 0:
+            coordinates = STORAGE.coordinates[node_ids]
+            self.region = (coordinates.min(axis=0), coordinates.max(axis=0))
+        else:
+            self.region = None
+
+    def __repr__(self) -> str:
+        return f"NetworkChange({self.kind.name}, nodes={self.nodes}, tracks={self.tracks})"
+
+    def intersects(self, lower, upper) -> bool:
+        """
+        Checks if the changed region overlaps a rectangle in map coordinates
+
+        Args:
+            lower: The lower corner of the rectangle
+            upper: The upper corner of the rectangle
+        """
+        if self.region is None:
+            return False
+        return bool(
+            np.all(self.region[0] <= np.asarray(upper))
+            and np.all(self.region[1] >= np.asarray(lower))
+        )
@@ -0,0 +1,326 @@
+import threading
+import time
+
+import numpy as np
+
+from model.events import EVENT_BUS
+
+DEFAULT_STEP_RATE = 60
+# Fast-forward steps are limited so that no train moves further per step than at the fastest interactive speed
+MAX_FAST_FORWARD_DISTANCE = 40
+MAX_FAST_FORWARD_STEP = 1.0
+MIN_FAST_FORWARD_STEP = 1 / DEFAULT_STEP_RATE
+PROGRESS_INTERVAL = 0.1
+
+
+class TrainSnapshot:
+    """
+    A TrainSnapshot is the immutable state of a train at one simulation step. It offers the parts of the Train
+    interface that are needed to draw it.
+
+    Attributes:
+        id (str): The ID of the train
+        position (np.ndarray): The position of the head of the train
+        direction (np.ndarray): The direction the train is heading in
+        velocity (float): The velocity of the train
+    """
+
+    __slots__ = ("id", "position", "direction", "velocity")
+
+    def __init__(self, id: str, position, direction, velocity: float):
+        self.id = id
+        self.position = position
+        self.direction = direction
+        self.velocity = velocity
+
+    def getTrainDirection(self) -> np.ndarray:
+        return self.direction
+
+
+class Snapshot:
+    """
+    A Snapshot is the published state of the whole simulation after a step.
+
+    Attributes:
+        simulated_time (float): The simulated time of the step in seconds
+        wall_time (float): The monotonic time at which the snapshot was published
+        trains (dict): The TrainSnapshot of every train, by train ID
+    """
+
+    def __init__(self, simulated_time: float, wall_time: float, trains: dict):
+        self.simulated_time = simulated_time
+        self.wall_time = wall_time
+        self.trains = trains
+
+    def fromNetwork(network, simulated_time: float):
+        """
+        Captures the state of all trains of a network
+
+        Args:
+            network (RailNetwork): The network whose trains are captured
+            simulated_time (float): The current simulated time
+
+        Returns:
+            Snapshot: The new snapshot
+        """
+        trains = {}
+        for train in network.trains:
+            trains[train.id] = TrainSnapshot(
+                train.id,
+                np.array(train.position, dtype=float),
+                train.getTrainDirection(),
+                train.velocity,
+            )
+        return Snapshot(simulated_time, time.monotonic(), trains)
+
+
+class SnapshotBuffer:
+    """
+    The SnapshotBuffer passes snapshots from the simulation thread to the render thread. It keeps the two newest
+    complete snapshots, so the renderer can interpolate between them while the next one is being built.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.previous = None
+        self.latest = None
+
+    def publish(self, snapshot: Snapshot):
+        with self.lock:
+            self.previous = self.latest
+            self.latest = snapshot
+
+    def read(self) -> tuple:
+        with self.lock:
+            return self.previous, self.latest
+
+    def getInterpolated(self, delay: float = 0) -> list:
+        """
+        Returns the trains at the given delay before now, interpolated between the two newest snapshots. Rendering
+        one step interval in the past keeps the interpolation between two known states.
+
+        Args:
+            delay (float, optional): How far behind the current wall time the trains are shown. Defaults to 0.
+
+        Returns:
+            list: The TrainSnapshots to draw
+        """
+        previous, latest = self.read()
+        if latest is None:
+            return []
+        if previous is None or latest.wall_time <= previous.wall_time:
+            return list(latest.trains.values())
+
+        alpha = (time.monotonic() - delay - previous.wall_time) / (
+            latest.wall_time - previous.wall_time
+        )
+        alpha = min(max(alpha, 0), 1)
+        trains = []
+        for train_id, train in latest.trains.items():
+            previous_train = previous.trains.get(train_id)
+            if previous_train is None:
+                trains.append(train)
+                continue
+            trains.append(
+                TrainSnapshot(
+                    train_id,
+                    previous_train.position
+                    + (train.position - previous_train.position) * alpha,
+                    train.direction,
+                    previous_train.velocity
+                    + (train.velocity - previous_train.velocity) * alpha,
+                )
+            )
+        return trains
+
+
+class SimulationEngine:
+    """
+    The SimulationEngine steps the network on its own thread at a fixed rate and publishes a snapshot after every
+    step. Other threads that change the network have to hold the lock of the engine while doing so.
+
+    Attributes:
+        network (RailNetwork): The network that is simulated
+        dispatcher (Dispatcher): Injects and retires the trains of the timetable, optional
+        server (ControlServer): Applies external commands and receives the train states, optional
+        exporter (SharedStateWriter): Receives the state of every step for out-of-process viewers, optional
+        statistics (OperationsStatistics): Keeps the running operations statistics, optional
+        integrator (AdaptiveIntegrator): Drives the trains with adaptive substeps instead of one step each, optional
+        step_rate (float): The number of steps per second of wall time
+        global_speed (float): The number of simulated seconds per second of wall time
+        simulated_time (float): The current simulated time in seconds
+        buffer (SnapshotBuffer): The buffer the snapshots are published to
+        lock (threading.RLock): Held during every step
+    """
+
+    def __init__(
+        self,
+        network,
+        dispatcher=None,
+        server=None,
+        step_rate: float = DEFAULT_STEP_RATE,
+        global_speed: float = 1,
+        simulated_time: float = 0.0,
+        exporter=None,
+        statistics=None,
+        integrator=None,
+    ):
+        self.network = network
+        self.dispatcher = dispatcher
+        self.server = server
+        self.exporter = exporter
+        self.statistics = statistics
+        self.integrator = integrator
+        if statistics is not None:
+            statistics.setTime(simulated_time)
+            statistics.attach()
+        self.step_rate = step_rate
+        self.global_speed = global_speed
+        self.simulated_time = simulated_time
+        self.buffer = SnapshotBuffer()
+        self.lock = threading.RLock()
+        self.running = False
+        self.thread = None
+
+    def step(self, fps: float = None):
+        """
+        Advances the simulation by one step of global_speed / fps simulated seconds
+
+        Args:
+            fps (float, optional): The step rate the step length is derived from. Defaults to step_rate.
+        """
+        if fps is None:
+            fps = self.step_rate
+        with self.lock:
+            if self.server is not None:
+                self.server.apply_commands(self.network, self.dispatcher)
+            self.advance(fps)
+            self.publish()
+
+    def advance(self, fps: float) -> list:
+        """
+        Moves the simulated time and the trains forward by global_speed / fps simulated seconds
+
+        Returns:
+            list: The trains that arrived
+        """
+        self.simulated_time += self.global_speed / fps
+        EVENT_BUS.time = self.simulated_time
+        if self.statistics is not None:
+            self.statistics.setTime(self.simulated_time)
+        if self.dispatcher is not None:
+            self.dispatcher.update(self.simulated_time)
+        arrived = self.network.driveTrains(
+            fps, global_speed=self.global_speed, integrator=self.integrator
+        )
+        EVENT_BUS.flush()
+        if self.dispatcher is not None:
+            self.dispatcher.retire(arrived)
+        return arrived
+
+    def publish(self):
+        """
+        Hands the current state to the server, the exporter and the snapshot buffer
+        """
+        if self.server is not None:
+            self.server.publish(self.network, self.simulated_time)
+        if self.exporter is not None:
+            self.exporter.write(self.network, self.simulated_time)
+        self.buffer.publish(Snapshot.fromNetwork(self.network, self.simulated_time))
+
+    def getFastForwardStep(self, target_time: float) -> float:
+        """
+        Returns the largest simulated step that keeps fast-forwarding correct: no train may move further than
+        MAX_FAST_FORWARD_DISTANCE, and neither the next departure nor the target time may be skipped. With an
+        integrator, the trains are substepped anyway and only the departures and the target time limit the step.
+
+        Args:
+            target_time (float): The simulated time to stop at
+
+        Returns:
+            float: The length of the next step in simulated seconds
+        """
+        step = MAX_FAST_FORWARD_STEP
+        trains = self.network.trains if self.integrator is None else []
+        for train in trains:
+            if train.getHasArrived():
+                continue
+            # The velocity can grow during the step, so the bound uses the highest velocity reachable within it
+            velocity = min(
+                train.max_velocity, train.velocity + train.max_acceleration * step
+            )
+            if velocity > 0:
+                step = min(step, MAX_FAST_FORWARD_DISTANCE / velocity)
+        step = max(step, MIN_FAST_FORWARD_STEP)
+        if self.dispatcher is not None:
+            next_departure = self.dispatcher.getNextDepartureTime()
+            if next_departure is not None and next_departure > self.simulated_time:
+                step = min(step, next_departure - self.simulated_time)
+        return min(step, target_time - self.simulated_time)
+
+    def fastForward(
+        self, target_time: float, until=None, progress=None, cancelled=None
+    ) -> bool:
+        """
+        Steps the simulation as fast as possible without publishing the intermediate states. Must not be called
+        while the engine steps on its own thread.
+
+        Args:
+            target_time (float): The simulated time to stop at
+            until (optional): Called with the arrived trains after every step, fast-forwarding stops when it
+                returns True
+            progress (optional): Called with the reached fraction of the time span every PROGRESS_INTERVAL
+                seconds of wall time
+            cancelled (optional): Polled every PROGRESS_INTERVAL seconds of wall time, fast-forwarding stops
+                when it returns True
+
+        Returns:
+            bool: False if fast-forwarding was cancelled
+        """
+        start_time = self.simulated_time
+        next_poll = time.monotonic() + PROGRESS_INTERVAL
+        completed = True
+        with self.lock:
+            while self.simulated_time < target_time:
+                step = self.getFastForwardStep(target_time)
+                arrived = self.advance(self.global_speed / step)
+                if until is not None and until(arrived):
+                    break
+                if time.monotonic() >= next_poll:
+                    next_poll = time.monotonic() + PROGRESS_INTERVAL
+                    if progress is not None:
+                        progress(
+                            (self.simulated_time - start_time)
+                            / (target_time - start_time)
+                        )
+                    if cancelled is not None and cancelled():
+                        completed = False
+                        break
+            self.publish()
+        return completed
+
+    def run(self):
+        interval = 1 / self.step_rate
+        next_step = time.monotonic()
+        while self.running:
+            self.step()
+            next_step += interval
+            delay = next_step - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_step = time.monotonic()
+
+    def start(self):
+        """
+        Starts stepping on a daemon thread
+        """
+        self.running = True
+        self.buffer.publish(Snapshot.fromNetwork(self.network, self.simulated_time))
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
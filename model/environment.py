@@ -34,7 +34,7 @@ class Map:
         if self.network is None:
             self.network = RailNetwork()
             if drawer_mode:
-                self.network.nodes.append(Node("0:0000-0000", (0, 0)))
+                self.network.addNode(Node((0, 0)))
         return self.network
 
     def render(
@@ -43,12 +43,16 @@ class Map:
         view,
         dark_theme: bool = False,
         aa_mode: bool = True,
+        trains: list = None,
+        hover: bool = None,
     ):
         """
         Draws the tracks on a surface using pygame
 
         Args:
             surface (pygame.Surface): The surface to draw on
+            trains (list, optional): The trains or train snapshots to draw. Defaults to the trains of the network.
+            hover (bool, optional): Draws all nodes as hovered or not. Defaults to checking the mouse position.
         """
         surface.fill(BACKGROUND_LIGHT)
         for track in self.getRailNetwork().tracks:
@@ -56,6 +60,8 @@ class Map:
         for ramp in self.getRailNetwork().ramps:
             TrackModel(ramp).draw(surface, view)
         for node in self.getRailNetwork().nodes:
-            NodeModel(node).draw(surface, view)
-        for train in self.getRailNetwork().trains:
+            NodeModel(node).draw(surface, view, hover)
+        if trains is None:
+            trains = self.getRailNetwork().trains
+        for train in trains:
             TrainModel(train).draw(surface, view)
@@ -0,0 +1,401 @@
+"""
+Golden-trajectory equivalence harness
+
+Runs the standard scenarios through the reference engine, which steps every train with Train.drive in one process,
+and through alternative engines. The trajectories are compared sample by sample and every alternative is reported
+with its speedup and its divergence from the reference. A change to the stepping code should only be merged if
+every registered engine stays within the tolerances.
+
+The speedup compares the wall time of whole runs, including starting and closing the engine, so a value below 1 means
+the engine is slower than the reference for that scenario. A run in which no train could be compared fails, so that
+an engine cannot pass by doing nothing.
+
+Usage: python -m model.equivalence [engine name ...]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from model.engine import SimulationEngine
+from model.network import RailNetwork
+from model.parallel import RegionalEngine
+from model.scenarios import STANDARD_SCENARIOS
+from model.storage import STORAGE
+from model.timetable import Dispatcher
+
+DEFAULT_SAMPLE_INTERVAL = 0.5
+DEFAULT_REGION_COUNT = 2
+
+
+class Tolerances:
+    """
+    The largest divergences from the reference that are accepted
+
+    Attributes:
+        position (float): The distance between the positions of a train in meters
+        velocity (float): The difference of the velocities of a train in m/s
+        arrival (float): The difference of the times a train reached a node of its route in seconds
+    """
+
+    def __init__(
+        self, position: float = 1.0, velocity: float = 0.5, arrival: float = 1.0
+    ):
+        self.position = position
+        self.velocity = velocity
+        self.arrival = arrival
+
+
+class ReferenceEngine:
+    """
+    The reference: a SimulationEngine that is advanced without publishing
+    """
+
+    def __init__(self, network, dispatcher, scenario):
+        self.engine = SimulationEngine(
+            network,
+            dispatcher,
+            step_rate=scenario.step_rate,
+            global_speed=scenario.global_speed,
+        )
+
+    def step(self) -> list:
+        return [train.id for train in self.engine.advance(self.engine.step_rate)]
+
+    def getTrains(self) -> list:
+        return self.engine.network.trains
+
+    def close(self):
+        pass
+
+
+class RegionalAdapter:
+    """
+    Runs the RegionalEngine with DEFAULT_REGION_COUNT worker processes
+    """
+
+    def __init__(self, network, dispatcher, scenario):
+        self.engine = RegionalEngine(
+            network,
+            DEFAULT_REGION_COUNT,
+            dispatcher,
+            global_speed=scenario.global_speed,
+            step_rate=scenario.step_rate,
+        )
+
+    def step(self) -> list:
+        return self.engine.step()
+
+    def getTrains(self) -> list:
+        return self.engine.collectTrains()
+
+    def close(self):
+        self.engine.close()
+
+
+# The engines that are compared with the reference, by name. An engine is created with the network, the dispatcher
+# and the scenario and offers step(), which returns the IDs of the trains that arrived, getTrains() and close().
+ENGINES = {"regional": RegionalAdapter}
+
+
+def registerEngine(name: str, factory):
+    """
+    Adds an alternative engine to the harness
+
+    Args:
+        name (str): The name the engine is reported and selected by
+        factory: Called with the network, the dispatcher and the scenario, returns the engine
+    """
+    ENGINES[name] = factory
+
+
+class Trajectory:
+    """
+    The recorded run of one engine through a scenario
+
+    Attributes:
+        samples (list): The (time, {train ID: (position, velocity)}) samples
+        arrivals (dict): The time every train reached every index of its route, by (train ID, index). Nodes between
+            samples are recorded at the next sample, the end of the route at the exact step.
+        seconds (float): The wall time spent starting, stepping and closing the engine, without the recording
+    """
+
+    def __init__(self):
+        self.samples = []
+        self.arrivals = {}
+        self.seconds = 0.0
+        self.cursors = {}
+        self.route_lengths = {}
+
+    def record(self, simulated_time: float, trains: list):
+        states = {}
+        for train in trains:
+            states[train.id] = (
+                np.array(train.position, dtype=float),
+                float(train.velocity),
+            )
+            first_index = self.cursors.get(train.id, -1) + 1
+            for index in range(first_index, train.cursor + 1):
+                self.arrivals[(train.id, index)] = simulated_time
+            self.cursors[train.id] = train.cursor
+            self.route_lengths[train.id] = len(train.route)
+        self.samples.append((simulated_time, states))
+
+    def recordArrivals(self, simulated_time: float, train_ids: list):
+        """
+        Records the end of the route of trains that arrived, they may already be retired at the next sample
+        """
+        for train_id in train_ids:
+            route_length = self.route_lengths.get(train_id)
+            if route_length is not None:
+                self.arrivals.setdefault((train_id, route_length - 1), simulated_time)
+
+
+def checkDepartures(network, departures: list, scenario):
+    """
+    Makes sure that the departures of a scenario run on the network it built
+
+    Raises:
+        ValueError: If a departure uses a node that is not part of the network
+    """
+    if len(departures) == 0:
+        raise ValueError(f"Scenario {scenario.name} has no departures")
+    for departure in departures:
+        for node_id in [departure.origin] + list(departure.stops):
+            if not network.hasNode(node_id):
+                raise ValueError(
+                    f"Train {departure.train_id} of scenario {scenario.name} uses the "
+                    f"node {node_id}, which is not part of its network"
+                )
+
+
+def resetNetwork(network, switch_states: np.ndarray):
+    """
+    Removes all trains and their occupancies and restores the switch states of the start of the scenario
+    """
+    network.trains = []
+    for track in network.tracks + network.ramps:
+        STORAGE.occupancies.pop(track.id, None)
+    STORAGE.switch_states[: len(switch_states)] = switch_states
+
+
+def runScenario(
+    scenario,
+    network,
+    departures: list,
+    switch_settings: list,
+    factory,
+    sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+) -> Trajectory:
+    """
+    Runs a scenario with one engine and records its trajectory
+
+    Args:
+        scenario (Scenario): The scenario
+        network (RailNetwork): The network of the scenario, reset before the run
+        departures (list): The departures of the scenario
+        switch_settings (list): The (time, node ID, state) switch settings of the scenario
+        factory: Creates the engine
+        sample_interval (float, optional): The simulated seconds between two samples
+
+    Returns:
+        Trajectory: The recorded run
+    """
+    dispatcher = Dispatcher(network, list(departures))
+    for setting in switch_settings:
+        dispatcher.addSwitchSetting(*setting)
+    trajectory = Trajectory()
+    start = time.perf_counter()
+    engine = factory(network, dispatcher, scenario)
+    trajectory.seconds += time.perf_counter() - start
+    step_length = scenario.global_speed / scenario.step_rate
+    sample_steps = max(int(round(sample_interval / step_length)), 1)
+    try:
+        for step in range(1, scenario.getStepCount() + 1):
+            start = time.perf_counter()
+            arrived = engine.step()
+            trajectory.seconds += time.perf_counter() - start
+            simulated_time = step * step_length
+            trajectory.recordArrivals(simulated_time, arrived)
+            if step % sample_steps == 0:
+                trajectory.record(simulated_time, engine.getTrains())
+    finally:
+        start = time.perf_counter()
+        engine.close()
+        trajectory.seconds += time.perf_counter() - start
+    return trajectory
+
+
+class EquivalenceReport:
+    """
+    The divergence and the speedup of an engine in a scenario
+
+    Attributes:
+        scenario (str): The name of the scenario
+        engine (str): The name of the engine
+        speedup (float): The wall time of the reference divided by that of the engine, below 1 if it is slower
+        compared_samples (int): The number of train positions that were compared
+        max_position_error (float): The largest distance between the positions of a train in meters
+        mean_position_error (float): The mean distance over all compared samples in meters
+        max_velocity_error (float): The largest difference of the velocities of a train in m/s
+        max_arrival_error (float): The largest difference of the times a node was reached in seconds
+        missing_samples (int): How often a train existed in only one of the two runs
+        missing_arrivals (int): How many nodes were reached in only one of the two runs
+        passed (bool): True if every divergence is within the tolerances
+    """
+
+    def __init__(self, scenario: str, engine: str):
+        self.scenario = scenario
+        self.engine = engine
+        self.speedup = 0.0
+        self.compared_samples = 0
+        self.max_position_error = 0.0
+        self.mean_position_error = 0.0
+        self.max_velocity_error = 0.0
+        self.max_arrival_error = 0.0
+        self.missing_samples = 0
+        self.missing_arrivals = 0
+        self.passed = False
+
+    def __str__(self) -> str:
+        return (
+            f"{self.scenario:<10} {self.engine:<12} {'ok' if self.passed else 'FAILED':<7}"
+            f"{self.speedup:8.2f}x {self.max_position_error:10.4f} m {self.mean_position_error:10.4f} m "
+            f"{self.max_velocity_error:9.4f} m/s {self.max_arrival_error:8.3f} s "
+            f"{self.missing_samples:6d} {self.missing_arrivals:6d} {self.compared_samples:8d}"
+        )
+
+
+REPORT_HEADER = (
+    f"{'scenario':<10} {'engine':<12} {'result':<7}{'speedup':>9} {'max pos.':>12} {'mean pos.':>12} "
+    f"{'max vel.':>13} {'arrival':>10} {'trains':>6} {'nodes':>6} {'compared':>8}"
+)
+
+
+def compareTrajectories(
+    reference: Trajectory,
+    trajectory: Trajectory,
+    tolerances: Tolerances,
+    report: EquivalenceReport,
+) -> EquivalenceReport:
+    """
+    Fills a report with the divergence of a trajectory from the reference
+    """
+    position_errors = []
+    for (_, expected), (_, actual) in zip(reference.samples, trajectory.samples):
+        train_ids = expected.keys() & actual.keys()
+        report.missing_samples += len(expected.keys() ^ actual.keys())
+        report.compared_samples += len(train_ids)
+        for train_id in train_ids:
+            position_errors.append(
+                np.linalg.norm(expected[train_id][0] - actual[train_id][0])
+            )
+            report.max_velocity_error = max(
+                report.max_velocity_error,
+                abs(expected[train_id][1] - actual[train_id][1]),
+            )
+    report.missing_samples += abs(len(reference.samples) - len(trajectory.samples))
+    if len(position_errors) > 0:
+        report.max_position_error = float(np.max(position_errors))
+        report.mean_position_error = float(np.mean(position_errors))
+
+    keys = reference.arrivals.keys() & trajectory.arrivals.keys()
+    report.missing_arrivals = len(
+        reference.arrivals.keys() ^ trajectory.arrivals.keys()
+    )
+    for key in keys:
+        report.max_arrival_error = max(
+            report.max_arrival_error,
+            abs(reference.arrivals[key] - trajectory.arrivals[key]),
+        )
+
+    if trajectory.seconds > 0:
+        report.speedup = reference.seconds / trajectory.seconds
+    report.passed = (
+        report.max_position_error <= tolerances.position
+        and report.max_velocity_error <= tolerances.velocity
+        and report.max_arrival_error <= tolerances.arrival
+        and report.missing_samples == 0
+        and report.missing_arrivals == 0
+        and report.compared_samples > 0
+    )
+    return report
+
+
+def checkEquivalence(
+    engines: list = None,
+    scenarios: list = None,
+    tolerances: Tolerances = None,
+    sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+) -> list:
+    """
+    Runs every scenario through the reference and the given engines and compares the trajectories
+
+    Args:
+        engines (list, optional): The names of the engines to check. Defaults to all registered engines.
+        scenarios (list, optional): The scenarios to run. Defaults to STANDARD_SCENARIOS.
+        tolerances (Tolerances, optional): The accepted divergences. Defaults to Tolerances().
+        sample_interval (float, optional): The simulated seconds between two compared samples
+
+    Returns:
+        list: An EquivalenceReport for every engine in every scenario
+    """
+    if engines is None:
+        engines = list(ENGINES)
+    if scenarios is None:
+        scenarios = STANDARD_SCENARIOS
+    if tolerances is None:
+        tolerances = Tolerances()
+    reports = []
+    for scenario in scenarios:
+        network = RailNetwork()
+        departures, switch_settings = scenario.build(network)
+        checkDepartures(network, departures, scenario)
+        switch_states = STORAGE.switch_states.copy()
+        resetNetwork(network, switch_states)
+        reference = runScenario(
+            scenario,
+            network,
+            departures,
+            switch_settings,
+            ReferenceEngine,
+            sample_interval,
+        )
+        for name in engines:
+            resetNetwork(network, switch_states)
+            trajectory = runScenario(
+                scenario,
+                network,
+                departures,
+                switch_settings,
+                ENGINES[name],
+                sample_interval,
+            )
+            reports.append(
+                compareTrajectories(
+                    reference,
+                    trajectory,
+                    tolerances,
+                    EquivalenceReport(scenario.name, name),
+                )
+            )
+        resetNetwork(network, switch_states)
+    return reports
+
+
+def main(engines: list) -> int:
+    for name in engines:
+        if name not in ENGINES:
+            print(f"Unknown engine {name}, registered engines: {', '.join(ENGINES)}")
+            return 2
+    print(REPORT_HEADER)
+    passed = True
+    for report in checkEquivalence(engines if len(engines) > 0 else None):
+        print(report)
+        passed = passed and report.passed
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,228 @@
+"""
+Train lifecycle events
+
+Trains emit events into the global EVENT_BUS while they are driven. The events are collected during a simulation step
+and delivered to the subscribers in one batch per subscriber when the engine flushes the bus after the step. Events
+of types without subscribers are not even created, so the cost depends on what is observed and what happened, not
+on the number of trains.
+"""
+
+
+class TrainEvent:
+    """
+    The base of all events of a train.
+
+    Attributes:
+        time (float): The simulated time of the step in which the event happened
+        train (Train): The train the event belongs to
+    """
+
+    __slots__ = ("time", "train")
+
+    def __init__(self, time: float, train):
+        self.time = time
+        self.train = train
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.train.id} at {self.time:.2f})"
+
+
+class NodeReached(TrainEvent):
+    """
+    The head of a train reached a node of its route.
+
+    Attributes:
+        node (Node): The node that was reached
+        previous_node (Node): The node the train came from
+    """
+
+    __slots__ = ("node", "previous_node")
+
+    def __init__(self, time: float, train, node, previous_node):
+        super().__init__(time, train)
+        self.node = node
+        self.previous_node = previous_node
+
+
+class TrackEntered(TrainEvent):
+    """
+    The head of a train entered a track.
+
+    Attributes:
+        track (Track): The track that was entered
+        previous_track (Track): The track the head was on before, None at the start of a route
+    """
+
+    __slots__ = ("track", "previous_track")
+
+    def __init__(self, time: float, train, track, previous_track):
+        super().__init__(time, train)
+        self.track = track
+        self.previous_track = previous_track
+
+
+class TrackCleared(TrainEvent):
+    """
+    The tail of a train cleared a track, so no part of the train is on it anymore.
+
+    Attributes:
+        track (Track): The track that was cleared
+    """
+
+    __slots__ = ("track",)
+
+    def __init__(self, time: float, train, track):
+        super().__init__(time, train)
+        self.track = track
+
+
+class SwitchBlocked(TrainEvent):
+    """
+    A train stopped in front of a switch that does not lead to the next node of its route.
+
+    Attributes:
+        switch (SimpleSwitch): The switch
+        previous_track (Track): The track the train stands on
+    """
+
+    __slots__ = ("switch", "previous_track")
+
+    def __init__(self, time: float, train, switch, previous_track):
+        super().__init__(time, train)
+        self.switch = switch
+        self.previous_track = previous_track
+
+
+class RouteCompleted(TrainEvent):
+    """
+    A train reached the last node of its route.
+
+    Attributes:
+        node (Node): The last node of the route
+        previous_track (Track): The last track of the route
+    """
+
+    __slots__ = ("node", "previous_track")
+
+    def __init__(self, time: float, train, node, previous_track):
+        super().__init__(time, train)
+        self.node = node
+        self.previous_track = previous_track
+
+
+class VelocityLimitChanged(TrainEvent):
+    """
+    The velocity limit of a train changed because its head entered a track with a different maximum velocity.
+
+    Attributes:
+        velocity_limit (float): The new limit in m/s, 0 while the train is blocked
+        previous_velocity_limit (float): The limit before
+    """
+
+    __slots__ = ("velocity_limit", "previous_velocity_limit")
+
+    def __init__(self, time: float, train, velocity_limit, previous_velocity_limit):
+        super().__init__(time, train)
+        self.velocity_limit = velocity_limit
+        self.previous_velocity_limit = previous_velocity_limit
+
+
+class Subscription:
+    """
+    A Subscription delivers the events of some types that pass a filter to a callback.
+
+    Attributes:
+        callback: Called with the list of matching events of a step, in the order they happened
+        event_types (tuple): The event classes that are delivered
+        filter: Called with every event of these types, only events for which it returns True are delivered, optional
+    """
+
+    def __init__(self, callback, event_types: tuple, filter=None):
+        self.callback = callback
+        self.event_types = event_types
+        self.filter = filter
+        self.batch = []
+
+
+class EventBus:
+    """
+    The EventBus collects the events of a step and hands them to the subscribers in batches.
+
+    Attributes:
+        time (float): The simulated time that is given to new events, set by the engine before every step
+        subscriptions (dict): The subscriptions of every event class
+        pending (list): The events of the current step
+    """
+
+    def __init__(self):
+        self.time = 0.0
+        self.subscriptions = {}
+        self.pending = []
+
+    def subscribe(self, callback, event_types: tuple = None, filter=None) -> Subscription:
+        """
+        Registers a callback for events
+
+        Args:
+            callback: Called with the list of matching events after every step in which any occurred
+            event_types (tuple, optional): The event classes to receive. Defaults to all train events.
+            filter (optional): Called with every event, only events for which it returns True are delivered
+
+        Returns:
+            Subscription: The subscription, needed to unsubscribe
+        """
+        if event_types is None:
+            event_types = EVENT_TYPES
+        subscription = Subscription(callback, tuple(event_types), filter)
+        for event_type in subscription.event_types:
+            self.subscriptions.setdefault(event_type, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for event_type in subscription.event_types:
+            subscriptions = self.subscriptions.get(event_type, [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+            if len(subscriptions) == 0:
+                self.subscriptions.pop(event_type, None)
+
+    def wants(self, event_type: type) -> bool:
+        """
+        Checks if anybody subscribed to an event class, so that unobserved events need not be created
+        """
+        return event_type in self.subscriptions
+
+    def emit(self, event: TrainEvent):
+        self.pending.append(event)
+
+    def flush(self):
+        """
+        Delivers the events of the step to the subscribers
+        """
+        if len(self.pending) == 0:
+            return
+        pending = self.pending
+        self.pending = []
+        receivers = []
+        for event in pending:
+            for subscription in self.subscriptions.get(type(event), ()):
+                if subscription.filter is None or subscription.filter(event):
+                    if len(subscription.batch) == 0:
+                        receivers.append(subscription)
+                    subscription.batch.append(event)
+        for subscription in receivers:
+            batch = subscription.batch
+            subscription.batch = []
+            subscription.callback(batch)
+
+
+EVENT_TYPES = (
+    NodeReached,
+    TrackEntered,
+    TrackCleared,
+    SwitchBlocked,
+    RouteCompleted,
+    VelocityLimitChanged,
+)
+
+EVENT_BUS = EventBus()
@@ -0,0 +1,426 @@
+"""
+Streaming import of infrastructure data
+
+Supported files:
+    CSV with one track segment per row and the columns from_x, from_y, to_x, to_y and optionally max_velocity in km/h
+    GeoJSON FeatureCollections with LineString and MultiLineString features, optionally with a maxspeed property
+    in km/h. Every pair of consecutive points of a line becomes a segment.
+
+Files are read in chunks of CHUNK_SIZE bytes, so neither the raw file nor an adjacency matrix is held in memory.
+A GeoJSON feature that cannot be decoded, or is longer than MAX_FEATURE_SIZE characters, is counted as skipped.
+Points closer than the tolerance are merged into one node through a hash grid with cells of the tolerance's size.
+Only the merged coordinates and a compact list of segments are kept until all segments are known, then nodes with
+three or four tracks become SimpleSwitches and everything is inserted into the network in bulk.
+"""
+
+import codecs
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+from model.nodes import Node
+from model.nodes import SimpleSwitch
+from model.storage import grow
+from model.tracks import Track
+
+CHUNK_SIZE = 1 << 20
+MAX_FEATURE_SIZE = 1 << 24
+DEFAULT_TOLERANCE = 1.0
+DEFAULT_MAX_VELOCITY = 50
+
+
+class ImportProgress:
+    """
+    The progress of an import, handed to the progress callback after every chunk and returned at the end.
+
+    Attributes:
+        bytes_read (int): How many bytes of the file have been read
+        total_bytes (int): The size of the file
+        segments (int): How many segments have been read
+        nodes (int): How many nodes remain after merging
+        merged_points (int): How many points were merged into an existing node
+        duplicate_segments (int): How many segments were dropped because their nodes were already connected
+        skipped (int): How many rows or features could not be read
+        elapsed (float): The seconds since the import started
+    """
+
+    def __init__(self, total_bytes: int):
+        self.bytes_read = 0
+        self.total_bytes = total_bytes
+        self.segments = 0
+        self.nodes = 0
+        self.merged_points = 0
+        self.duplicate_segments = 0
+        self.skipped = 0
+        self.elapsed = 0.0
+
+    def getFraction(self) -> float:
+        if self.total_bytes == 0:
+            return 1.0
+        return self.bytes_read / self.total_bytes
+
+    def getThroughput(self) -> float:
+        """
+        Returns the number of segments read per second
+        """
+        if self.elapsed == 0:
+            return 0.0
+        return self.segments / self.elapsed
+
+    def __str__(self) -> str:
+        return (
+            f"{self.getFraction() * 100:5.1f}% {self.segments} segments, {self.nodes} nodes, "
+            f"{self.getThroughput():.0f} segments/s"
+        )
+
+
+class NodeMerger:
+    """
+    Assigns node indices to points and merges points that are closer than the tolerance
+
+    Attributes:
+        tolerance (float): The distance up to which points are merged
+        coordinates (np.ndarray): The coordinates of every merged node
+        cells (dict): The indices of the nodes in every grid cell
+    """
+
+    def __init__(self, tolerance: float):
+        self.tolerance = tolerance
+        self.coordinates = np.zeros((1024, 2))
+        self.count = 0
+        self.cells = {}
+
+    def getIndex(self, x: float, y: float) -> tuple:
+        """
+        Returns the index of the node at a point, creating the node if there is none within the tolerance
+
+        Returns:
+            tuple: The index and True if the point was merged into an existing node
+        """
+        cell_x = int(x // self.tolerance)
+        cell_y = int(y // self.tolerance)
+        for neighbour_x in (cell_x - 1, cell_x, cell_x + 1):
+            for neighbour_y in (cell_y - 1, cell_y, cell_y + 1):
+                for index in self.cells.get((neighbour_x, neighbour_y), ()):
+                    node_x, node_y = self.coordinates[index]
+                    if (node_x - x) ** 2 + (node_y - y) ** 2 <= self.tolerance**2:
+                        return index, True
+        index = self.count
+        self.coordinates = grow(self.coordinates, index + 1)
+        self.coordinates[index] = (x, y)
+        self.count += 1
+        self.cells.setdefault((cell_x, cell_y), []).append(index)
+        return index, False
+
+
+class FeatureSkipper:
+    """
+    Finds the end of a GeoJSON feature that could not be decoded, possibly across several chunks
+
+    Attributes:
+        depth (int): How many objects and arrays of the feature are open
+        in_string (bool): True inside a string
+        escaped (bool): True if the previous character in a string was a backslash
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def skip(self, text: str, position: int) -> int:
+        """
+        Scans the text for the next top-level "," or "}" that ends the feature
+
+        Returns:
+            int: The position after the feature, -1 if the feature continues after the text
+        """
+        for i in range(position, len(text)):
+            character = text[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif character == "\\":
+                    self.escaped = True
+                elif character == '"':
+                    self.in_string = False
+            elif character == '"':
+                self.in_string = True
+            elif character in "{[":
+                self.depth += 1
+            elif character in "}]":
+                self.depth -= 1
+                if self.depth < 0 and character == "]":
+                    # The end of the features array
+                    return i
+                if self.depth <= 0:
+                    return i + 1
+            elif character == "," and self.depth == 0:
+                return i
+        return -1
+
+
+class NetworkImporter:
+    """
+    Reads segments from files and inserts them into a RailNetwork
+
+    Attributes:
+        network (RailNetwork): The network the segments are added to
+        merger (NodeMerger): Merges the end points of the segments into nodes
+        endpoints (np.ndarray): The node indices of every kept segment
+        max_velocities (np.ndarray): The maximum velocity of every kept segment in m/s
+        transform: Called with (x, y) of every point to project it into map coordinates, optional
+        progress: Called with the ImportProgress after every chunk, optional
+    """
+
+    def __init__(
+        self,
+        network,
+        tolerance: float = DEFAULT_TOLERANCE,
+        default_max_velocity: float = DEFAULT_MAX_VELOCITY,
+        transform=None,
+        progress=None,
+    ):
+        self.network = network
+        self.merger = NodeMerger(tolerance)
+        self.default_max_velocity = default_max_velocity
+        self.transform = transform
+        self.progress = progress
+        self.endpoints = np.zeros((1024, 2), dtype=np.int32)
+        self.max_velocities = np.zeros(1024)
+        self.segment_count = 0
+        self.connected = set()
+        self.report = None
+        self.start = None
+
+    def importFile(self, path: str) -> ImportProgress:
+        """
+        Imports a CSV or GeoJSON file, chosen by its extension
+
+        Args:
+            path (str): The path of the file
+
+        Returns:
+            ImportProgress: The final counts and the throughput of the import
+        """
+        self.report = ImportProgress(os.path.getsize(path))
+        self.start = time.monotonic()
+        if path.lower().endswith((".geojson", ".json")):
+            self.readGeoJSON(path)
+        else:
+            self.readCSV(path)
+        self.insert()
+        self.updateReport()
+        return self.report
+
+    def updateReport(self):
+        self.report.nodes = self.merger.count
+        self.report.elapsed = time.monotonic() - self.start
+        if self.progress is not None:
+            self.progress(self.report)
+
+    def readChunks(self, path: str):
+        """
+        Yields the decoded text of the file in chunks of at most CHUNK_SIZE bytes, regardless of line breaks. A
+        character split between two chunks is kept by the decoder until the next chunk.
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        with open(path, "rb") as file:
+            while True:
+                chunk = file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.report.bytes_read += len(chunk)
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+
+    def readLines(self, path: str):
+        """
+        Yields lists of the complete lines in every chunk of the file
+        """
+        remainder = ""
+        for chunk in self.readChunks(path):
+            chunk = remainder + chunk
+            end = max(chunk.rfind("\n"), chunk.rfind("\r")) + 1
+            remainder = chunk[end:]
+            if end > 0:
+                yield chunk[:end].splitlines()
+        if remainder:
+            yield [remainder]
+
+    def readCSV(self, path: str):
+        columns = None
+        for lines in self.readLines(path):
+            rows = csv.reader(lines)
+            if columns is None:
+                header = next(rows, None)
+                if header is None:
+                    continue
+                columns = {name.strip(): i for i, name in enumerate(header)}
+            velocity_column = columns.get("max_velocity")
+            for row in rows:
+                if len(row) == 0:
+                    continue
+                try:
+                    start = (float(row[columns["from_x"]]), float(row[columns["from_y"]]))
+                    end = (float(row[columns["to_x"]]), float(row[columns["to_y"]]))
+                    max_velocity = self.getMaxVelocity(
+                        row[velocity_column] if velocity_column is not None else None
+                    )
+                except (IndexError, ValueError):
+                    self.report.skipped += 1
+                    continue
+                self.addSegment(start, end, max_velocity)
+            self.updateReport()
+
+    def readGeoJSON(self, path: str):
+        """
+        Decodes the features of a FeatureCollection one after another, without parsing the whole document. A
+        feature that does not decode is waited on while the file has unread bytes and the buffer is shorter than
+        MAX_FEATURE_SIZE, otherwise it is skipped up to the next feature.
+
+        Raises:
+            ValueError: If the file ends inside the features array
+        """
+        decoder = json.JSONDecoder()
+        buffer = ""
+        in_features = False
+        finished = False
+        skipper = None
+        for chunk in self.readChunks(path):
+            if finished:
+                continue
+            buffer += chunk
+            position = 0
+            if not in_features:
+                start = buffer.find('"features"')
+                if start < 0:
+                    continue
+                position = buffer.find("[", start)
+                if position < 0:
+                    continue
+                position += 1
+                in_features = True
+            unread = self.report.bytes_read < self.report.total_bytes
+            while True:
+                if skipper is not None:
+                    end = skipper.skip(buffer, position)
+                    if end < 0:
+                        position = len(buffer)
+                        break
+                    position = end
+                    skipper = None
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position += 1
+                if position >= len(buffer):
+                    break
+                if buffer[position] == "]":
+                    finished = True
+                    break
+                try:
+                    feature, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if unread and len(buffer) - position < MAX_FEATURE_SIZE:
+                        # The feature continues in the next chunk
+                        break
+                    self.report.skipped += 1
+                    skipper = FeatureSkipper()
+                    continue
+                self.addFeature(feature)
+            buffer = "" if finished else buffer[position:]
+            self.updateReport()
+        if in_features and not finished:
+            raise ValueError(f"{path} ends inside the features array")
+
+    def addFeature(self, feature: dict):
+        if not isinstance(feature, dict):
+            self.report.skipped += 1
+            return
+        geometry = feature.get("geometry") or {}
+        properties = feature.get("properties") or {}
+        try:
+            max_velocity = self.getMaxVelocity(properties.get("maxspeed"))
+        except ValueError:
+            max_velocity = self.default_max_velocity
+        if geometry.get("type") == "LineString":
+            lines = [geometry["coordinates"]]
+        elif geometry.get("type") == "MultiLineString":
+            lines = geometry["coordinates"]
+        else:
+            self.report.skipped += 1
+            return
+        for line in lines:
+            for start, end in zip(line[:-1], line[1:]):
+                self.addSegment(start[:2], end[:2], max_velocity)
+
+    def getMaxVelocity(self, value) -> float:
+        """
+        Converts a velocity in km/h from a file into m/s, using the default for missing values
+        """
+        if value is None or str(value).strip() == "":
+            return self.default_max_velocity
+        return float(value) / 3.6
+
+    def addSegment(self, start, end, max_velocity: float):
+        if self.transform is not None:
+            start = self.transform(*start)
+            end = self.transform(*end)
+        self.report.segments += 1
+        from_index, merged = self.merger.getIndex(float(start[0]), float(start[1]))
+        self.report.merged_points += merged
+        to_index, merged = self.merger.getIndex(float(end[0]), float(end[1]))
+        self.report.merged_points += merged
+        pair = (min(from_index, to_index), max(from_index, to_index))
+        if from_index == to_index or pair in self.connected:
+            self.report.duplicate_segments += 1
+            return
+        self.connected.add(pair)
+        index = self.segment_count
+        self.endpoints = grow(self.endpoints, index + 1)
+        self.max_velocities = grow(self.max_velocities, index + 1)
+        self.endpoints[index] = (from_index, to_index)
+        self.max_velocities[index] = max_velocity
+        self.segment_count += 1
+
+    def insert(self):
+        """
+        Creates the nodes and tracks of all read segments and adds them to the network in one go
+        """
+        self.connected = set()
+        endpoints = self.endpoints[: self.segment_count]
+        degrees = np.bincount(endpoints.ravel(), minlength=self.merger.count)
+        switches = (degrees >= 3) & (degrees <= 4)
+        nodes = [
+            SimpleSwitch(coordinates) if switch else Node(coordinates)
+            for coordinates, switch in zip(
+                self.merger.coordinates[: self.merger.count], switches.tolist()
+            )
+        ]
+        tracks = [
+            Track(nodes[from_index], nodes[to_index], max_velocity)
+            for (from_index, to_index), max_velocity in zip(
+                endpoints.tolist(), self.max_velocities[: self.segment_count].tolist()
+            )
+        ]
+        self.network.addBulk(nodes, tracks)
+
+
+def importNetwork(network, path: str, **options) -> ImportProgress:
+    """
+    Imports a CSV or GeoJSON file into a network, see NetworkImporter for the options
+
+    Args:
+        network (RailNetwork): The network the file is added to
+        path (str): The path of the file
+
+    Returns:
+        ImportProgress: The final counts and the throughput of the import
+    """
+    return NetworkImporter(network, **options).importFile(path)
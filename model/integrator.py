@@ -0,0 +1,107 @@
+"""
+Adaptive substepping
+
+Train.drive integrates a whole frame with one explicit step. Accelerating over a long step overshoots by half the
+acceleration times the squared step, and a train that reaches its next node within a step loses the rest of the
+step. The AdaptiveIntegrator splits every frame into substeps chosen per train: a cruising train takes the whole
+frame at once, while accelerating, braking and reaching nodes are resolved with substeps short enough to keep the
+position error of every acceleration phase, braking phase and passed node under a tolerance.
+"""
+
+DEFAULT_TOLERANCE = 1.0
+DEFAULT_MIN_STEP = 1e-3
+DEFAULT_MAX_STEP = 10.0
+
+
+class AdaptiveIntegrator:
+    """
+    Drives trains over a span of simulated time with as few Train.drive substeps as the tolerance allows. While a
+    train accelerates or brakes, its substeps are short enough to keep the error of the whole phase under the
+    tolerance. Otherwise a substep ends at the latest just behind the next node, which also covers switches and
+    changes of the speed limit, or where the train has to start braking.
+
+    Attributes:
+        tolerance (float): The largest position error in meters of an acceleration phase, a braking phase or a node
+        min_step (float): The shortest substep in seconds, so that trains always make progress
+        max_step (float): The longest substep in seconds
+        step_count (int): The number of substeps taken so far
+    """
+
+    def __init__(
+        self,
+        tolerance: float = DEFAULT_TOLERANCE,
+        min_step: float = DEFAULT_MIN_STEP,
+        max_step: float = DEFAULT_MAX_STEP,
+    ):
+        self.tolerance = tolerance
+        self.min_step = min_step
+        self.max_step = max_step
+        self.step_count = 0
+
+    def getStep(self, train, duration: float, target_velocity: float) -> float:
+        """
+        Returns the length of the next substep of a train
+
+        Args:
+            train (Train): The train
+            duration (float): The simulated seconds left in the frame
+            target_velocity (float): The velocity the train is driven towards
+
+        Returns:
+            float: The length of the substep in seconds, at most duration
+        """
+        step = min(duration, self.max_step)
+        velocity = train.velocity
+        target_velocity = train.getTargetVelocity(target_velocity)
+        acceleration = train.max_acceleration
+        if velocity != target_velocity:
+            # Every substep overshoots by half its velocity change times its length, so over a whole acceleration or
+            # braking phase the error adds up to half the step times the velocity change of the phase
+            step = min(step, 2 * self.tolerance / max(velocity, target_velocity))
+
+        if train.track is not None:
+            # The highest velocity the train can reach during the substep
+            reachable = max(
+                velocity, min(target_velocity, velocity + acceleration * step)
+            )
+            if reachable > 0:
+                distance = train.getDistanceFromNode(train.getNextNode())
+                # Reaching the node just within the substep only loses the part of it behind the node
+                step = min(step, (distance + self.tolerance / 2) / reachable)
+                if train.speed_profile is not None and velocity == target_velocity:
+                    node_velocities = train.speed_profile.node_velocities
+                    node_velocity = node_velocities[train.cursor + 1]
+                    braking_distance = (velocity**2 - node_velocity**2) / (
+                        2 * acceleration
+                    )
+                    if distance > braking_distance:
+                        step = min(step, (distance - braking_distance) / velocity)
+                    else:
+                        step = min(step, 2 * self.tolerance / velocity)
+
+        step = max(step, self.min_step)
+        if duration - step < self.min_step:
+            return duration
+        return step
+
+    def drive(self, train, duration: float, target_velocity: float) -> int:
+        """
+        Drives a train for a span of simulated time
+
+        Args:
+            train (Train): The train
+            duration (float): The simulated seconds to drive
+            target_velocity (float): The velocity the train is driven towards
+
+        Returns:
+            int: The number of substeps taken
+        """
+        steps = 0
+        remaining = duration
+        while remaining > 0 and not train.getHasArrived():
+            step = self.getStep(train, remaining, target_velocity)
+            train.drive(1, target_velocity, global_speed=step)
+            remaining -= step
+            steps += 1
+        self.step_count += steps
+        return steps
@@ -106,13 +106,16 @@ class TrainModel(Model):
         self.train = train
         super().__init__(color, train.position)
 
-    def draw(self, surface: pygame.Surface, view):
+    def draw(self, surface: pygame.Surface, view) -> pygame.Rect:
         """
         Draws the train on the given surface.
 
         Args:
             surface (pygame.Surface): The surface to draw on
             view (MapView): The view that determines the currently shown area
+
+        Returns:
+            pygame.Rect: The area that was drawn on
         """
         center = view.screen_coordinates(self.position)
 
@@ -142,7 +145,9 @@ class TrainModel(Model):
             center[1] + math.sin(alpha) * half_length - math.cos(alpha) * half_width,
         )
 
-        pygame.draw.polygon(surface, self.color, (corner1, corner2, corner3, corner4))
+        return pygame.draw.polygon(
+            surface, self.color, (corner1, corner2, corner3, corner4)
+        )
 
 
 class NodeModel(Model):
@@ -165,41 +170,55 @@ class NodeModel(Model):
         self.node = node
         self.radius = radius
 
-    def draw(self, surface: pygame.Surface, view):
+    def getActivationRect(self, view) -> pygame.Rect:
+        """
+        Returns the screen area in which the mouse hovers over the node.
+        """
+        center = view.screen_coordinates(self.position)
+        return pygame.Rect(
+            center[0] - self.radius * 2,
+            center[1] - self.radius * 2,
+            self.radius * 4,
+            self.radius * 4,
+        )
+
+    def draw(self, surface: pygame.Surface, view, hover: bool = None) -> pygame.Rect:
         """
         Draws the node on the given surface.
 
         Args:
             surface (pygame.Surface): The surface to draw on
             view (MapView): The view that determines the currently shown area
+            hover (bool, optional): Draws the node as hovered or not. Defaults to checking the mouse position.
+
+        Returns:
+            pygame.Rect: The area that was drawn on
 
         TODO:
             * Make the node transparent when the mouse is over it
         """
         center = view.screen_coordinates(self.position)
-        activation_rect = pygame.Rect(
-            center[0] - self.radius * 2,
-            center[1] - self.radius * 2,
-            self.radius * 4,
-            self.radius * 4,
-        )
+        if hover is None:
+            hover = self.getActivationRect(view).collidepoint(pygame.mouse.get_pos())
         circle_color = self.color
         circle_color.a = 20
-        if activation_rect.collidepoint(pygame.mouse.get_pos()):
+        if hover:
             circle_color.a = 5
-            pygame.draw.circle(surface, circle_color, center, self.radius * view.zoom)
+            rect = pygame.draw.circle(
+                surface, circle_color, center, self.radius * view.zoom
+            )
             if isinstance(self.node, SimpleSwitch):
-                self.draw_switch_direction(surface, center, view)
-
+                rect = rect.union(self.draw_switch_direction(surface, center, view))
+            return rect
         else:
-            pygame.draw.circle(
+            return pygame.draw.circle(
                 surface, circle_color, center, int(self.radius * 0.3) * view.zoom
             )
 
     def draw_switch_direction(self, surface, center, view):
         direction_out = self.node.getDirectionTo(self.node.getNextNodeFromIndex(0))
         direction_in = self.node.getDirectionTo(self.node.adj_nodes[0])
-        pygame.draw.lines(
+        rect = pygame.draw.lines(
             surface,
             RED,
             False,
@@ -221,4 +240,4 @@ class NodeModel(Model):
             + direction_in * triangle_height
             + perpendicular_vector * (triangle_base_length / 2),
         ]
-        pygame.draw.polygon(surface, BLUE, triangle_vertices)
+        return rect.union(pygame.draw.polygon(surface, BLUE, triangle_vertices))
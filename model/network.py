@@ -1,9 +1,16 @@
+import heapq
 import numpy as np
 
 from model.tracks import Track
+from model.tracks import getLaneCoordinates
 from model.nodes import Node
 from model.nodes import SimpleSwitch
 from model.trains import Train
+from model.storage import STORAGE
+from model.changes import ChangeKind
+from model.changes import NetworkChange
+from model.profiles import invalidateSpeedProfiles
+from model.routes import clearRoutes
 from typing import Union
 
 
@@ -11,19 +18,152 @@ class RailNetwork:
     """
     The Collection of all nodes and tracks. Represents a graph.
 
+    Node.id and Track.id index the storage that all networks of the process share. The IDs a network is addressed
+    with from the outside, by timetables, scenario files, switch settings, commands and summaries, are its own: they
+    count from 0 in the order the nodes and tracks were added to this network, and elements added in one batch are
+    numbered in the order they were created. In the first network of a process both IDs are the same.
+
     Attributes:
         nodes (List): The list of all nodes in the graph
+        node_ids (set): The storage IDs of the nodes, so that membership is checked without scanning the list
+        local_nodes (List): The node of every network ID, None for removed nodes. Includes the nodes of ramps.
+        local_tracks (List): The track or ramp of every network ID, None for removed tracks
+        local_node_ids (dict): The network ID of every node, by storage ID
+        local_track_ids (dict): The network ID of every track and ramp, by storage ID
         tracks (List): The list of all tracks in the graph
         ramps (List): The list of all ramps in the graph. Ramps are tracks that connect nodes inside a switch
         trains (List): The list of all trains in the graph
+        lanes (dict): The [lane, on-ramp, off-ramp] lists of the parallel lanes of every track, by the ID of the track
+        listeners (List): The callables that are given a NetworkChange after every edit of the network
     """
 
     def __init__(self):
         self.nodes = []
+        self.node_ids = set()
+        self.local_nodes = []
+        self.local_tracks = []
+        self.local_node_ids = {}
+        self.local_track_ids = {}
         self.tracks = []
         self.ramps = []
         self.trains = []
         self.adjacency_matrix = None
+        self.lanes = {}
+        self.listeners = []
+
+    def addListener(self, listener):
+        """
+        Registers a callable that is given a NetworkChange after every edit of the network.
+
+        Args:
+            listener: The callable to register
+        """
+        self.listeners.append(listener)
+
+    def removeListener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def notifyChange(self, kind: ChangeKind, nodes: tuple = (), tracks: tuple = ()):
+        """
+        Invalidates the speed profiles and routes that depend on the changed elements and informs all listeners.
+
+        Args:
+            kind (ChangeKind): What happened
+            nodes (tuple): The IDs of the changed nodes
+            tracks (tuple): The IDs of the changed tracks
+        """
+        change = NetworkChange(kind, nodes, tracks)
+        if kind in (
+            ChangeKind.NODE_REMOVED,
+            ChangeKind.TRACK_REMOVED,
+            ChangeKind.VELOCITY_CHANGED,
+        ):
+            invalidateSpeedProfiles(change.nodes)
+        if kind in (ChangeKind.NODE_REMOVED, ChangeKind.TRACK_REMOVED):
+            clearRoutes()
+        for listener in list(self.listeners):
+            listener(change)
+
+    def getNode(self, node_id: int) -> Node:
+        """
+        Returns the node with the given network ID.
+
+        Args:
+            node_id (int): The network ID of the node
+
+        Raises:
+            IndexError: If the network has no node with the ID
+
+        Returns:
+            Node: The node
+        """
+        if node_id < 0 or node_id >= len(self.local_nodes):
+            raise IndexError(f"The network has no node {node_id}")
+        node = self.local_nodes[node_id]
+        if node is None:
+            raise IndexError(f"Node {node_id} was removed")
+        return node
+
+    def getTrack(self, track_id: int) -> Track:
+        """
+        Returns the track or ramp with the given network ID.
+
+        Args:
+            track_id (int): The network ID of the track
+
+        Raises:
+            IndexError: If the network has no track with the ID
+
+        Returns:
+            Track: The track
+        """
+        if track_id < 0 or track_id >= len(self.local_tracks):
+            raise IndexError(f"The network has no track {track_id}")
+        track = self.local_tracks[track_id]
+        if track is None:
+            raise IndexError(f"Track {track_id} was removed")
+        return track
+
+    def hasNode(self, node_id: int) -> bool:
+        """
+        Checks if a network ID belongs to a node of the network
+        """
+        return (
+            0 <= node_id < len(self.local_nodes)
+            and self.local_nodes[node_id] is not None
+        )
+
+    def getNodeId(self, node: Node) -> int:
+        """
+        Returns the network ID of a node, None if it does not belong to the network
+        """
+        return self.local_node_ids.get(node.id)
+
+    def getTrackId(self, track: Track) -> int:
+        """
+        Returns the network ID of a track or ramp, None if it does not belong to the network
+        """
+        return self.local_track_ids.get(track.id)
+
+    def registerNodes(self, nodes: list):
+        """
+        Gives network IDs to the nodes that have none yet, in the order they were created
+        """
+        for node in sorted(nodes, key=lambda node: node.id):
+            if node.id not in self.local_node_ids:
+                self.local_node_ids[node.id] = len(self.local_nodes)
+                self.local_nodes.append(node)
+
+    def registerTracks(self, tracks: list):
+        """
+        Gives network IDs to the tracks that have none yet and to their nodes, in the order they were created
+        """
+        self.registerNodes([node for track in tracks for node in track.nodes])
+        for track in sorted(tracks, key=lambda track: track.id):
+            if track.id not in self.local_track_ids:
+                self.local_track_ids[track.id] = len(self.local_tracks)
+                self.local_tracks.append(track)
 
     def addNode(self, node: Node):
         """
@@ -32,8 +172,29 @@ class RailNetwork:
         Args:
             node (Node): Node to add to the network
         """
-        if node not in self.nodes:
+        if node.id not in self.node_ids:
             self.nodes.append(node)
+            self.node_ids.add(node.id)
+            self.registerNodes([node])
+            self.notifyChange(ChangeKind.NODE_ADDED, nodes=(node.id,))
+
+    def removeNode(self, node: Node):
+        """
+        Removes a node and all tracks connected to it from the network. The IDs of removed elements are not reused.
+
+        Args:
+            node (Node): Node to remove from the network
+        """
+        track_ids = sorted(set(STORAGE.getAdjacency(node.id)[1].tolist()))
+        for track_id in track_ids:
+            self.detachTrack(STORAGE.track_handles[track_id])
+        if node.id in self.node_ids:
+            self.nodes.remove(node)
+            self.node_ids.discard(node.id)
+        local_id = self.local_node_ids.pop(node.id, None)
+        if local_id is not None:
+            self.local_nodes[local_id] = None
+        self.notifyChange(ChangeKind.NODE_REMOVED, nodes=(node.id,), tracks=track_ids)
 
     def addNodes(self, node_coordinates: list):
         """
@@ -43,10 +204,7 @@ class RailNetwork:
             node_coordinates (List): Vector of coords.
         """
         for coordinate in node_coordinates:
-            new_node = Node(
-                f"N.{len(self.nodes)}:{Node.coordinatesToID(coordinate)}", coordinate
-            )
-            self.nodes.append(new_node)
+            self.addNode(Node(coordinate))
 
     def addTrack(self, track):
         """
@@ -58,26 +216,101 @@ class RailNetwork:
         if isinstance(track, list):
             if track[1] not in self.tracks:
                 for i in range(len(track)):
-                    node_0, node_1 = track[i].nodes
-                    node_0.connectNodes(node_1)
-                    node_0.tracks.append(track[i])
-                    node_1.tracks.append(track[i])
+                    track[i].connect()
                     if i == 0:
                         self.tracks.append(track[i])
                     else:
                         self.ramps.append(track[i])
+                self.registerTracks(track)
+                self.notifyChange(
+                    ChangeKind.TRACK_ADDED, tracks=[new_track.id for new_track in track]
+                )
 
         elif isinstance(track, Track):
             if track not in self.tracks:
-                node_0, node_1 = track.nodes
-                node_0.connectNodes(node_1)
-                node_0.tracks.append(track)
-                node_1.tracks.append(track)
+                track.connect()
                 self.tracks.append(track)
+                self.registerTracks([track])
+                self.notifyChange(ChangeKind.TRACK_ADDED, tracks=(track.id,))
+
+    def addBulk(self, nodes: list, tracks: list):
+        """
+        Adds many new nodes and tracks at once without checking for duplicates or parallel tracks, and emits a
+        single change for all of them.
+
+        Args:
+            nodes (list): The new nodes
+            tracks (list): The new tracks between them
+        """
+        for track in tracks:
+            track.connect()
+        self.nodes.extend(nodes)
+        self.node_ids.update(node.id for node in nodes)
+        self.tracks.extend(tracks)
+        self.registerNodes(nodes)
+        self.registerTracks(tracks)
+        self.notifyChange(
+            ChangeKind.TRACK_ADDED,
+            nodes=[node.id for node in nodes],
+            tracks=[track.id for track in tracks],
+        )
+
+    def removeTrack(self, track: Track):
+        """
+        Removes a track or ramp from the network, so that its nodes are no longer adjacent through it.
+
+        Args:
+            track (Track): The track to remove
+        """
+        self.detachTrack(track)
+        self.notifyChange(ChangeKind.TRACK_REMOVED, tracks=(track.id,))
+
+    def detachTrack(self, track: Track):
+        STORAGE.disconnectTrack(track.id)
+        if track in self.tracks:
+            self.tracks.remove(track)
+        elif track in self.ramps:
+            self.ramps.remove(track)
+        local_id = self.local_track_ids.pop(track.id, None)
+        if local_id is not None:
+            self.local_tracks[local_id] = None
+
+    def setSwitchState(self, node: SimpleSwitch, state: int):
+        """
+        Sets the state of a switch.
+
+        Args:
+            node (SimpleSwitch): The switch
+            state (int): The new state
+        """
+        if not 0 <= state < node.getStateCount():
+            raise ValueError(f"Switch {node.id} has no state {state}")
+        node.switch_state = state
+        self.notifyChange(ChangeKind.SWITCH_CHANGED, nodes=(node.id,))
+
+    def toggleSwitch(self, node: SimpleSwitch):
+        """
+        Sets a switch to its next state.
+
+        Args:
+            node (SimpleSwitch): The switch
+        """
+        node.switch()
+        self.notifyChange(ChangeKind.SWITCH_CHANGED, nodes=(node.id,))
+
+    def setMaxVelocity(self, track: Track, max_velocity: float):
+        """
+        Changes the maximum velocity of a track.
+
+        Args:
+            track (Track): The track
+            max_velocity (float): The new maximum velocity in m/s
+        """
+        track.max_velocity = max_velocity
+        self.notifyChange(ChangeKind.VELOCITY_CHANGED, tracks=(track.id,))
 
     def createTrackFromNodes(
         self,
-        track_id: str,
         node_0: Node,
         node_1: Node,
         max_velocity: int = 50,
@@ -87,7 +320,6 @@ class RailNetwork:
         a parallel Track is created and a list of the track and its ramps is created.
 
         Args:
-            track_id (str): The ID for the track
             node_0 (Node): The first node of the track
             node_1 (Node): The second node of the track
             max_velocity (int): The maximum velocity a train can drive on the track
@@ -95,13 +327,22 @@ class RailNetwork:
         Returns:
             (Union[Track, list]): A list if the track is parallel to another track otherwise a Track.)
         """
-        new_track = Track(f"{track_id}C", node_0, node_1, max_velocity)
+        track = self.findParallelTrack(node_0, node_1)
+        if track is None:
+            return Track(node_0, node_1, max_velocity)
+        return self.createParallelTrack(track, max_velocity)
 
+    def findParallelTrack(self, node_0: Node, node_1: Node) -> Track:
+        """
+        Returns the track of the network that runs from the coordinates of node_0 to those of node_1, or None
+        """
         for track in self.tracks:
-            if track.isParallel(new_track):
-                new_track = self.createParallelTrack(new_track, max_velocity)
-
-        return new_track
+            if all(
+                np.array_equal(track.nodes[i].coordinates, node.coordinates)
+                for i, node in enumerate((node_0, node_1))
+            ):
+                return track
+        return None
 
     def addTracksFromMatrix(
         self, adjacency_matrix: np.ndarray, max_velocities_in_ms: np.ndarray = None
@@ -110,79 +351,128 @@ class RailNetwork:
         Adds Tracks to the network from an adjacency matrix. The adjacency matrix is a matrix that represents the
         connections between nodes. The matrix is symmetric and the value of the matrix represents the number of tracks
         between the nodes. If the value is 0, there is no track between the nodes. If the value is i, there are i tracks
-        between the nodes.
+        between the nodes. The parallel lanes of all multi-track connections are built at once, see
+        createParallelTracks, and all tracks are added with a single change.
 
         Args:
             adjacency_matrix (np.ndarray): The adjacency matrix of the network
             max_velocities_in_ms (np.ndarray, optional): The max velocities of the tracks in m/s
         """
-        track_number = 0
         self.adjacency_matrix = adjacency_matrix
+        track_number = 0
+        tracks = []
+        lane_counts = []
+        lane_velocities = []
         for i in range(len(adjacency_matrix)):
             for j in range(i):
-                if adjacency_matrix[i][j] > 0:
-                    for k in range(adjacency_matrix[i][j]):
-                        max_velocity = 50
-                        if max_velocities_in_ms[track_number] is not None:
-                            max_velocity = max_velocities_in_ms[track_number]
-                        self.addTrack(
-                            self.createTrackFromNodes(
-                                f"Track No. {track_number}",
-                                self.nodes[i],
-                                self.nodes[j],
-                                max_velocity=max_velocity,
-                            )
-                        )
-                        track_number += 1
-
-    def createParallelTrack(self, track, max_velocity: int = 50, step_size=0):
-        """
-        TODO:
-            * Once ramp nodes/switches are sorted out this function should only check the Tracks of track.getNodes()
-            * Step_size needs to be implemented
-        """
-        if not isinstance(track, Track):
-            return
-        found_free_track = False
-        to_right = True
-        i = 0
-
-        while not found_free_track:
-            if to_right:
-                suffix = "R"
-            else:
-                suffix = "L"
-
-            parallel_track_nodes = Track.getRampStructure(track, to_right=to_right)
-            new_track = Track(
-                f"{track.id}{suffix}",
-                parallel_track_nodes[1],
-                parallel_track_nodes[2],
-                max_velocity,
-            )
-            ramp_on = Track(
-                f"{track.id}R",
-                parallel_track_nodes[0],
-                parallel_track_nodes[1],
-                max_velocity,
-            )
-            ramp_off = Track(
-                f"{track.id}R",
-                parallel_track_nodes[2],
-                parallel_track_nodes[3],
-                max_velocity,
-            )
-            if i % 2 == 0 and i > 0:
-                step_size += 1
-                new_track, ramp_on, ramp_off = self.createParallelTrack(
-                    new_track, max_velocity, step_size=step_size
-                )
-            if any(new_track.isParallel(other_track) for other_track in self.tracks):
-                to_right = not to_right
+                count = int(adjacency_matrix[i][j])
+                if count == 0:
+                    continue
+                velocities = [
+                    50
+                    if max_velocities_in_ms is None
+                    or max_velocities_in_ms[number] is None
+                    else max_velocities_in_ms[number]
+                    for number in range(track_number, track_number + count)
+                ]
+                track_number += count
+                tracks.append(Track(self.nodes[i], self.nodes[j], velocities[0]))
+                lane_counts.append(count - 1)
+                lane_velocities.extend(velocities[1:])
+
+        # The lanes follow their track, so that the nodes connect their tracks in the order of the matrix
+        lanes = iter(self.createParallelTracks(tracks, lane_counts, lane_velocities))
+        new_tracks = []
+        new_ramps = []
+        for track, count in zip(tracks, lane_counts):
+            track.connect()
+            new_tracks.append(track)
+            for _ in range(count):
+                lane, ramp_on, ramp_off = next(lanes)
+                for new_track in (lane, ramp_on, ramp_off):
+                    new_track.connect()
+                new_tracks.append(lane)
+                new_ramps.extend((ramp_on, ramp_off))
+        self.tracks.extend(new_tracks)
+        self.ramps.extend(new_ramps)
+        self.registerTracks(new_tracks + new_ramps)
+        self.notifyChange(
+            ChangeKind.TRACK_ADDED,
+            tracks=[track.id for track in new_tracks + new_ramps],
+        )
+
+    def createParallelTrack(self, track: Track, max_velocity: int = 50) -> list:
+        """
+        Creates the next parallel lane of a track, see createParallelTracks.
+
+        Args:
+            track (Track): The track that gets another lane
+            max_velocity (int): The maximum velocity on the lane and its ramps
+
+        Returns:
+            list: The lane, its on-ramp and its off-ramp
+        """
+        return self.createParallelTracks([track], [1], [max_velocity])[0]
+
+    def createParallelTracks(
+        self, tracks: list, counts: list, max_velocities: list
+    ) -> list:
+        """
+        Creates parallel lanes for many tracks at once. The lanes of a track alternate between its right and its left
+        side, starting on the right, and every second lane lies one level further out. The coordinates of all lanes are
+        computed in a single array operation, see getLaneCoordinates. The on-ramp of a lane leaves the lane below it on
+        the same side, or the first node of the track, and the off-ramp joins it again. The new tracks are not
+        connected or added to the network.
+
+        Args:
+            tracks (list): The tracks that get lanes
+            counts (list): The number of new lanes of every track
+            max_velocities (list): The maximum velocity of every new lane and its ramps, the lanes of the first track
+                first
+
+        Returns:
+            list: A [lane, on-ramp, off-ramp] list for every new lane, in the order of max_velocities
+        """
+        counts = np.asarray(counts, dtype=np.int64)
+        total = int(counts.sum())
+        if total == 0:
+            return []
+        corridors = np.repeat(np.arange(len(tracks)), counts)
+        existing = np.array([len(self.lanes.get(track.id, ())) for track in tracks])
+        first_lanes = np.cumsum(counts) - counts
+        lane_indices = np.arange(total) - first_lanes[corridors] + existing[corridors]
+        levels = lane_indices // 2 + 1
+        sides = np.where(lane_indices % 2 == 0, 1, -1)
+        endpoints = STORAGE.endpoints[[track.id for track in tracks]][corridors]
+        on_coordinates, off_coordinates = getLaneCoordinates(
+            STORAGE.coordinates[endpoints[:, 0]],
+            STORAGE.coordinates[endpoints[:, 1]],
+            levels,
+            sides,
+        )
+
+        new_lanes = []
+        for n in range(total):
+            track = tracks[corridors[n]]
+            lanes = self.lanes.setdefault(track.id, [])
+            if lane_indices[n] < 2:
+                from_node, to_node = track.nodes
             else:
-                found_free_track = True
-            i += 1
-        return list([new_track, ramp_on, ramp_off])
+                from_node, to_node = lanes[lane_indices[n] - 2][0].nodes
+            suffix = "R" if sides[n] > 0 else "L"
+            if levels[n] > 1:
+                suffix = f"{suffix}{levels[n]}"
+            on_node = Node(on_coordinates[n])
+            off_node = Node(off_coordinates[n])
+            max_velocity = max_velocities[n]
+            lane = [
+                Track(on_node, off_node, max_velocity, label=(track.id, suffix)),
+                Track(from_node, on_node, max_velocity, label=(track.id, suffix)),
+                Track(off_node, to_node, max_velocity, label=(track.id, suffix)),
+            ]
+            lanes.append(lane)
+            new_lanes.append(lane)
+        return new_lanes
 
     def initNodesAndTracks(
         self,
@@ -203,15 +493,81 @@ class RailNetwork:
                 <= sum(adjacency_matrix[i][j] for j in range(len(adjacency_matrix[i])))
                 <= 4
             ):
-                new_node = SimpleSwitch(
-                    f"SS.{i}:{Node.coordinatesToID(coordinates)}", coordinates
-                )
+                new_node = SimpleSwitch(coordinates)
             else:
-                new_node = Node(
-                    f"N.{i}:{Node.coordinatesToID(coordinates)}", coordinates
-                )
+                new_node = Node(coordinates)
             self.addNode(new_node)
 
         self.addTracksFromMatrix(
             adjacency_matrix, max_velocities_in_ms=max_velocities_in_ms
         )
+
+    def findRoute(self, from_node: Node, to_node: Node) -> list:
+        """
+        Finds the shortest route between two nodes over the tracks of the network.
+
+        Args:
+            from_node (Node): The node where the route starts
+            to_node (Node): The node where the route ends
+
+        Returns:
+            list: The nodes of the route without from_node, empty if to_node cannot be reached
+        """
+        distances = {from_node.id: 0}
+        predecessors = {}
+        queue = [(0, from_node.id, from_node)]
+        while len(queue) > 0:
+            distance, _, node = heapq.heappop(queue)
+            if node.id == to_node.id:
+                break
+            if distance > distances[node.id]:
+                continue
+            for adj_node in node.adj_nodes:
+                new_distance = distance + node.getDistanceToNode(adj_node)
+                if new_distance < distances.get(adj_node.id, np.inf):
+                    distances[adj_node.id] = new_distance
+                    predecessors[adj_node.id] = node
+                    heapq.heappush(queue, (new_distance, adj_node.id, adj_node))
+        else:
+            return []
+
+        route = [to_node]
+        while route[-1].id != from_node.id:
+            route.append(predecessors[route[-1].id])
+        route.pop()
+        return route[::-1]
+
+    def driveTrains(self, fps: int, global_speed: int = 1, integrator=None) -> list:
+        """
+        Drives every train of the network for one step with its maximum velocity as target.
+
+        Args:
+            fps (int): The current fps of the simulation
+            global_speed (int, optional): A coefficient that can be used to slow down the trains. Defaults to 1.
+            integrator (AdaptiveIntegrator, optional): Splits the step into substeps for every train. Defaults to a
+                single Train.drive per train.
+
+        Returns:
+            list: The trains that arrived at the end of their route during this step
+        """
+        arrived = []
+        for train in self.trains:
+            if train.getHasArrived():
+                continue
+            if integrator is None:
+                train.drive(fps, train.max_velocity, global_speed)
+            else:
+                integrator.drive(train, global_speed / fps, train.max_velocity)
+            if train.getHasArrived():
+                arrived.append(train)
+        return arrived
+
+    def removeTrains(self, trains: list):
+        """
+        Removes trains from the network in a single pass over the train list, so trains should be removed in batches.
+
+        Args:
+            trains (list): The trains to remove
+        """
+        removed = set(id(train) for train in trains)
+        self.trains = [train for train in self.trains if id(train) not in removed]
@@ -1,25 +1,56 @@
 import numpy as np
 from enum import Enum
-from view.windows import Window
 import time
 
+from model.storage import STORAGE
+from model.storage import getNodeHandle
+
+SWITCH_CLEARANCE = 50
+
 
 class Node:
     """
-    A Node is an Network element that can represent an end point, a platform or a switch.
+    A Node is an Network element that can represent an end point, a platform or a switch. The node itself is only a
+    handle, its data lives in the global NetworkStorage.
 
     Attributes:
-        id (str): The ID of the Node, usually the coordinates seperated by a "-"
+        id (int): The ID of the Node, which is also its index in the NetworkStorage
+        label (str): The human-readable name of the Node, by default built from its ID and coordinates
         coordinates (np.array): The coordinates where the node lies
         tracks (List): The tracks that are connected to this node (max 3)
         adj_nodes (List): The nodes that are adjacent to this node (max 3)
     """
 
-    def __init__(self, id: str, coordinates: tuple, adj_nodes: list = None):
-        self.id = id
-        self.coordinates = np.array(coordinates)
-        self.tracks = []
-        self.adj_nodes = []
+    __slots__ = ("id",)
+
+    LABEL_PREFIX = "N"
+
+    def __init__(self, coordinates: tuple, label: str = None):
+        self.id = STORAGE.addNode(self, coordinates)
+        if label is not None:
+            STORAGE.node_labels[self.id] = label
+
+    @property
+    def label(self) -> str:
+        label = STORAGE.node_labels.get(self.id)
+        if label is None:
+            label = f"{self.LABEL_PREFIX}.{self.id}:{Node.coordinatesToID(self.coordinates)}"
+            STORAGE.node_labels[self.id] = label
+        return label
+
+    @property
+    def coordinates(self) -> np.ndarray:
+        return STORAGE.coordinates[self.id]
+
+    @property
+    def tracks(self) -> list:
+        track_indices = STORAGE.getAdjacency(self.id)[1]
+        return [STORAGE.track_handles[i] for i in track_indices.tolist()]
+
+    @property
+    def adj_nodes(self) -> list:
+        node_indices = STORAGE.getAdjacency(self.id)[0]
+        return [STORAGE.node_handles[i] for i in node_indices.tolist()]
 
     def getDirectionTo(self, node) -> np.ndarray:
         """
@@ -47,16 +78,6 @@ class Node:
         translated_vector = node.coordinates - self.coordinates
         return np.linalg.norm(translated_vector)
 
-    def connectNodes(self, other_node):
-        """
-        Connects two nodes by adding the other node to the adj_nodes list of both nodes
-
-        Args:
-            other_node (Node): The node to which this node is connected
-        """
-        self.adj_nodes.append(other_node)
-        other_node.adj_nodes.append(self)
-
     def coordinatesToID(coordinates: tuple) -> str:
         """
         Converts coordinates to an ID
@@ -68,76 +89,136 @@ class Node:
             str: The ID of the coordinates"""
         coordinates_str = []
         for i in range(2):
-            if coordinates[i] < 0:
-                coordinates_str.append(f"({str(coordinates[i]*(-1)).zfill(4)})")
+            coordinate = int(round(coordinates[i]))
+            if coordinate < 0:
+                coordinates_str.append(f"({str(coordinate*(-1)).zfill(4)})")
             else:
-                coordinates_str.append(str(coordinates[i]).zfill(4))
+                coordinates_str.append(str(coordinate).zfill(4))
         return f"{coordinates_str[0]}-{coordinates_str[1]}"
 
     def getNextNodeFromIndex(self, next_node_index: int):
         return self.adj_nodes[next_node_index]
 
     def getTrackTo(self, node):
+        return STORAGE.getTrackBetween(self.id, node.id)
+
+    def isOccupied(self, clearance: float = 0) -> bool:
+        """
+        Checks if a train stands on the node or on one of its tracks within the clearance around it
+
+        Args:
+            clearance (float, optional): The distance around the node in meters that has to be free. Defaults to 0.
+
+        Returns:
+            bool: True if any train occupies the stretch around the node
+        """
         for track in self.tracks:
-            if node in track.nodes:
-                return track
+            offset = track.getOffset(self)
+            if track.occupancy.isOccupied(
+                offset, track.getOffset(self, min(clearance, track.getLength()))
+            ):
+                return True
+        return False
 
     def getIndex(self, node):
-        return self.adj_nodes.index(node)
+        return STORAGE.getAdjacency(self.id)[0].tolist().index(node.id)
 
     def __str__(self):
-        return f"{self.id}              Cords. {self.coordinates}"
+        return f"{self.label}              Cords. {self.coordinates}"
 
     def __eq__(self, other):
         if not isinstance(other, Node):
             return False
-        if all(self.coordinates[i] == other.coordinates[i] for i in range(2)):
-            return True
-        else:
-            return False
+        return self.id == other.id
+
+    def __hash__(self):
+        return self.id
+
+    def __reduce__(self):
+        return getNodeHandle, (self.id,)
 
 
 class SimpleSwitch(Node):
-    def __init__(self, id: str, coordinates: tuple, adj_nodes: list = None):
-        super().__init__(id, coordinates, adj_nodes)
-        self.switch_state = 0
+    """
+    A SimpleSwitch connects a common track (index 0 of adj_nodes) to one of up to three branches. In switch state s
+    the common track is joined with the branch at index s + 1. The transitions of the switch are stored as a
+    (state, entry index) -> exit index table in the NetworkStorage, together with those of all other switches.
+    """
+
+    __slots__ = ()
+
+    LABEL_PREFIX = "SS"
+
+    def __init__(self, coordinates: tuple, label: str = None):
+        super().__init__(coordinates, label)
+        STORAGE.setSwitchStates(self.id, [[(0, 1)], [(0, 2)], [(0, 3)]])
+
+    @property
+    def switch_state(self) -> int:
+        return int(STORAGE.switch_states[self.id])
+
+    @switch_state.setter
+    def switch_state(self, state: int):
+        STORAGE.switch_states[self.id] = state
+
+    def getStateCount(self) -> int:
+        return len(self.adj_nodes) - 1
 
     def switch(self):
-        self.switch_state = (self.switch_state + 1) % (len(self.adj_nodes) - 1)
+        self.switch_state = (self.switch_state + 1) % self.getStateCount()
 
     def getDelay(self, global_speed: int):
         return self.delay / global_speed
 
+    def getExitIndex(self, previous_node_index: int) -> int:
+        """
+        Looks up the adjacency index through which a train leaves the switch in its current state
+
+        Args:
+            previous_node_index (int): The adjacency index of the node the train comes from
+
+        Returns:
+            int: The adjacency index of the exit or -1 if the switch does not lead anywhere from that entry
+        """
+        return STORAGE.getSwitchExit(self.id, previous_node_index)
+
     def getNextNodeFromIndex(self, previous_node_index: int):
-        if self.switch_state == 0:
-            if 0 <= previous_node_index <= 1:
-                return self.adj_nodes[1 - previous_node_index]
-        if self.switch_state == 1:
-            if previous_node_index == 0 or previous_node_index == 2:
-                return self.adj_nodes[2 - previous_node_index]
-        if self.switch_state == 2:
-            if previous_node_index == 0 or previous_node_index == 3:
-                return self.adj_nodes[3 - previous_node_index]
-        return None
+        exit_index = self.getExitIndex(previous_node_index)
+        if exit_index < 0:
+            return None
+        return self.adj_nodes[exit_index]
 
     def getNextNodeFrom(self, previous_node: Node):
         previous_node_index = self.getIndex(previous_node)
         return self.getNextNodeFromIndex(previous_node_index)
 
     def getTrackFrom(self, previous_node: Node):
-        previous_node_index = self.getIndex(previous_node)
-        if self.switch_state == 0:
-            if 0 <= previous_node_index <= 1:
-                return self.tracks[1 - previous_node_index]
-        if self.switch_state == 1:
-            if previous_node_index == 0 or previous_node_index == 2:
-                return self.tracks[2 - previous_node_index]
-        if self.switch_state == 2:
-            if previous_node_index == 0 or previous_node_index == 3:
-                return self.tracks[3 - previous_node_index]
-        return None
-
-
-# Make Switches a collection of nodes
-class ComplexSwitch:
-    pass
+        exit_index = self.getExitIndex(self.getIndex(previous_node))
+        if exit_index < 0:
+            return None
+        return self.tracks[exit_index]
+
+
+class ComplexSwitch(SimpleSwitch):
+    """
+    A ComplexSwitch is a collection of routes through one node, like a double slip or a crossover. Every switch state
+    connects a set of pairs of adjacency indices, and trains can run through each pair in both directions.
+
+    Attributes:
+        states (List): For every switch state a list of (index, index) pairs that are connected
+    """
+
+    __slots__ = ()
+
+    LABEL_PREFIX = "CS"
+
+    def __init__(self, coordinates: tuple, states: list, label: str = None):
+        Node.__init__(self, coordinates, label)
+        STORAGE.setSwitchStates(self.id, states)
+
+    @property
+    def states(self) -> list:
+        return STORAGE.getSwitchStates(self.id)
+
+    def getStateCount(self) -> int:
+        return len(self.states)
@@ -0,0 +1,179 @@
+from bisect import bisect_left
+from bisect import bisect_right
+
+
+class TrackOccupancy:
+    """
+    The TrackOccupancy holds the stretches of a track that are occupied by trains as intervals sorted by their start.
+    Offsets are measured in meters from the first node of the track. Intervals may overlap, e.g. where two trains
+    meet at a node or where a reversing train covers the same track with its head and its tail, so a train can hold
+    several intervals. Lookups by end use the running maximum of the ends, which is sorted even when the ends are not.
+
+    Attributes:
+        starts (List): The sorted start offsets of the occupied intervals
+        ends (List): The end offsets of the occupied intervals, in the same order as starts
+        max_ends (List): The largest end offset of the intervals up to every position
+        trains (List): The trains occupying the intervals, in the same order as starts
+        train_starts (Dict): The start offsets of the intervals of every train on the track, used to find them
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.max_ends = []
+        self.trains = []
+        self.train_starts = {}
+
+    def __len__(self):
+        return len(self.train_starts)
+
+    def getTrains(self) -> list:
+        """
+        Returns the trains on the track, ordered by the start of their first interval
+        """
+        return list(dict.fromkeys(self.trains))
+
+    def getIndices(self, train) -> list:
+        """
+        Returns the positions of the intervals of a train in the interval lists.
+
+        Args:
+            train (Train): The train that is looked up
+
+        Returns:
+            list: The indices of the train's intervals, empty if the train does not occupy the track
+        """
+        indices = []
+        for start in self.train_starts.get(train, ()):
+            i = bisect_left(self.starts, start)
+            while self.trains[i] is not train or i in indices:
+                i += 1
+            indices.append(i)
+        return indices
+
+    def updateMaxEnds(self, first: int):
+        """
+        Recomputes the running maximum of the ends from a position on, after an interval was inserted or removed
+        """
+        del self.max_ends[first:]
+        max_end = self.max_ends[-1] if first > 0 else -float("inf")
+        for end in self.ends[first:]:
+            max_end = max(max_end, end)
+            self.max_ends.append(max_end)
+
+    def occupy(self, train, start: float, end: float):
+        """
+        Marks the stretch between start and end as occupied by a train. Previous intervals of the same
+        train are replaced.
+
+        Args:
+            train (Train): The train occupying the stretch
+            start (float): The offset where the stretch begins
+            end (float): The offset where the stretch ends
+        """
+        self.release(train)
+        self.add(train, start, end)
+
+    def add(self, train, start: float, end: float):
+        """
+        Marks another stretch as occupied by a train and keeps its other intervals, e.g. for a train that reversed
+        and covers the track twice.
+
+        Args:
+            train (Train): The train occupying the stretch
+            start (float): The offset where the stretch begins
+            end (float): The offset where the stretch ends
+        """
+        if start > end:
+            start, end = end, start
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.trains.insert(i, train)
+        self.train_starts.setdefault(train, []).append(start)
+        self.updateMaxEnds(i)
+
+    def release(self, train):
+        """
+        Removes the intervals of a train, if it has any.
+
+        Args:
+            train (Train): The train that leaves the track
+        """
+        indices = self.getIndices(train)
+        if len(indices) == 0:
+            return
+        for i in sorted(indices, reverse=True):
+            del self.starts[i]
+            del self.ends[i]
+            del self.trains[i]
+        del self.train_starts[train]
+        self.updateMaxEnds(min(indices))
+
+    def getOverlaps(self, start: float, end: float) -> range:
+        """
+        Returns the positions of the intervals that may overlap the stretch between start and end. Every interval
+        before the range ends before start and every interval after it starts after end.
+        """
+        return range(bisect_left(self.max_ends, start), bisect_right(self.starts, end))
+
+    def getOccupants(self, start: float, end: float) -> list:
+        """
+        Returns the trains that occupy any part of the stretch between start and end.
+
+        Args:
+            start (float): The offset where the stretch begins
+            end (float): The offset where the stretch ends
+
+        Returns:
+            list: The trains that overlap the stretch, ordered by their offset
+        """
+        if start > end:
+            start, end = end, start
+        occupants = {}
+        for i in self.getOverlaps(start, end):
+            if self.ends[i] >= start:
+                occupants[self.trains[i]] = None
+        return list(occupants)
+
+    def isOccupied(self, start: float, end: float) -> bool:
+        """
+        Checks if any train occupies a part of the stretch between start and end.
+
+        Returns:
+            bool: True if the stretch is at least partially occupied
+        """
+        if start > end:
+            start, end = end, start
+        # The first interval whose running maximum reaches start ends at or after start itself
+        return len(self.getOverlaps(start, end)) > 0
+
+    def getNextOccupant(self, offset: float, towards_end: bool = True, exclude=None):
+        """
+        Finds the closest occupied interval ahead of an offset.
+
+        Args:
+            offset (float): The offset from which the search starts
+            towards_end (bool, optional): If True the search runs towards the second node of the track, otherwise towards the first one.
+            exclude (Train, optional): A train that is ignored, usually the one that searches
+
+        Returns:
+            tuple: The distance to the interval and its train, or (None, None) if the stretch ahead is free
+        """
+        if towards_end:
+            i = bisect_left(self.starts, offset)
+            while i < len(self.trains):
+                if self.trains[i] is not exclude:
+                    return self.starts[i] - offset, self.trains[i]
+                i += 1
+            return None, None
+        # The ends are not sorted, so every interval that starts before the offset is a candidate
+        closest = None
+        for i in range(bisect_right(self.starts, offset)):
+            if self.trains[i] is exclude or self.ends[i] > offset:
+                continue
+            if closest is None or self.ends[i] >= self.ends[closest]:
+                closest = i
+        if closest is None:
+            return None, None
+        return offset - self.ends[closest], self.trains[closest]
@@ -0,0 +1,271 @@
+import multiprocessing
+
+from model.changes import ChangeKind
+from model.events import EVENT_BUS
+from model.events import EVENT_TYPES
+from model.partition import partitionNetwork
+from model.storage import STORAGE
+
+"""
+Every region of the network is simulated by a worker process that was forked after the network had been built, so
+all workers share the same node and track IDs. Nodes and tracks are pickled as their IDs and resolve to the
+handles of the receiving process.
+
+A train belongs to the region of the node it passed last. Each step, the workers drive their trains and return
+the trains that crossed into another region. The coordinator hands them to their new region at the start of the
+next step, sorted by train ID. Trains only interact with the network and never with each other while driving, so
+every train runs through exactly the same operations as in a single process and the results are bit-identical.
+Track occupancies are kept per worker and only describe the trains of that region.
+
+The subscribers of the EVENT_BUS live in the coordinator. Every step tells the workers which event types are
+subscribed, the workers collect these events while driving and return them with their trains. The coordinator
+publishes them sorted by train ID, so subscribers see the same events as in a single process, only ordered by train
+instead of by position in the train list. Speed profiles from the shared cache are pickled as their cache keys.
+
+The engine is not a faster default: every step is a round trip through one pipe per worker and every train that
+changes its region or emits an event is pickled, which costs more than driving a train. On the standard scenarios
+it runs at a fraction of the single process speed, see model.equivalence, so the SimulationEngine stays the default.
+"""
+
+
+def getRegion(regions, train) -> int:
+    return int(regions[train.route.node_ids[train.cursor]])
+
+
+def runRegion(connection, region: int, regions):
+    """
+    The main loop of a worker process
+
+    Args:
+        connection (multiprocessing.connection.Connection): The pipe to the coordinator
+        region (int): The region simulated by this worker
+        regions (np.ndarray): The region of every node ID
+    """
+    # The subscribers of the coordinator were copied by the fork, only the forwarding subscription is kept
+    EVENT_BUS.subscriptions.clear()
+    events = []
+    event_types = ()
+    subscription = None
+    trains = {}
+    retire_on_arrival = set()
+    while True:
+        message = connection.recv()
+        command = message[0]
+        if command == "step":
+            (
+                _,
+                simulated_time,
+                fps,
+                global_speed,
+                incoming,
+                retiring,
+                switch_states,
+                subscribed_types,
+            ) = message
+            if subscribed_types != event_types:
+                if subscription is not None:
+                    EVENT_BUS.unsubscribe(subscription)
+                    subscription = None
+                if len(subscribed_types) > 0:
+                    subscription = EVENT_BUS.subscribe(events.extend, subscribed_types)
+                event_types = subscribed_types
+            EVENT_BUS.time = simulated_time
+            for node_id, state in switch_states:
+                STORAGE.switch_states[node_id] = state
+            for train in incoming:
+                trains[train.id] = train
+            retire_on_arrival.update(retiring)
+
+            outgoing = []
+            arrived = []
+            for train_id in sorted(trains):
+                train = trains[train_id]
+                if train.getHasArrived():
+                    continue
+                train.drive(fps, train.max_velocity, global_speed)
+                if train.getHasArrived():
+                    arrived.append(train_id)
+                    if train_id in retire_on_arrival:
+                        retire_on_arrival.discard(train_id)
+                        releaseTrain(trains.pop(train_id))
+                        continue
+                if getRegion(regions, train) != region:
+                    retire_on_arrival.discard(train_id)
+                    releaseTrain(trains.pop(train_id))
+                    outgoing.append(train)
+            EVENT_BUS.flush()
+            connection.send((outgoing, arrived, events))
+            events.clear()
+        elif command == "collect":
+            connection.send([trains[train_id] for train_id in sorted(trains)])
+        elif command == "close":
+            connection.close()
+            return
+
+
+def releaseTrain(train):
+    for track in train.occupied_tracks:
+        track.occupancy.release(train)
+
+
+class RegionalEngine:
+    """
+    The RegionalEngine partitions a network into regions and simulates each region in its own process. It offers the
+    stepping part of the SimulationEngine and requires the fork start method.
+
+    Attributes:
+        network (RailNetwork): The network that is simulated. Its trains list is only updated by collectTrains.
+        dispatcher (Dispatcher): Injects the trains of the timetable, optional
+        regions (np.ndarray): The region of every node ID
+        global_speed (float): The number of simulated seconds per second of wall time
+        step_rate (float): The number of steps per simulated global_speed seconds
+        simulated_time (float): The current simulated time in seconds
+    """
+
+    def __init__(
+        self,
+        network,
+        region_count: int,
+        dispatcher=None,
+        global_speed: float = 1,
+        step_rate: float = 60,
+        simulated_time: float = 0.0,
+    ):
+        self.network = network
+        self.dispatcher = dispatcher
+        self.global_speed = global_speed
+        self.step_rate = step_rate
+        self.simulated_time = simulated_time
+        self.regions = partitionNetwork(network, region_count)
+        self.pending = [[] for _ in range(region_count)]
+        self.retiring = [[] for _ in range(region_count)]
+        self.switch_states = []
+
+        context = multiprocessing.get_context("fork")
+        self.connections = []
+        self.workers = []
+        for region in range(region_count):
+            parent_connection, child_connection = context.Pipe()
+            worker = context.Process(
+                target=runRegion,
+                args=(child_connection, region, self.regions),
+                daemon=True,
+            )
+            worker.start()
+            child_connection.close()
+            self.connections.append(parent_connection)
+            self.workers.append(worker)
+        network.addListener(self.handleNetworkChange)
+
+        for train in network.trains:
+            self.pending[getRegion(self.regions, train)].append(train)
+        network.trains = []
+
+    def setSwitchState(self, node_id: int, state: int):
+        """
+        Sets a switch state in every region before the next step
+        """
+        STORAGE.switch_states[node_id] = state
+        self.switch_states.append((node_id, state))
+
+    def handleNetworkChange(self, change):
+        """
+        Forwards switch states set through the network, e.g. by the dispatcher, to the regions
+        """
+        if change.kind == ChangeKind.SWITCH_CHANGED:
+            for node_id in change.nodes:
+                self.switch_states.append(
+                    (node_id, int(STORAGE.switch_states[node_id]))
+                )
+
+    def step(self, fps: float = None) -> list:
+        """
+        Advances all regions by one step of global_speed / fps simulated seconds
+
+        Returns:
+            list: The IDs of the trains that arrived during the step
+        """
+        if fps is None:
+            fps = self.step_rate
+        self.simulated_time += self.global_speed / fps
+        EVENT_BUS.time = self.simulated_time
+        if self.dispatcher is not None:
+            departed = self.dispatcher.update(self.simulated_time)
+            if len(departed) > 0:
+                self.network.removeTrains(departed)
+            for train in departed:
+                region = getRegion(self.regions, train)
+                self.pending[region].append(train)
+                self.retiring[region].append(train.id)
+
+        subscribed_types = tuple(
+            event_type
+            for event_type in EVENT_TYPES
+            if EVENT_BUS.wants(event_type)
+        )
+        for region, connection in enumerate(self.connections):
+            incoming = sorted(self.pending[region], key=lambda train: train.id)
+            connection.send(
+                (
+                    "step",
+                    self.simulated_time,
+                    fps,
+                    self.global_speed,
+                    incoming,
+                    self.retiring[region],
+                    self.switch_states,
+                    subscribed_types,
+                )
+            )
+        self.pending = [[] for _ in self.connections]
+        self.retiring = [[] for _ in self.connections]
+        self.switch_states = []
+
+        arrived = []
+        events = []
+        for connection in self.connections:
+            outgoing, region_arrived, region_events = connection.recv()
+            arrived.extend(region_arrived)
+            events.extend(region_events)
+            for train in outgoing:
+                region = getRegion(self.regions, train)
+                self.pending[region].append(train)
+                if (
+                    self.dispatcher is not None
+                    and train.id in self.dispatcher.active_trains
+                ):
+                    self.retiring[region].append(train.id)
+        if self.dispatcher is not None:
+            for train_id in arrived:
+                self.dispatcher.active_trains.pop(train_id, None)
+        # The sort is stable, so the events of a train keep their order
+        for event in sorted(events, key=lambda event: event.train.id):
+            EVENT_BUS.emit(event)
+        EVENT_BUS.flush()
+        return sorted(arrived)
+
+    def collectTrains(self) -> list:
+        """
+        Fetches the current state of all trains from the workers and stores it in the trains list of the network
+
+        Returns:
+            list: All trains, sorted by ID
+        """
+        trains = []
+        for connection in self.connections:
+            connection.send(("collect",))
+        for connection in self.connections:
+            trains.extend(connection.recv())
+        for pending in self.pending:
+            trains.extend(pending)
+        trains.sort(key=lambda train: train.id)
+        self.network.trains = trains
+        return trains
+
+    def close(self):
+        self.network.removeListener(self.handleNetworkChange)
+        for connection in self.connections:
+            connection.send(("close",))
+            connection.close()
+        for worker in self.workers:
+            worker.join()
@@ -0,0 +1,134 @@
+import numpy as np
+
+from model.storage import STORAGE
+
+DEFAULT_REFINEMENT_PASSES = 4
+DEFAULT_IMBALANCE = 0.1
+
+
+def getNetworkNodeIds(network) -> np.ndarray:
+    """
+    Returns the IDs of all nodes of a network, including the ramp nodes that are only reachable through tracks
+
+    Args:
+        network (RailNetwork): The network
+
+    Returns:
+        np.ndarray: The sorted node IDs
+    """
+    track_ids = [track.id for track in network.tracks + network.ramps]
+    listed_ids = [node.id for node in network.nodes]
+    return np.unique(
+        np.concatenate(
+            (
+                np.array(listed_ids, dtype=np.int64),
+                STORAGE.endpoints[np.array(track_ids, dtype=np.int64)].ravel(),
+            )
+        )
+    )
+
+
+def bisect(coordinates: np.ndarray, members: np.ndarray, region_count: int) -> list:
+    """
+    Splits nodes recursively along the longer axis of their bounding box until there is one group per region.
+    The sizes of the groups are proportional to the number of regions they stand for.
+
+    Args:
+        coordinates (np.ndarray): The coordinates of all nodes
+        members (np.ndarray): The indices of the nodes to split
+        region_count (int): The number of regions to create from them
+
+    Returns:
+        list: The member indices of every region
+    """
+    if region_count == 1:
+        return [members]
+    points = coordinates[members]
+    axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+    order = members[np.argsort(points[:, axis], kind="stable")]
+    left_count = region_count // 2
+    split = len(order) * left_count // region_count
+    return bisect(coordinates, order[:split], left_count) + bisect(
+        coordinates, order[split:], region_count - left_count
+    )
+
+
+def partitionNetwork(
+    network,
+    region_count: int,
+    refinement_passes: int = DEFAULT_REFINEMENT_PASSES,
+    imbalance: float = DEFAULT_IMBALANCE,
+) -> np.ndarray:
+    """
+    Partitions the nodes of a network into regions with few tracks between them. The nodes are first split by
+    recursive coordinate bisection, then nodes at region borders are moved to the neighbouring region that holds
+    most of their neighbours, as long as this cuts fewer tracks and keeps the regions balanced.
+
+    Args:
+        network (RailNetwork): The network to partition
+        region_count (int): The number of regions
+        refinement_passes (int, optional): How often the borders are refined. Defaults to 4.
+        imbalance (float, optional): How much larger than average a region may grow. Defaults to 0.1.
+
+    Returns:
+        np.ndarray: The region of every node ID in the storage, -1 for nodes outside the network
+    """
+    node_ids = getNetworkNodeIds(network)
+    coordinates = STORAGE.coordinates[node_ids]
+    labels = np.zeros(len(node_ids), dtype=np.int32)
+    for region, members in enumerate(
+        bisect(coordinates, np.arange(len(node_ids)), region_count)
+    ):
+        labels[members] = region
+
+    track_ids = np.array(
+        [track.id for track in network.tracks + network.ramps], dtype=np.int64
+    )
+    edges = np.searchsorted(node_ids, STORAGE.endpoints[track_ids])
+    neighbours = [[] for _ in range(len(node_ids))]
+    for a, b in edges.tolist():
+        neighbours[a].append(b)
+        neighbours[b].append(a)
+
+    sizes = np.bincount(labels, minlength=region_count)
+    max_size = int(np.ceil(len(node_ids) / region_count * (1 + imbalance)))
+    for _ in range(refinement_passes):
+        moved = False
+        cut = labels[edges[:, 0]] != labels[edges[:, 1]]
+        for node in np.unique(edges[cut]).tolist():
+            counts = np.bincount(labels[neighbours[node]], minlength=region_count)
+            current = labels[node]
+            target = int(np.argmax(counts))
+            if (
+                counts[target] > counts[current]
+                and sizes[target] < max_size
+                and sizes[current] > 1
+            ):
+                labels[node] = target
+                sizes[target] += 1
+                sizes[current] -= 1
+                moved = True
+        if not moved:
+            break
+
+    regions = np.full(STORAGE.getNodeCount(), -1, dtype=np.int32)
+    regions[node_ids] = labels
+    return regions
+
+
+def getCutTracks(network, regions: np.ndarray) -> list:
+    """
+    Returns the tracks whose nodes lie in different regions
+
+    Args:
+        network (RailNetwork): The partitioned network
+        regions (np.ndarray): The region of every node ID
+
+    Returns:
+        list: The tracks between regions
+    """
+    return [
+        track
+        for track in network.tracks + network.ramps
+        if regions[track.nodes[0].id] != regions[track.nodes[1].id]
+    ]
@@ -0,0 +1,680 @@
+"""
+Conflict-free planning of timetable runs
+
+The ReservationPlanner plans departures one after another, in the order of their requested departure time. Every
+planned run reserves the tracks and switches it uses for the time its head enters them until its tail has left them,
+plus a headway before and after. Later runs are routed around these reservations with a time-dependent A* search
+over (node, previous node) states, so that switches are only passed in directions they can be set to. If no route is
+free at the requested time, the departure is postponed until one is, up to a maximum delay.
+
+The search uses the free running time at the velocity limits. The shortest leg between two nodes without any
+reservations is searched once and reused as long as it is free, only a blocked leg is searched around the
+reservations. If no route is free, the departure is postponed by retry steps, skipping the steps at which all tracks
+and switches that blocked the search are still reserved. The found route is then
+timed exactly with the speed profile the train will drive, checked against the
+reservations once more and postponed past any remaining conflict. Every route is timed once per train performance,
+and the profiles of candidate routes are not added to the shared profile cache.
+"""
+
+import bisect
+import heapq
+import math
+
+import numpy as np
+
+from model.profiles import SpeedProfile
+from model.storage import STORAGE
+from model.timetable import Departure
+from model.timetable import TRAIN_TYPES
+
+DEFAULT_HEADWAY = 10
+DEFAULT_MAX_DELAY = 3600
+DEFAULT_RETRY_STEP = 30
+# Postponing a departure past a conflict adds this margin, so that rounding cannot produce the same conflict again
+MIN_POSTPONEMENT = 1e-3
+
+
+class ReservationTable:
+    """
+    The ReservationTable holds the time intervals in which tracks and switches are reserved. The intervals of one
+    resource never overlap, so they are sorted by their start and their end at the same time and every lookup is a
+    binary search.
+
+    Resources are ("track", track ID) and ("switch", node ID) tuples.
+
+    Attributes:
+        starts (dict): The sorted start times of the reservations of every resource
+        ends (dict): The end times of the reservations of every resource, in the same order
+        owners (dict): The train ID of every reservation of every resource, in the same order
+    """
+
+    def __init__(self):
+        self.starts = {}
+        self.ends = {}
+        self.owners = {}
+
+    def getConflict(self, resource: tuple, start: float, end: float) -> tuple:
+        """
+        Looks up a reservation that overlaps an interval
+
+        Args:
+            resource (tuple): The track or switch
+            start (float): The start of the interval
+            end (float): The end of the interval
+
+        Returns:
+            tuple: The end and the owner of the overlapping reservation, None if the interval is free
+        """
+        starts = self.starts.get(resource)
+        if starts is None:
+            return None
+        # Only the last reservation that starts before the interval ends can reach into it
+        i = bisect.bisect_left(starts, end)
+        if i > 0 and self.ends[resource][i - 1] > start:
+            return self.ends[resource][i - 1], self.owners[resource][i - 1]
+        return None
+
+    def reserve(self, resource: tuple, start: float, end: float, owner: str):
+        """
+        Reserves a free interval of a resource
+        """
+        starts = self.starts.setdefault(resource, [])
+        i = bisect.bisect_left(starts, start)
+        starts.insert(i, start)
+        self.ends.setdefault(resource, []).insert(i, end)
+        self.owners.setdefault(resource, []).insert(i, owner)
+
+    def getReservations(self, resource: tuple) -> list:
+        """
+        Returns the (start, end, owner) reservations of a resource in order
+        """
+        return list(
+            zip(
+                self.starts.get(resource, ()),
+                self.ends.get(resource, ()),
+                self.owners.get(resource, ()),
+            )
+        )
+
+
+class PlannedRun:
+    """
+    A PlannedRun is the conflict-free route and timing of a departure
+
+    Attributes:
+        departure (Departure): The requested departure
+        departure_time (float): The planned departure time, not earlier than the requested one
+        route (list): The nodes of the route after the origin, as expected by Train.addRoute
+        stops (list): The network IDs of the nodes of the route after the origin
+        times (np.ndarray): The planned times at which the head of the train reaches the origin and every node of the
+            route
+        switch_settings (list): The (time, network node ID, state) settings of the switches on the route
+    """
+
+    def __init__(
+        self,
+        departure: Departure,
+        departure_time: float,
+        route: list,
+        stops: list,
+        times: np.ndarray,
+        switch_settings: list,
+    ):
+        self.departure = departure
+        self.departure_time = departure_time
+        self.route = route
+        self.stops = stops
+        self.times = times
+        self.switch_settings = switch_settings
+
+    def getDelay(self) -> float:
+        return self.departure_time - self.departure.departure_time
+
+    def getArrivalTime(self) -> float:
+        return float(self.times[-1])
+
+    def getDeparture(self) -> Departure:
+        """
+        Returns a departure at the planned time that passes every node of the planned route
+        """
+        return Departure(
+            self.departure.train_id,
+            self.departure.train_type,
+            self.departure.origin,
+            list(self.stops),
+            self.departure_time,
+        )
+
+    def schedule(self, dispatcher):
+        """
+        Schedules the run and its switch settings with a dispatcher
+
+        Args:
+            dispatcher (Dispatcher): The dispatcher that runs the timetable
+        """
+        dispatcher.addDeparture(self.getDeparture())
+        for time, node_id, state in self.switch_settings:
+            dispatcher.addSwitchSetting(time, node_id, state)
+
+
+class ReservationPlanner:
+    """
+    The ReservationPlanner plans conflict-free routes for departures, see the module documentation.
+
+    Attributes:
+        network (RailNetwork): The network the trains run on
+        headway (float): The seconds a track or switch stays reserved before and after a train
+        max_delay (float): The longest a departure is postponed before it is given up
+        retry_step (float): How far a departure is postponed when no route was free
+        reservations (ReservationTable): The reservations of all planned runs
+        runs (list): The planned runs
+        unplanned (list): The departures that could not be planned
+        legs (dict): The node IDs of the shortest leg without reservations of every (origin, previous node, target,
+            maximum velocity) that was requested more than once, None if the target cannot be reached
+        requested_legs (set): The legs that were requested once, they are only searched around the reservations
+        route_times (dict): The times of every timed (route, maximum velocity, maximum acceleration)
+    """
+
+    def __init__(
+        self,
+        network,
+        headway: float = DEFAULT_HEADWAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        retry_step: float = DEFAULT_RETRY_STEP,
+    ):
+        self.network = network
+        self.headway = headway
+        self.max_delay = max_delay
+        self.retry_step = retry_step
+        self.reservations = ReservationTable()
+        self.runs = []
+        self.unplanned = []
+        self.edges = {}
+        self.timed_edges = {}
+        self.switch_transitions = {}
+        self.legs = {}
+        self.requested_legs = set()
+        self.route_times = {}
+
+    def plan(self, departures: list) -> list:
+        """
+        Plans departures in the order of their requested departure time, around all runs planned before
+
+        Args:
+            departures (list): The departures to plan
+
+        Returns:
+            list: The PlannedRuns of the departures that could be planned
+        """
+        # The network may have been changed since the last call
+        self.edges = {}
+        self.timed_edges = {}
+        self.switch_transitions = {}
+        self.legs = {}
+        self.requested_legs = set()
+        self.route_times = {}
+        runs = []
+        for departure in sorted(
+            departures, key=lambda departure: departure.departure_time
+        ):
+            run = self.planDeparture(departure)
+            if run is None:
+                self.unplanned.append(departure)
+            else:
+                runs.append(run)
+        self.runs.extend(runs)
+        return runs
+
+    def planDeparture(self, departure: Departure) -> PlannedRun:
+        """
+        Plans a single departure and reserves its route
+
+        Returns:
+            PlannedRun: The planned run or None if no conflict-free route was found within max_delay
+        """
+        origin = self.network.getNode(departure.origin)
+        # The search works on storage IDs, the departures and settings use the IDs of the network
+        stops = [self.network.getNode(stop).id for stop in departure.stops]
+        train = TRAIN_TYPES[departure.train_type](departure.train_id, origin)
+        departure_time = departure.departure_time
+        while departure_time <= departure.departure_time + self.max_delay:
+            route, wait = self.findRoute(
+                origin.id,
+                stops,
+                train.max_velocity,
+                train.length,
+                departure_time,
+            )
+            if route is None:
+                departure_time += self.retry_step
+                while departure_time <= departure.departure_time + self.max_delay:
+                    wait -= self.retry_step
+                    if wait <= MIN_POSTPONEMENT:
+                        break
+                    departure_time += self.retry_step
+                continue
+            if len(route) < 2:
+                return None
+            nodes = [STORAGE.node_handles[node_id] for node_id in route]
+            times = self.getTimes(nodes, train)
+            intervals = self.getIntervals(route, times, train.length)
+
+            postponement = 0
+            for resource, start, end in intervals:
+                conflict = self.reservations.getConflict(
+                    resource, departure_time + start, departure_time + end
+                )
+                if conflict is not None:
+                    postponement = max(
+                        postponement, conflict[0] - departure_time - start
+                    )
+            if postponement > 0:
+                departure_time += postponement + MIN_POSTPONEMENT
+                continue
+
+            for resource, start, end in intervals:
+                self.reservations.reserve(
+                    resource,
+                    departure_time + start,
+                    departure_time + end,
+                    departure.train_id,
+                )
+            return PlannedRun(
+                departure,
+                departure_time,
+                nodes[1:],
+                [self.network.getNodeId(node) for node in nodes[1:]],
+                departure_time + times,
+                self.getSwitchSettings(route, departure_time + times),
+            )
+        return None
+
+    def findRoute(
+        self,
+        origin: int,
+        stops: list,
+        max_velocity: float,
+        length: float,
+        start_time: float,
+    ) -> tuple:
+        """
+        Finds a route over all stops that is free at the free running times
+
+        Returns:
+            tuple: The node IDs of the route including the origin and 0, or None and how long the search would fail
+                if the route is not free. Only a failed first leg gives a wait, the later legs start at times that
+                depend on the earlier ones.
+        """
+        route = [origin]
+        previous = -1
+        time = start_time
+        for i, stop in enumerate(stops):
+            nodes, time = self.findLeg(
+                route[-1], previous, stop, max_velocity, length, time
+            )
+            if nodes is None:
+                return None, time if i == 0 else 0
+            route.extend(nodes)
+            if len(route) > 1:
+                previous = route[-2]
+        return route, 0
+
+    def findLeg(
+        self,
+        origin: int,
+        previous: int,
+        target: int,
+        max_velocity: float,
+        length: float,
+        start_time: float,
+    ) -> tuple:
+        """
+        Finds the earliest free arrival at a node, starting at a node that was entered from previous. The shortest
+        leg without reservations is the earliest arrival whenever it is free, so once a leg is requested again, for
+        a postponed departure or another train, it is only searched if the shortest leg is blocked.
+
+        Returns:
+            tuple: The node IDs of the leg without its origin and the arrival time. If no leg is free, None and the
+                time by which the start can be postponed before a blocked track or switch is free again.
+        """
+        key = (origin, previous, target, max_velocity)
+        if key not in self.legs:
+            if key not in self.requested_legs:
+                self.requested_legs.add(key)
+                return self.searchLeg(
+                    origin, previous, target, max_velocity, length, start_time, True
+                )
+            self.legs[key] = self.searchLeg(
+                origin, previous, target, max_velocity, length, 0.0, False
+            )[0]
+        nodes = self.legs[key]
+        if nodes is None:
+            return None, np.inf
+        arrival, wait = self.getFreeArrival(
+            origin, previous, nodes, max_velocity, length, start_time
+        )
+        if arrival is not None:
+            return nodes, arrival
+        nodes, arrival = self.searchLeg(
+            origin, previous, target, max_velocity, length, start_time, True
+        )
+        if nodes is None:
+            return None, min(wait, arrival)
+        return nodes, arrival
+
+    def getFreeArrival(
+        self,
+        origin: int,
+        previous: int,
+        nodes: list,
+        max_velocity: float,
+        length: float,
+        start_time: float,
+    ) -> float:
+        """
+        Times a leg at the free running times and checks it against the reservations like the search does
+
+        Returns:
+            tuple: The arrival time at the last node of the leg and 0, or None and the time until the first blocked
+                track or switch is free again
+        """
+        node = origin
+        time = start_time
+        for next_node in nodes:
+            for (
+                exit,
+                edge_node,
+                track,
+                duration,
+                velocity,
+                is_switch,
+            ) in self.getTimedEdges(node, max_velocity):
+                if edge_node == next_node:
+                    break
+            arrival = time + duration
+            clearing = length / velocity + self.headway
+            conflict = self.reservations.getConflict(
+                ("track", track), time - self.headway, arrival + clearing
+            )
+            if conflict is not None:
+                return None, conflict[0] - time + self.headway
+            if is_switch:
+                conflict = self.reservations.getConflict(
+                    ("switch", next_node), arrival - self.headway, arrival + clearing
+                )
+                if conflict is not None:
+                    return None, conflict[0] - arrival + self.headway
+            node = next_node
+            time = arrival
+        return time, 0
+
+    def searchLeg(
+        self,
+        origin: int,
+        previous: int,
+        target: int,
+        max_velocity: float,
+        length: float,
+        start_time: float,
+        reserved: bool,
+    ) -> tuple:
+        """
+        Searches the earliest arrival at a node with A*, starting at a node that was entered from previous
+
+        Args:
+            reserved (bool): If False, the reservations are ignored
+
+        Returns:
+            tuple: The node IDs of the leg without its origin and the arrival time. If the target cannot be reached,
+                None and the time until the first track or switch that blocked the search is free again.
+        """
+        coordinates = STORAGE.coordinates
+        target_x, target_y = coordinates[target].tolist()
+        estimates = {}
+
+        def getEstimate(node: int) -> float:
+            estimate = estimates.get(node)
+            if estimate is None:
+                x, y = coordinates[node].tolist()
+                estimate = math.hypot(x - target_x, y - target_y) / max_velocity
+                estimates[node] = estimate
+            return estimate
+
+        arrivals = {(origin, previous): start_time}
+        parents = {}
+        # Every blocked track or switch stays blocked if the start is postponed by less than this
+        wait = np.inf
+        queue = [(start_time + getEstimate(origin), 0, start_time, origin, previous)]
+        sequence = 1
+        while len(queue) > 0:
+            _, _, time, node, previous_node = heapq.heappop(queue)
+            if node == target:
+                nodes = []
+                state = (node, previous_node)
+                while state in parents:
+                    nodes.append(state[0])
+                    state = parents[state]
+                return nodes[::-1], time
+            if time > arrivals[(node, previous_node)]:
+                continue
+            check_passage = previous_node >= 0 and self.isSwitch(node)
+
+            for (
+                exit,
+                next_node,
+                track,
+                duration,
+                velocity,
+                is_switch,
+            ) in self.getTimedEdges(node, max_velocity):
+                # Trains do not turn around on the spot
+                if next_node == previous_node:
+                    continue
+                if check_passage and not self.canPass(node, previous_node, exit):
+                    continue
+                arrival = time + duration
+                state = (next_node, node)
+                # The reservations are only looked up for arrivals that improve the state
+                if arrival >= arrivals.get(state, np.inf):
+                    continue
+                if reserved:
+                    clearing = length / velocity + self.headway
+                    conflict = self.reservations.getConflict(
+                        ("track", track), time - self.headway, arrival + clearing
+                    )
+                    if conflict is not None:
+                        wait = min(wait, conflict[0] - time + self.headway)
+                        continue
+                    if is_switch:
+                        conflict = self.reservations.getConflict(
+                            ("switch", next_node),
+                            arrival - self.headway,
+                            arrival + clearing,
+                        )
+                        if conflict is not None:
+                            wait = min(wait, conflict[0] - arrival + self.headway)
+                            continue
+                arrivals[state] = arrival
+                parents[state] = (node, previous_node)
+                heapq.heappush(
+                    queue,
+                    (
+                        arrival + getEstimate(next_node),
+                        sequence,
+                        arrival,
+                        next_node,
+                        node,
+                    ),
+                )
+                sequence += 1
+        return None, wait
+
+    def getEdges(self, node: int) -> list:
+        """
+        Returns the (adjacency index, next node, track, length, maximum velocity) of the tracks a train can take
+        from a node. Trains follow the first track between two nodes, so parallel tracks are left out.
+        """
+        edges = self.edges.get(node)
+        if edges is None:
+            edges = []
+            visited = set()
+            adjacent_nodes, tracks = STORAGE.getAdjacency(node)
+            x, y = STORAGE.coordinates[node].tolist()
+            for exit, (next_node, track) in enumerate(
+                zip(adjacent_nodes.tolist(), tracks.tolist())
+            ):
+                if next_node in visited:
+                    continue
+                visited.add(next_node)
+                next_x, next_y = STORAGE.coordinates[next_node].tolist()
+                edges.append(
+                    (
+                        exit,
+                        next_node,
+                        track,
+                        math.hypot(next_x - x, next_y - y),
+                        float(STORAGE.max_velocities[track]),
+                    )
+                )
+            self.edges[node] = edges
+        return edges
+
+    def getTimedEdges(self, node: int, max_velocity: float) -> list:
+        """
+        Returns the (adjacency index, next node, track, running time, velocity, next node is a switch) of the tracks
+        a train with a maximum velocity can take from a node. Tracks without a positive velocity are left out.
+        """
+        key = (node, max_velocity)
+        edges = self.timed_edges.get(key)
+        if edges is None:
+            edges = []
+            for (
+                exit,
+                next_node,
+                track,
+                track_length,
+                max_track_velocity,
+            ) in self.getEdges(node):
+                velocity = min(max_track_velocity, max_velocity)
+                if velocity <= 0:
+                    continue
+                edges.append(
+                    (
+                        exit,
+                        next_node,
+                        track,
+                        track_length / velocity,
+                        velocity,
+                        self.isSwitch(next_node),
+                    )
+                )
+            self.timed_edges[key] = edges
+        return edges
+
+    def isSwitch(self, node: int) -> bool:
+        return STORAGE.switch_slots[node] >= 0
+
+    def getSwitchTransitions(self, node: int) -> dict:
+        """
+        Returns the state that connects every (entry, exit) pair of adjacency indices of a switch
+        """
+        transitions = self.switch_transitions.get(node)
+        if transitions is None:
+            transitions = {}
+            degree = len(STORAGE.getAdjacency(node)[0])
+            state_count = STORAGE.node_handles[node].getStateCount()
+            for state, pairs in enumerate(STORAGE.getSwitchStates(node)[:state_count]):
+                for entry, exit in pairs:
+                    if entry < degree and exit < degree:
+                        transitions.setdefault((entry, exit), state)
+                        transitions.setdefault((exit, entry), state)
+            self.switch_transitions[node] = transitions
+        return transitions
+
+    def canPass(self, node: int, previous: int, exit: int) -> bool:
+        """
+        Checks if a train that entered a node from previous can leave it through the adjacency index exit
+        """
+        if previous < 0 or not self.isSwitch(node):
+            return True
+        entry = STORAGE.getAdjacency(node)[0].tolist().index(previous)
+        return (entry, exit) in self.getSwitchTransitions(node)
+
+    def getTimes(self, nodes: list, train) -> np.ndarray:
+        """
+        Returns the times at which the head of a train reaches every node of a route when it drives its speed profile
+
+        Returns:
+            np.ndarray: The times relative to the departure
+        """
+        key = (
+            tuple(node.id for node in nodes),
+            train.max_velocity,
+            train.max_acceleration,
+        )
+        times = self.route_times.get(key)
+        if times is None:
+            # Most candidates are rejected, so their profiles are not kept in the shared cache
+            profile = SpeedProfile(nodes, train.max_velocity, train.max_acceleration)
+            times = np.concatenate(([0.0], np.cumsum(profile.getSectionTimes())))
+            self.route_times[key] = times
+        return times
+
+    def getIntervals(self, route: list, times: np.ndarray, length: float) -> list:
+        """
+        Returns the (resource, start, end) intervals relative to the departure in which a run uses every track and
+        switch of its route. A resource is used from the moment the head enters it until the tail has left it. Trains
+        are retired when they arrive, so nothing is used after the arrival.
+        """
+        distances = np.concatenate(
+            (
+                [0.0],
+                np.cumsum(
+                    np.linalg.norm(np.diff(STORAGE.coordinates[route], axis=0), axis=1)
+                ),
+            )
+        )
+        cleared = np.interp(distances + length, distances, times)
+        intervals = []
+        for i in range(len(route) - 1):
+            track = STORAGE.getTrackBetween(route[i], route[i + 1])
+            intervals.append(
+                (
+                    ("track", track.id),
+                    times[i] - self.headway,
+                    cleared[i + 1] + self.headway,
+                )
+            )
+        for i, node in enumerate(route):
+            if self.isSwitch(node):
+                intervals.append(
+                    (
+                        ("switch", node),
+                        times[i] - self.headway,
+                        cleared[i] + self.headway,
+                    )
+                )
+        return intervals
+
+    def getSwitchSettings(self, route: list, times: np.ndarray) -> list:
+        """
+        Returns the (time, network node ID, state) settings of the switches a run passes. Every switch is set when
+        its reservation for the run begins.
+        """
+        settings = []
+        for i in range(1, len(route) - 1):
+            node = route[i]
+            if not self.isSwitch(node):
+                continue
+            adjacent_nodes = STORAGE.getAdjacency(node)[0].tolist()
+            state = self.getSwitchTransitions(node)[
+                (adjacent_nodes.index(route[i - 1]), adjacent_nodes.index(route[i + 1]))
+            ]
+            settings.append(
+                (
+                    float(times[i]) - self.headway,
+                    self.network.getNodeId(STORAGE.node_handles[node]),
+                    state,
+                )
+            )
+        return settings
@@ -0,0 +1,166 @@
+import numpy as np
+
+from model.storage import STORAGE
+
+# Speed profiles are shared by all trains that run the same route with the same performance, so they are
+# cached by the ids of the route's nodes, the maximum velocity and the maximum acceleration.
+PROFILE_CACHE = {}
+# The keys of the cached profiles that pass every node, so that edits of the network only drop the affected ones
+PROFILE_KEYS_BY_NODE = {}
+
+
+class SpeedProfile:
+    """
+    A SpeedProfile holds the highest velocities a train may have along a route, so that it can brake in time
+    for slower tracks, reversals and the end of the route.
+
+    Attributes:
+        lengths (np.ndarray): The length of every track section of the route
+        track_velocities (np.ndarray): The velocity limit on every track section of the route
+        node_velocities (np.ndarray): The highest velocity with which every node of the route can be passed
+        max_acceleration (float): The acceleration used for the forward and backward pass
+        key (tuple): The key of the profile in PROFILE_CACHE, None if it is not cached. A cached profile is pickled
+            as its key, so that handing a train to another process does not copy the profile.
+    """
+
+    def __init__(self, route: list, max_velocity: float, max_acceleration: float):
+        self.max_acceleration = max_acceleration
+        self.key = None
+        sections = len(route) - 1
+        self.lengths = np.zeros(sections)
+        self.track_velocities = np.zeros(sections)
+        for i in range(sections):
+            track = route[i].getTrackTo(route[i + 1])
+            self.lengths[i] = route[i].getDistanceToNode(route[i + 1])
+            self.track_velocities[i] = min(track.max_velocity, max_velocity)
+
+        node_velocities = np.zeros(sections + 1)
+        node_velocities[1:-1] = np.minimum(
+            self.track_velocities[:-1], self.track_velocities[1:]
+        )
+        for i in range(1, sections):
+            if route[i - 1] == route[i + 1]:
+                node_velocities[i] = 0
+
+        # Forward pass: limit every node to what can be reached by accelerating from the previous one
+        for i in range(1, sections + 1):
+            node_velocities[i] = min(
+                node_velocities[i],
+                np.sqrt(
+                    node_velocities[i - 1] ** 2
+                    + 2 * max_acceleration * self.lengths[i - 1]
+                ),
+            )
+        # Backward pass: limit every node to what still allows braking for the next one
+        for i in range(sections - 1, -1, -1):
+            node_velocities[i] = min(
+                node_velocities[i],
+                np.sqrt(
+                    node_velocities[i + 1] ** 2 + 2 * max_acceleration * self.lengths[i]
+                ),
+            )
+        self.node_velocities = node_velocities
+
+    def getTargetVelocity(self, section: int, distance_to_next_node: float) -> float:
+        """
+        Returns the highest velocity allowed at a position on the route
+
+        Args:
+            section (int): The index of the track section the train is on
+            distance_to_next_node (float): The remaining distance to the end of the section
+
+        Returns:
+            float: The velocity from which the train can still brake for the next node
+        """
+        braking_velocity = np.sqrt(
+            self.node_velocities[section + 1] ** 2
+            + 2 * self.max_acceleration * max(distance_to_next_node, 0)
+        )
+        return min(self.track_velocities[section], braking_velocity)
+
+    def getSectionTimes(self) -> np.ndarray:
+        """
+        Returns the shortest time in which every track section of the route can be driven, accelerating and braking
+        with max_acceleration and never exceeding the profile
+
+        Returns:
+            np.ndarray: The running time of every section in seconds
+        """
+        a = self.max_acceleration
+        v0 = self.node_velocities[:-1]
+        v1 = self.node_velocities[1:]
+        peak = np.sqrt((2 * a * self.lengths + v0**2 + v1**2) / 2)
+        v = np.minimum(self.track_velocities, peak)
+        accelerating = (v**2 - v0**2) / (2 * a)
+        braking = (v**2 - v1**2) / (2 * a)
+        cruising = np.maximum(self.lengths - accelerating - braking, 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (v - v0) / a + (v - v1) / a + np.where(v > 0, cruising / v, 0)
+
+    def __reduce_ex__(self, protocol):
+        if self.key is None:
+            return super().__reduce_ex__(protocol)
+        return loadSpeedProfile, (self.key,)
+
+    def getRunningTime(self) -> float:
+        """
+        Returns the shortest time in which the route can be driven
+
+        Returns:
+            float: The running time in seconds
+        """
+        return float(np.sum(self.getSectionTimes()))
+
+
+def getSpeedProfile(route: list, max_velocity: float, max_acceleration: float):
+    """
+    Returns the cached speed profile for a route or computes it if no train ran the route before
+
+    Args:
+        route (list): The nodes of the route, or a Route
+        max_velocity (float): The maximum velocity of the train
+        max_acceleration (float): The maximum acceleration of the train
+
+    Returns:
+        SpeedProfile: The speed profile of the route or None if the route has no track sections
+    """
+    if len(route) < 2:
+        return None
+    key = (tuple(node.id for node in route), max_velocity, max_acceleration)
+    profile = PROFILE_CACHE.get(key)
+    if profile is None:
+        profile = SpeedProfile(route, max_velocity, max_acceleration)
+        profile.key = key
+        PROFILE_CACHE[key] = profile
+        for node_id in set(key[0]):
+            PROFILE_KEYS_BY_NODE.setdefault(node_id, set()).add(key)
+    return profile
+
+
+def loadSpeedProfile(key: tuple):
+    """
+    Returns the speed profile of a cache key when a train is unpickled. A process that has no profile for the key
+    computes it once from the shared storage.
+    """
+    node_ids, max_velocity, max_acceleration = key
+    return getSpeedProfile(
+        [STORAGE.node_handles[node_id] for node_id in node_ids],
+        max_velocity,
+        max_acceleration,
+    )
+
+
+def invalidateSpeedProfiles(node_ids):
+    """
+    Drops the cached speed profiles of all routes that pass one of the given nodes. Trains keep the profile they
+    were given, only new routes get a recomputed one.
+
+    Args:
+        node_ids: The IDs of the nodes whose tracks changed
+    """
+    for node_id in node_ids:
+        for key in PROFILE_KEYS_BY_NODE.pop(node_id, ()):
+            profile = PROFILE_CACHE.pop(key, None)
+            # Trains that still drive the profile pickle it in full from now on
+            if profile is not None:
+                profile.key = None
@@ -0,0 +1,94 @@
+"""
+Interned routes
+
+A route is stored once as immutable arrays of node and track IDs, no matter how many trains run it. Trains only keep
+a cursor into their route, so the whole route, including the part already driven, stays available to views,
+recorders and vectorized code. Routes are interned by the IDs of their nodes through getRoute.
+"""
+
+import numpy as np
+
+from model.profiles import getSpeedProfile
+from model.storage import STORAGE
+
+# All routes by the IDs of their nodes
+ROUTE_CACHE = {}
+
+
+class Route:
+    """
+    A Route is an immutable sequence of adjacent nodes and the tracks between them. Indexing a route returns the
+    Node handles, the arrays hold the IDs.
+
+    Attributes:
+        node_ids (tuple): The IDs of the nodes of the route
+        track_ids (tuple): The IDs of the tracks between consecutive nodes, one less than there are nodes
+        nodes (np.ndarray): The IDs of the nodes as a read-only integer array
+        tracks (np.ndarray): The IDs of the tracks as a read-only integer array
+    """
+
+    __slots__ = ("node_ids", "track_ids", "nodes", "tracks")
+
+    def __init__(self, node_ids: tuple):
+        self.node_ids = node_ids
+        self.track_ids = tuple(
+            STORAGE.getTrackBetween(from_id, to_id).id
+            for from_id, to_id in zip(node_ids[:-1], node_ids[1:])
+        )
+        self.nodes = np.array(node_ids, dtype=np.int32)
+        self.tracks = np.array(self.track_ids, dtype=np.int32)
+        self.nodes.flags.writeable = False
+        self.tracks.flags.writeable = False
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def __getitem__(self, index: int):
+        return STORAGE.node_handles[self.node_ids[index]]
+
+    def __reduce__(self):
+        return getRoute, (self.node_ids,)
+
+    def getTrack(self, index: int):
+        """
+        Returns the Track handle between the node at index and the next node
+        """
+        return STORAGE.track_handles[self.track_ids[index]]
+
+    def getNodes(self, start: int = 0, end: int = None) -> list:
+        """
+        Returns the Node handles of a part of the route
+        """
+        return [STORAGE.node_handles[node_id] for node_id in self.node_ids[start:end]]
+
+    def getSpeedProfile(self, max_velocity: float, max_acceleration: float):
+        """
+        Returns the shared speed profile of the route for a train performance, see getSpeedProfile
+        """
+        return getSpeedProfile(self, max_velocity, max_acceleration)
+
+
+def getRoute(node_ids: tuple) -> Route:
+    """
+    Returns the interned route over the given nodes, creating it if no train ran the route before
+
+    Args:
+        node_ids (tuple): The IDs of the adjacent nodes of the route
+
+    Returns:
+        Route: The shared route
+    """
+    node_ids = tuple(node_ids)
+    route = ROUTE_CACHE.get(node_ids)
+    if route is None:
+        route = Route(node_ids)
+        ROUTE_CACHE[node_ids] = route
+    return route
+
+
+def clearRoutes():
+    """
+    Drops all interned routes after tracks were removed. Trains keep the route they were given, only new routes
+    look up their tracks again.
+    """
+    ROUTE_CACHE.clear()
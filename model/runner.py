@@ -0,0 +1,367 @@
+"""
+Headless scenario runner
+
+Runs a scenario file with the SimulationEngine as fast as possible and without a display, writes the summary metrics
+and optionally the trajectories of all trains, and exits with a status code, so that regression and capacity runs
+can be executed on build servers.
+
+Usage: python -m model.runner scenario.json [--summary summary.json] [--trajectories trajectories.csv]
+    [--sample-interval seconds]
+
+A scenario file is a JSON object with these keys, paths are relative to the scenario file:
+    name: The name of the run, defaults to the file name
+    network: "sample" for the demo network, {"import": path, ...} to import a CSV or GeoJSON file with the options
+        of NetworkImporter, or {"nodes": [[x, y], ...], "adjacency_matrix": [[...]], "max_velocities_in_kmh": [...]}
+    timetable: The path of a timetable CSV file, optional
+    trains: Departures as {"train_id", "type", "origin", "stops", "departure"} objects, optional. Every stop of a
+        departure, from the timetable or from here, has to be reachable from the one before.
+    plan: If true, the departures are planned conflict-free with the ReservationPlanner
+    switch_states: The initial state of switches, by node ID
+    switch_settings: [time, node ID, state] switch settings during the run
+    duration: The simulated seconds to run
+    dt: The length of a step in simulated seconds, defaults to DEFAULT_DT
+    integrator: {"tolerance": meters} to drive the trains with an AdaptiveIntegrator, optional
+    expect: Limits the run has to meet: min_arrived, max_blocked_switches, max_mean_delay and min_punctuality
+
+Exit status: EXIT_PASSED if all expectations are met, EXIT_FAILED if one is not, EXIT_INVALID if the scenario file
+cannot be run.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from model.engine import SimulationEngine
+from model.events import EVENT_BUS
+from model.events import SwitchBlocked
+from model.importer import importNetwork
+from model.integrator import AdaptiveIntegrator
+from model.network import RailNetwork
+from model.planner import ReservationPlanner
+from model.scenarios import buildSampleNetwork
+from model.statistics import OperationsStatistics
+from model.timetable import Departure
+from model.timetable import Dispatcher
+from model.timetable import loadTimetable
+from model.timetable import parseTime
+
+DEFAULT_DT = 1 / 12
+DEFAULT_SAMPLE_INTERVAL = 1.0
+EXIT_PASSED = 0
+EXIT_FAILED = 1
+EXIT_INVALID = 2
+TRAJECTORY_COLUMNS = ("time", "train_id", "x", "y", "velocity", "node_index")
+EXPECTATIONS = (
+    "min_arrived",
+    "max_blocked_switches",
+    "max_mean_delay",
+    "min_punctuality",
+)
+
+
+class ScenarioError(Exception):
+    """
+    Raised for scenario files that cannot be run
+    """
+
+
+class ScenarioRun:
+    """
+    A scenario file loaded into a network and a dispatcher
+
+    Attributes:
+        name (str): The name of the run
+        network (RailNetwork): The network of the scenario
+        dispatcher (Dispatcher): The departures and switch settings of the scenario
+        duration (float): The simulated seconds to run
+        dt (float): The length of a step in simulated seconds
+        integrator (AdaptiveIntegrator): Drives the trains with substeps, None for one step per train
+        departure_count (int): The number of departures of the scenario
+        expect (dict): The limits the run has to meet
+    """
+
+    def __init__(self, path: str):
+        with open(path) as file:
+            try:
+                scenario = json.load(file)
+            except json.JSONDecodeError as error:
+                raise ScenarioError(f"{path} is not valid JSON: {error}")
+        directory = os.path.dirname(os.path.abspath(path))
+        try:
+            self.name = scenario.get(
+                "name", os.path.splitext(os.path.basename(path))[0]
+            )
+            self.duration = float(scenario["duration"])
+            self.dt = float(scenario.get("dt", DEFAULT_DT))
+            if self.duration <= 0 or self.dt <= 0:
+                raise ScenarioError("duration and dt have to be positive")
+            self.integrator = None
+            if scenario.get("integrator") is not None:
+                self.integrator = AdaptiveIntegrator(**scenario["integrator"])
+            self.expect = scenario.get("expect", {})
+            unknown = set(self.expect) - set(EXPECTATIONS)
+            if len(unknown) > 0:
+                raise ScenarioError(
+                    f"Unknown expectations {', '.join(sorted(unknown))}"
+                )
+
+            self.network = RailNetwork()
+            self.buildNetwork(scenario["network"], directory)
+            departures = []
+            if "timetable" in scenario:
+                departures.extend(
+                    loadTimetable(os.path.join(directory, scenario["timetable"]))
+                )
+            for train in scenario.get("trains", []):
+                departure = train["departure"]
+                departures.append(
+                    Departure(
+                        str(train["train_id"]),
+                        train["type"],
+                        int(train["origin"]),
+                        [int(stop) for stop in train["stops"]],
+                        parseTime(departure)
+                        if isinstance(departure, str)
+                        else float(departure),
+                    )
+                )
+            self.validateDepartures(departures)
+            switch_settings = [
+                tuple(setting) for setting in scenario.get("switch_settings", [])
+            ]
+            if scenario.get("plan", False):
+                planned = []
+                for run in ReservationPlanner(self.network).plan(departures):
+                    planned.append(run.getDeparture())
+                    switch_settings.extend(run.switch_settings)
+                departures = planned
+            for node_id, state in scenario.get("switch_states", {}).items():
+                self.network.setSwitchState(self.network.getNode(int(node_id)), state)
+
+            self.dispatcher = Dispatcher(self.network, departures)
+            for setting_time, node_id, state in switch_settings:
+                self.dispatcher.addSwitchSetting(
+                    float(setting_time), int(node_id), int(state)
+                )
+            self.departure_count = len(departures)
+        except KeyError as error:
+            raise ScenarioError(f"{path} misses the key {error}")
+        except (
+            AttributeError,
+            TypeError,
+            ValueError,
+            IndexError,
+            OSError,
+        ) as error:
+            raise ScenarioError(f"{path} cannot be loaded: {error}")
+
+    def validateDepartures(self, departures: list):
+        """
+        Checks that the origin and the stops of every departure are nodes of the network and that every stop can be
+        reached from the one before, so that no departure fails or runs forever during the run
+
+        Raises:
+            ScenarioError: If a departure cannot be routed
+        """
+        for departure in departures:
+            if len(departure.stops) == 0:
+                raise ScenarioError(f"Train {departure.train_id} has no stops")
+            for node_id in [departure.origin] + list(departure.stops):
+                if not self.network.hasNode(node_id):
+                    raise ScenarioError(
+                        f"Train {departure.train_id} uses the unknown node {node_id}"
+                    )
+            previous_id = departure.origin
+            for stop in departure.stops:
+                previous_stop = self.network.getNode(previous_id)
+                next_stop = self.network.getNode(stop)
+                if next_stop.id != previous_stop.id and (
+                    len(self.network.findRoute(previous_stop, next_stop)) == 0
+                ):
+                    raise ScenarioError(
+                        f"Train {departure.train_id} cannot reach node {stop} from "
+                        f"node {previous_id}"
+                    )
+                previous_id = stop
+
+    def buildNetwork(self, network: dict, directory: str):
+        if network == "sample":
+            buildSampleNetwork(self.network)
+        elif "import" in network:
+            options = dict(network)
+            path = os.path.join(directory, options.pop("import"))
+            importNetwork(self.network, path, **options)
+        else:
+            self.network.initNodesAndTracks(
+                network["nodes"],
+                network["adjacency_matrix"],
+                np.array(network["max_velocities_in_kmh"], dtype=float) / 3.6,
+            )
+
+
+class TrajectoryRecorder:
+    """
+    Collects the positions of all trains as columns, one row per train and sample
+    """
+
+    def __init__(self):
+        self.columns = {column: [] for column in TRAJECTORY_COLUMNS}
+
+    def record(self, simulated_time: float, trains: list):
+        for train in trains:
+            self.columns["time"].append(simulated_time)
+            self.columns["train_id"].append(train.id)
+            self.columns["x"].append(float(train.position[0]))
+            self.columns["y"].append(float(train.position[1]))
+            self.columns["velocity"].append(float(train.velocity))
+            self.columns["node_index"].append(train.cursor)
+
+    def write(self, path: str):
+        """
+        Writes the columns as CSV, as a JSON object of lists or as a NumPy .npz archive, chosen by the extension
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".json":
+            with open(path, "w") as file:
+                json.dump(self.columns, file)
+        elif extension == ".npz":
+            np.savez_compressed(
+                path,
+                **{column: np.array(values) for column, values in self.columns.items()},
+            )
+        else:
+            with open(path, "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(TRAJECTORY_COLUMNS)
+                writer.writerows(zip(*self.columns.values()))
+
+
+def checkExpectation(summary: dict, name: str, limit: float) -> bool:
+    """
+    Checks a limit of the scenario file against the summary of the run. Delay and punctuality limits are met by
+    runs without completed timetable routes.
+    """
+    delays = summary["statistics"]["delays"]
+    punctuality = summary["statistics"]["punctuality"]
+    if name == "min_arrived":
+        return summary["arrived"] >= limit
+    if name == "max_blocked_switches":
+        return summary["blocked_switches"] <= limit
+    if name == "max_mean_delay":
+        return delays["count"] == 0 or delays["mean"] <= limit
+    if name == "min_punctuality":
+        return punctuality is None or punctuality >= limit
+    raise ValueError(f"Unknown expectation {name}")
+
+
+def runScenario(
+    scenario: ScenarioRun,
+    recorder: TrajectoryRecorder = None,
+    sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+) -> dict:
+    """
+    Runs a loaded scenario and returns its summary
+
+    Args:
+        scenario (ScenarioRun): The scenario
+        recorder (TrajectoryRecorder, optional): Records the trains every sample_interval simulated seconds
+        sample_interval (float, optional): The simulated seconds between two samples
+
+    Returns:
+        dict: The summary metrics and the results of the expectations
+    """
+    statistics = OperationsStatistics(network=scenario.network)
+    engine = SimulationEngine(
+        scenario.network,
+        scenario.dispatcher,
+        step_rate=1,
+        global_speed=scenario.dt,
+        statistics=statistics,
+        integrator=scenario.integrator,
+    )
+    blocked = []
+    subscription = EVENT_BUS.subscribe(blocked.extend, (SwitchBlocked,))
+    step_count = int(round(scenario.duration / scenario.dt))
+    sample_steps = max(int(round(sample_interval / scenario.dt)), 1)
+    arrived = 0
+    start = time.perf_counter()
+    try:
+        for step in range(1, step_count + 1):
+            arrived += len(engine.advance(1))
+            if recorder is not None and step % sample_steps == 0:
+                recorder.record(engine.simulated_time, scenario.network.trains)
+    finally:
+        EVENT_BUS.unsubscribe(subscription)
+        statistics.detach()
+    wall_time = time.perf_counter() - start
+
+    summary = {
+        "scenario": scenario.name,
+        "duration": scenario.duration,
+        "dt": scenario.dt,
+        "steps": step_count,
+        "wall_time": wall_time,
+        "speedup": scenario.duration / wall_time if wall_time > 0 else None,
+        "departures": scenario.departure_count,
+        "arrived": arrived,
+        "running": len(scenario.network.trains),
+        "blocked_switches": len(blocked),
+        "statistics": statistics.getSummary(),
+    }
+    if scenario.integrator is not None:
+        summary["substeps"] = scenario.integrator.step_count
+    summary["expectations"] = {
+        name: {"limit": limit, "passed": checkExpectation(summary, name, limit)}
+        for name, limit in scenario.expect.items()
+    }
+    summary["passed"] = all(
+        result["passed"] for result in summary["expectations"].values()
+    )
+    return summary
+
+
+def main(arguments: list) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m model.runner", description="Runs a scenario file headlessly"
+    )
+    parser.add_argument("scenario", help="The scenario JSON file")
+    parser.add_argument(
+        "--summary", help="Writes the summary JSON to this file instead of stdout"
+    )
+    parser.add_argument(
+        "--trajectories",
+        help="Writes the trajectories to this .csv, .json or .npz file",
+    )
+    parser.add_argument(
+        "--sample-interval",
+        type=float,
+        default=DEFAULT_SAMPLE_INTERVAL,
+        help="The simulated seconds between two trajectory samples",
+    )
+    options = parser.parse_args(arguments)
+
+    try:
+        scenario = ScenarioRun(options.scenario)
+    except (ScenarioError, OSError) as error:
+        print(error, file=sys.stderr)
+        return EXIT_INVALID
+    recorder = TrajectoryRecorder() if options.trajectories is not None else None
+    summary = runScenario(scenario, recorder, options.sample_interval)
+
+    if recorder is not None:
+        recorder.write(options.trajectories)
+    if options.summary is not None:
+        with open(options.summary, "w") as file:
+            json.dump(summary, file, indent=2)
+    else:
+        print(json.dumps(summary, indent=2))
+    return EXIT_PASSED if summary["passed"] else EXIT_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
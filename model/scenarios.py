@@ -0,0 +1,164 @@
+"""
+Standard scenarios
+
+A Scenario is a reproducible simulation run: it builds its network, timetable and switch settings from scratch, so
+that different engines can be given exactly the same work.
+"""
+
+import os
+import random
+
+import numpy as np
+
+from model.nodes import Node
+from model.planner import ReservationPlanner
+from model.timetable import Departure
+from model.timetable import loadTimetable
+from model.tracks import Track
+
+ASSETS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "assets")
+SAMPLE_TIMETABLE_PATH = os.path.join(ASSETS_PATH, "timetable.csv")
+
+# The demo network of simulation.py
+SAMPLE_NODE_COORDINATES = [
+    [0, 0],
+    [0, 310],
+    [0, -40],
+    [0, -250],
+    [240, -160],
+    [0, -510],
+    [870, -160],
+    [0, 1120],
+]
+SAMPLE_ADJACENCY_MATRIX = [
+    [0, 4, 1, 0, 0, 0, 0, 0],
+    [4, 0, 0, 0, 0, 0, 0, 2],
+    [1, 0, 0, 1, 1, 0, 0, 0],
+    [0, 0, 1, 0, 1, 2, 0, 0],
+    [0, 0, 1, 1, 0, 0, 1, 0],
+    [0, 0, 0, 2, 0, 0, 0, 0],
+    [0, 0, 0, 0, 1, 0, 0, 0],
+    [0, 2, 0, 0, 0, 0, 0, 0],
+]
+SAMPLE_MAX_VELOCITIES_IN_KMH = np.array(
+    [100, 100, 80, 60, 80, 180, 200, 200, 200, 160, 320, 200, 160, 160]
+)
+# The positions in the node list of the end points and the junction of the demo network, between which the planned
+# scenario runs trains
+SAMPLE_TERMINALS = [0, 5, 6, 7]
+
+
+class Scenario:
+    """
+    A Scenario describes a simulation run that can be repeated with any engine
+
+    Attributes:
+        name (str): The name of the scenario
+        build: Called with an empty RailNetwork, adds the nodes and tracks and returns the departures and the
+            (time, node ID, state) switch settings of the run
+        duration (float): The simulated seconds the run lasts
+        step_rate (float): The number of steps per global_speed simulated seconds
+        global_speed (float): The number of simulated seconds per step_rate steps
+    """
+
+    def __init__(
+        self,
+        name: str,
+        build,
+        duration: float,
+        step_rate: float = 60,
+        global_speed: float = 5,
+    ):
+        self.name = name
+        self.build = build
+        self.duration = duration
+        self.step_rate = step_rate
+        self.global_speed = global_speed
+
+    def getStepCount(self) -> int:
+        return int(round(self.duration * self.step_rate / self.global_speed))
+
+
+def buildSampleNetwork(network):
+    network.initNodesAndTracks(
+        SAMPLE_NODE_COORDINATES,
+        SAMPLE_ADJACENCY_MATRIX,
+        SAMPLE_MAX_VELOCITIES_IN_KMH / 3.6,
+    )
+
+
+def buildSampleTimetable(network) -> tuple:
+    """
+    The demo network with the timetable of the assets
+    """
+    buildSampleNetwork(network)
+    return loadTimetable(SAMPLE_TIMETABLE_PATH), []
+
+
+def buildPlannedTraffic(network, train_count: int = 40, seed: int = 3) -> tuple:
+    """
+    The demo network with random departures between its terminals every 30 seconds, planned conflict-free
+    """
+    buildSampleNetwork(network)
+    terminals = [network.getNodeId(network.nodes[i]) for i in SAMPLE_TERMINALS]
+    generator = random.Random(seed)
+    requests = []
+    for i in range(train_count):
+        origin, destination = generator.sample(terminals, 2)
+        requests.append(
+            Departure(
+                f"P{i}",
+                generator.choice(["RegionalTrain", "CargoTrain", "LongDistanceTrain"]),
+                origin,
+                [destination],
+                i * 30.0,
+            )
+        )
+    departures = []
+    switch_settings = []
+    for run in ReservationPlanner(network).plan(requests):
+        departures.append(run.getDeparture())
+        switch_settings.extend(run.switch_settings)
+    return departures, switch_settings
+
+
+def buildGrid(
+    network,
+    size: int = 16,
+    spacing: float = 400,
+    corridor_spacing: int = 3,
+    train_count: int = 150,
+    seed: int = 7,
+) -> tuple:
+    """
+    A grid of corridors with crossings but no switches and many trains on shortest routes between random nodes
+    """
+    nodes = [
+        [Node((i * spacing, j * spacing)) for j in range(size)] for i in range(size)
+    ]
+    tracks = []
+    for i in range(size):
+        for j in range(size):
+            if i + 1 < size and j % corridor_spacing == 0:
+                tracks.append(Track(nodes[i][j], nodes[i + 1][j], 120 / 3.6))
+            if j + 1 < size and i % corridor_spacing == 0:
+                tracks.append(Track(nodes[i][j], nodes[i][j + 1], 160 / 3.6))
+    network.addBulk([node for row in nodes for node in row], tracks)
+    connected = [
+        network.getNodeId(node) for node in network.nodes if len(node.adj_nodes) > 0
+    ]
+    generator = random.Random(seed)
+    departures = []
+    for i in range(train_count):
+        origin, destination = generator.sample(connected, 2)
+        departures.append(
+            Departure(f"G{i}", "RegionalTrain", origin, [destination], i * 4.0)
+        )
+    return departures, []
+
+
+STANDARD_SCENARIOS = [
+    Scenario("timetable", buildSampleTimetable, 1800),
+    Scenario("planned", buildPlannedTraffic, 1800),
+    Scenario("grid", buildGrid, 900),
+]
@@ -0,0 +1,369 @@
+import time
+from multiprocessing import resource_tracker
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from model.nodes import Node
+from model.nodes import SimpleSwitch
+from model.storage import STORAGE
+from model.tracks import Track
+
+"""
+Shared memory layout
+
+The network block holds the static geometry, written once by the engine:
+    NETWORK_HEADER, node coordinates (float64, n x 2), node flags (uint8, n),
+    track endpoints as indices into the exported nodes (int32, m x 2), track flags (uint8, m)
+The state block holds the latest frame, rewritten after every step:
+    STATE_HEADER, train IDs (S16, c), positions (float64, c x 2), directions (float64, c x 2),
+    velocities (float64, c), track indices into the exported tracks (int32, c), switch states (int8, n)
+Every array starts at a multiple of ALIGNMENT.
+
+The generation counter in the state header works as a sequence lock: it is odd while the writer changes the
+frame and even once the frame is complete. Readers copy the frame and retry if the generation was odd or
+changed in the meantime, backing off up to MAX_READ_BACKOFF seconds between attempts and giving up after a timeout,
+e.g. when the writer died in the middle of a frame.
+
+Train IDs are stored as at most TRAIN_ID_LENGTH bytes of UTF-8, longer IDs are rejected by the writer.
+"""
+
+ALIGNMENT = 64
+TRAIN_ID_LENGTH = 16
+DEFAULT_TRAIN_CAPACITY = 4096
+DEFAULT_READ_TIMEOUT = 1.0
+MAX_READ_BACKOFF = 1e-3
+
+NODE_LISTED = 1
+NODE_SWITCH = 2
+TRACK_RAMP = 1
+
+NETWORK_HEADER = np.dtype([("nodes", "<u4"), ("tracks", "<u4")])
+STATE_HEADER = np.dtype(
+    [
+        ("generation", "<u8"),
+        ("capacity", "<u4"),
+        ("count", "<u4"),
+        ("nodes", "<u4"),
+        ("simulated_time", "<f8"),
+    ]
+)
+
+
+def align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def layoutArrays(buffer, specification: list) -> list:
+    """
+    Places arrays one after another into a buffer
+
+    Args:
+        buffer: The buffer of the shared memory block, or None to only compute the size
+        specification (list): The (dtype, shape) of every array
+
+    Returns:
+        list: The arrays, followed by the total size in bytes
+    """
+    arrays = []
+    offset = 0
+    for dtype, shape in specification:
+        offset = align(offset)
+        dtype = np.dtype(dtype)
+        if buffer is not None:
+            arrays.append(np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset))
+        offset += dtype.itemsize * int(np.prod(shape))
+    arrays.append(offset)
+    return arrays
+
+
+def networkSpecification(nodes: int, tracks: int) -> list:
+    return [
+        (NETWORK_HEADER, (1,)),
+        ("<f8", (nodes, 2)),
+        ("<u1", (nodes,)),
+        ("<i4", (tracks, 2)),
+        ("<u1", (tracks,)),
+    ]
+
+
+def stateSpecification(capacity: int, nodes: int) -> list:
+    return [
+        (STATE_HEADER, (1,)),
+        (f"S{TRAIN_ID_LENGTH}", (capacity,)),
+        ("<f8", (capacity, 2)),
+        ("<f8", (capacity, 2)),
+        ("<f8", (capacity,)),
+        ("<i4", (capacity,)),
+        ("<i1", (nodes,)),
+    ]
+
+
+def createBlock(name: str, size: int) -> shared_memory.SharedMemory:
+    """
+    Creates a shared memory block. A block with the same name may belong to a running export, so it is left alone.
+
+    Raises:
+        FileExistsError: If a block with the name already exists
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        raise FileExistsError(
+            f"The shared memory block {name} already exists, another export may be running"
+        ) from None
+
+
+def attachBlock(name: str) -> shared_memory.SharedMemory:
+    """
+    Attaches to an existing shared memory block without letting the resource tracker of this process remove
+    the block when the process ends
+    """
+    block = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(block._name, "shared_memory")
+    return block
+
+
+class SharedStateWriter:
+    """
+    The SharedStateWriter publishes the network geometry and the state of every step into shared memory, so that
+    read-only viewers in other processes can map it without copying it through sockets.
+
+    Attributes:
+        name (str): The prefix of the names of the two shared memory blocks
+        node_ids (np.ndarray): The storage ID of every exported node
+        track_indices (np.ndarray): The index in the exported tracks of every storage track ID, -1 if not exported
+        capacity (int): The maximum number of trains per frame
+    """
+
+    def __init__(
+        self, name: str, network, train_capacity: int = DEFAULT_TRAIN_CAPACITY
+    ):
+        self.name = name
+        self.capacity = train_capacity
+
+        tracks = network.tracks + network.ramps
+        tracks.sort(key=lambda track: STORAGE.connection_order[track.id])
+        track_ids = np.array([track.id for track in tracks], dtype=np.int64)
+        listed_ids = np.array([node.id for node in network.nodes], dtype=np.int64)
+        endpoints = STORAGE.endpoints[track_ids].reshape(-1, 2)
+        self.node_ids = np.unique(np.concatenate((listed_ids, endpoints.ravel())))
+        self.track_indices = np.full(STORAGE.getTrackCount(), -1, dtype=np.int32)
+        self.track_indices[track_ids] = np.arange(len(track_ids))
+
+        size = layoutArrays(None, networkSpecification(len(self.node_ids), len(tracks)))[-1]
+        self.network_block = createBlock(f"{name}_network", size)
+        header, coordinates, node_flags, track_endpoints, track_flags, _ = layoutArrays(
+            self.network_block.buf,
+            networkSpecification(len(self.node_ids), len(tracks)),
+        )
+        header["nodes"] = len(self.node_ids)
+        header["tracks"] = len(tracks)
+        coordinates[:] = STORAGE.coordinates[self.node_ids]
+        node_flags[:] = 0
+        node_flags[np.searchsorted(self.node_ids, listed_ids)] |= NODE_LISTED
+        for i, node_id in enumerate(self.node_ids.tolist()):
+            if isinstance(STORAGE.node_handles[node_id], SimpleSwitch):
+                node_flags[i] |= NODE_SWITCH
+        track_endpoints[:] = np.searchsorted(self.node_ids, endpoints)
+        ramps = set(track.id for track in network.ramps)
+        track_flags[:] = [TRACK_RAMP if track.id in ramps else 0 for track in tracks]
+
+        size = layoutArrays(None, stateSpecification(train_capacity, len(self.node_ids)))[-1]
+        try:
+            self.state_block = createBlock(f"{name}_state", size)
+        except FileExistsError:
+            del header, coordinates, node_flags, track_endpoints, track_flags
+            self.network_block.close()
+            self.network_block.unlink()
+            raise
+        (
+            self.header,
+            self.train_ids,
+            self.positions,
+            self.directions,
+            self.velocities,
+            self.track_ids,
+            self.switch_states,
+            _,
+        ) = layoutArrays(
+            self.state_block.buf, stateSpecification(train_capacity, len(self.node_ids))
+        )
+        self.header["generation"] = 0
+        self.header["capacity"] = train_capacity
+        self.header["nodes"] = len(self.node_ids)
+
+    def write(self, network, simulated_time: float):
+        """
+        Writes the current state of the network as a new frame
+
+        Args:
+            network (RailNetwork): The network whose state is written
+            simulated_time (float): The current simulated time
+
+        Raises:
+            ValueError: If a train ID is longer than TRAIN_ID_LENGTH bytes, the previous frame is kept
+        """
+        trains = network.trains[: self.capacity]
+        count = len(trains)
+        # Truncated IDs could collide, so they are checked before the frame is opened
+        train_ids = [train.id.encode() for train in trains]
+        for train_id in train_ids:
+            if len(train_id) > TRAIN_ID_LENGTH:
+                raise ValueError(
+                    f"The train ID {train_id.decode()} is longer than {TRAIN_ID_LENGTH} bytes"
+                )
+        self.header["generation"] += 1
+        for i, train in enumerate(trains):
+            self.train_ids[i] = train_ids[i]
+            self.positions[i] = train.position
+            self.directions[i] = train.getTrainDirection()
+            self.velocities[i] = train.velocity
+            if train.track is None or train.track.id >= len(self.track_indices):
+                self.track_ids[i] = -1
+            else:
+                self.track_ids[i] = self.track_indices[train.track.id]
+        self.switch_states[:] = STORAGE.switch_states[self.node_ids]
+        self.header["count"] = count
+        self.header["simulated_time"] = simulated_time
+        self.header["generation"] += 1
+
+    def close(self):
+        """
+        Releases and removes the shared memory blocks, which were created by this writer
+        """
+        del self.header, self.train_ids, self.positions, self.directions
+        del self.velocities, self.track_ids, self.switch_states
+        for block in (self.network_block, self.state_block):
+            block.close()
+            block.unlink()
+
+
+class SharedStateReader:
+    """
+    The SharedStateReader maps the blocks of a SharedStateWriter. The arrays of the state block are zero-copy views,
+    read() copies a consistent frame out of them.
+
+    Attributes:
+        coordinates (np.ndarray): The coordinates of the exported nodes
+        node_flags (np.ndarray): The NODE_LISTED and NODE_SWITCH flags of the exported nodes
+        track_endpoints (np.ndarray): The indices of the exported nodes every track connects
+        track_flags (np.ndarray): The TRACK_RAMP flag of every track
+    """
+
+    def __init__(self, name: str):
+        self.network_block = attachBlock(f"{name}_network")
+        header = np.ndarray(1, dtype=NETWORK_HEADER, buffer=self.network_block.buf)
+        (
+            _,
+            self.coordinates,
+            self.node_flags,
+            self.track_endpoints,
+            self.track_flags,
+            _,
+        ) = layoutArrays(
+            self.network_block.buf,
+            networkSpecification(int(header["nodes"][0]), int(header["tracks"][0])),
+        )
+
+        self.state_block = attachBlock(f"{name}_state")
+        header = np.ndarray(1, dtype=STATE_HEADER, buffer=self.state_block.buf)
+        (
+            self.header,
+            self.train_ids,
+            self.positions,
+            self.directions,
+            self.velocities,
+            self.track_ids,
+            self.switch_states,
+            _,
+        ) = layoutArrays(
+            self.state_block.buf,
+            stateSpecification(int(header["capacity"][0]), int(header["nodes"][0])),
+        )
+
+    def read(self, timeout: float = DEFAULT_READ_TIMEOUT) -> dict:
+        """
+        Copies the latest complete frame
+
+        Args:
+            timeout (float, optional): The seconds after which the reader stops waiting for a complete frame
+
+        Returns:
+            dict: The simulated time, train IDs, positions, directions, velocities, track IDs and switch states
+
+        Raises:
+            TimeoutError: If no complete frame could be copied within the timeout
+        """
+        deadline = time.monotonic() + timeout
+        backoff = 0.0
+        while True:
+            generation = int(self.header["generation"][0])
+            if generation % 2 == 1:
+                backoff = self.waitForWriter(deadline, backoff)
+                continue
+            count = int(self.header["count"][0])
+            frame = {
+                "simulated_time": float(self.header["simulated_time"][0]),
+                "train_ids": [train_id.decode() for train_id in self.train_ids[:count]],
+                "positions": self.positions[:count].copy(),
+                "directions": self.directions[:count].copy(),
+                "velocities": self.velocities[:count].copy(),
+                "track_ids": self.track_ids[:count].copy(),
+                "switch_states": self.switch_states.copy(),
+            }
+            if int(self.header["generation"][0]) == generation:
+                return frame
+            backoff = self.waitForWriter(deadline, backoff)
+
+    def waitForWriter(self, deadline: float, backoff: float) -> float:
+        """
+        Yields to the writer before the next attempt to read a frame, sleeping longer after every failed attempt
+
+        Returns:
+            float: The backoff for the next attempt
+        """
+        if time.monotonic() > deadline:
+            raise TimeoutError(
+                "No complete frame could be read, the writer may have stopped in the middle of a frame"
+            )
+        time.sleep(backoff)
+        return min(max(backoff * 2, 1e-5), MAX_READ_BACKOFF)
+
+    def buildNetwork(self, network):
+        """
+        Recreates the exported geometry in a network of this process, so that it can be drawn by the Map.
+
+        Args:
+            network (RailNetwork): The empty network to fill
+
+        Returns:
+            list: The local node of every exported node
+        """
+        nodes = []
+        for coordinates, flags in zip(self.coordinates, self.node_flags.tolist()):
+            if flags & NODE_SWITCH:
+                node = SimpleSwitch(coordinates)
+            else:
+                node = Node(coordinates)
+            nodes.append(node)
+            if flags & NODE_LISTED:
+                network.addNode(node)
+        for (from_index, to_index), flags in zip(
+            self.track_endpoints.tolist(), self.track_flags.tolist()
+        ):
+            track = Track(nodes[from_index], nodes[to_index])
+            track.connect()
+            if flags & TRACK_RAMP:
+                network.ramps.append(track)
+            else:
+                network.tracks.append(track)
+        network.registerTracks(network.tracks + network.ramps)
+        return nodes
+
+    def close(self):
+        del self.coordinates, self.node_flags, self.track_endpoints, self.track_flags
+        del self.header, self.train_ids, self.positions, self.directions
+        del self.velocities, self.track_ids, self.switch_states
+        self.network_block.close()
+        self.state_block.close()
@@ -0,0 +1,268 @@
+import json
+
+from model.events import EVENT_BUS
+from model.events import NodeReached
+from model.events import RouteCompleted
+from model.events import TrackCleared
+from model.events import TrackEntered
+from model.storage import STORAGE
+
+DEFAULT_PUNCTUALITY_THRESHOLD = 180
+DEFAULT_EXPORT_INTERVAL = 300
+
+
+class RunningMean:
+    """
+    The mean, variance and extremes of a series of values, updated in O(1) per value with Welford's method
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.squared_deviations = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.squared_deviations += delta * (value - self.mean)
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def getVariance(self) -> float:
+        if self.count < 2:
+            return 0.0
+        return self.squared_deviations / (self.count - 1)
+
+    def toDict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "variance": self.getVariance(),
+            "min": self.minimum,
+            "max": self.maximum,
+        }
+
+
+class OperationsStatistics:
+    """
+    The OperationsStatistics keep running aggregates of the operation of the network. They subscribe to the
+    node-reached, track-entered, track-cleared and route-completed events of all trains and update every aggregate in O(1) per
+    event, so the current values can be queried or exported at any time.
+
+    Delays are measured at the end of a route against the scheduled departure plus the shortest running time of
+    the route's speed profile.
+
+    Attributes:
+        time (float): The current simulated time, set by the engine before every step
+        track_occupancy (dict): The seconds every track has been occupied by at least one train, from the head entering
+            it until the tail clearing it, by track ID
+        track_passages (dict): How often a train entered every track, by track ID
+        node_arrivals (dict): How often a train reached every node, by node ID
+        type_distance (dict): The distance driven by all trains of a type in meters, by type name
+        type_time (dict): The time spent driving by all trains of a type in seconds, by type name
+        delays (RunningMean): The delays of all completed timetable routes in seconds
+        punctual (int): The number of completed timetable routes with a delay up to punctuality_threshold
+        punctuality_threshold (float): The highest delay in seconds that still counts as punctual
+        export_path (str): The file the summary is appended to as JSON lines every export_interval, optional
+        network (RailNetwork): Translates the storage IDs of the aggregates into the IDs of this network in the
+            summary, optional
+    """
+
+    def __init__(
+        self,
+        punctuality_threshold: float = DEFAULT_PUNCTUALITY_THRESHOLD,
+        export_path: str = None,
+        export_interval: float = DEFAULT_EXPORT_INTERVAL,
+        network=None,
+    ):
+        self.time = 0.0
+        self.track_occupancy = {}
+        self.track_passages = {}
+        self.node_arrivals = {}
+        self.type_distance = {}
+        self.type_time = {}
+        self.delays = RunningMean()
+        self.punctual = 0
+        self.punctuality_threshold = punctuality_threshold
+        self.export_path = export_path
+        self.export_interval = export_interval
+        self.next_export = export_interval
+        self.network = network
+        # The IDs of the tracks beneath every train, the number of trains on every occupied track and the time it
+        # became occupied, and the time and node every train reached last
+        self.train_tracks = {}
+        self.track_trains = {}
+        self.occupied_since = {}
+        self.node_entries = {}
+        self.subscription = None
+
+    def attach(self):
+        """
+        Subscribes to the events of all trains
+        """
+        if self.subscription is None:
+            self.subscription = EVENT_BUS.subscribe(
+                self.handleEvents,
+                (NodeReached, TrackEntered, TrackCleared, RouteCompleted),
+            )
+
+    def detach(self):
+        if self.subscription is not None:
+            EVENT_BUS.unsubscribe(self.subscription)
+            self.subscription = None
+
+    def handleEvents(self, events: list):
+        for event in events:
+            if isinstance(event, TrackEntered):
+                self.trackEntered(event)
+            elif isinstance(event, TrackCleared):
+                self.leaveTrack(event.train.id, event.track.id, event.time)
+            elif isinstance(event, NodeReached):
+                self.nodeReached(event)
+            elif isinstance(event, RouteCompleted):
+                self.routeCompleted(event)
+
+    def setTime(self, time: float):
+        """
+        Advances the clock of the statistics and exports the summary if the export interval has passed
+        """
+        self.time = time
+        if self.export_path is not None and time >= self.next_export:
+            self.export(self.export_path)
+            self.next_export = time + self.export_interval
+
+    def leaveTrack(self, train_id: str, track_id: int, time: float):
+        """
+        Removes a train from a track and adds the occupied time once the last train left it
+        """
+        tracks = self.train_tracks.get(train_id)
+        if tracks is None or track_id not in tracks:
+            return
+        tracks.remove(track_id)
+        if len(tracks) == 0:
+            del self.train_tracks[train_id]
+        self.track_trains[track_id] -= 1
+        if self.track_trains[track_id] == 0:
+            del self.track_trains[track_id]
+            self.track_occupancy[track_id] = (
+                self.track_occupancy.get(track_id, 0.0)
+                + time
+                - self.occupied_since.pop(track_id)
+            )
+
+    def trackEntered(self, event: TrackEntered):
+        track_id = event.track.id
+        self.track_passages[track_id] = self.track_passages.get(track_id, 0) + 1
+        tracks = self.train_tracks.setdefault(event.train.id, set())
+        if track_id in tracks:
+            return
+        tracks.add(track_id)
+        self.track_trains[track_id] = self.track_trains.get(track_id, 0) + 1
+        if self.track_trains[track_id] == 1:
+            self.occupied_since[track_id] = event.time
+
+    def nodeReached(self, event: NodeReached):
+        train = event.train
+        node = event.node
+        self.node_arrivals[node.id] = self.node_arrivals.get(node.id, 0) + 1
+
+        entry = self.node_entries.get(train.id)
+        if entry is not None:
+            entry_time, previous_node = entry
+            train_type = type(train).__name__
+            self.type_distance[train_type] = self.type_distance.get(
+                train_type, 0.0
+            ) + previous_node.getDistanceToNode(node)
+            self.type_time[train_type] = (
+                self.type_time.get(train_type, 0.0) + event.time - entry_time
+            )
+        self.node_entries[train.id] = (event.time, node)
+
+    def routeCompleted(self, event: RouteCompleted):
+        train = event.train
+        # The train leaves the network, so all tracks beneath it are cleared
+        for track_id in list(self.train_tracks.get(train.id, ())):
+            self.leaveTrack(train.id, track_id, event.time)
+        self.node_entries.pop(train.id, None)
+        if train.scheduled_departure is None or train.speed_profile is None:
+            return
+        delay = event.time - (
+            train.scheduled_departure + train.speed_profile.getRunningTime()
+        )
+        self.delays.add(delay)
+        if delay <= self.punctuality_threshold:
+            self.punctual += 1
+
+    def getAverageSpeeds(self) -> dict:
+        """
+        Returns the average speed of every train type in m/s
+        """
+        return {
+            train_type: self.type_distance[train_type] / time
+            for train_type, time in self.type_time.items()
+            if time > 0
+        }
+
+    def getTrackUtilization(self) -> dict:
+        """
+        Returns the share of the simulated time every track has been occupied, by track ID
+        """
+        if self.time <= 0:
+            return {}
+        occupancy = dict(self.track_occupancy)
+        for track_id, since in self.occupied_since.items():
+            occupancy[track_id] = occupancy.get(track_id, 0.0) + self.time - since
+        return {track_id: seconds / self.time for track_id, seconds in occupancy.items()}
+
+    def getPunctuality(self) -> float:
+        """
+        Returns the share of completed timetable routes that were punctual, None if none was completed
+        """
+        if self.delays.count == 0:
+            return None
+        return self.punctual / self.delays.count
+
+    def getTrackKeys(self, values: dict) -> dict:
+        """
+        Returns values of tracks by the network IDs of the tracks, if a network is set
+        """
+        if self.network is None:
+            return values
+        return {
+            self.network.getTrackId(STORAGE.track_handles[track_id]): value
+            for track_id, value in values.items()
+        }
+
+    def getNodeKeys(self, values: dict) -> dict:
+        """
+        Returns values of nodes by the network IDs of the nodes, if a network is set
+        """
+        if self.network is None:
+            return values
+        return {
+            self.network.getNodeId(STORAGE.node_handles[node_id]): value
+            for node_id, value in values.items()
+        }
+
+    def getSummary(self) -> dict:
+        return {
+            "time": self.time,
+            "track_utilization": self.getTrackKeys(self.getTrackUtilization()),
+            "track_passages": self.getTrackKeys(self.track_passages),
+            "node_arrivals": self.getNodeKeys(self.node_arrivals),
+            "average_speeds": self.getAverageSpeeds(),
+            "delays": self.delays.toDict(),
+            "punctuality": self.getPunctuality(),
+        }
+
+    def export(self, path: str):
+        """
+        Appends the current summary to a file as one JSON line
+        """
+        with open(path, "a") as file:
+            file.write(json.dumps(self.getSummary()) + "\n")
@@ -0,0 +1,438 @@
+import numpy as np
+
+from model.occupancy import TrackOccupancy
+
+INITIAL_CAPACITY = 1024
+MAX_SWITCH_STATES = 4
+MAX_SWITCH_PORTS = 8
+# The edited rows kept beside the compressed adjacency before it is rebuilt, at least the minimum or a share of nodes
+MIN_ADJACENCY_OVERFLOW = 1024
+ADJACENCY_OVERFLOW_SHARE = 1 / 16
+
+
+def grow(array: np.ndarray, size: int, fill_value=0) -> np.ndarray:
+    """
+    Returns an array with room for at least size rows. The capacity is doubled so that appending stays amortized O(1).
+
+    Args:
+        array (np.ndarray): The array to grow
+        size (int): The number of rows that are needed
+        fill_value (optional): The value of the new rows. Defaults to 0.
+
+    Returns:
+        np.ndarray: The array itself if it is large enough, otherwise a larger copy
+    """
+    if size <= len(array):
+        return array
+    capacity = max(size, 2 * len(array))
+    grown = np.full((capacity,) + array.shape[1:], fill_value, dtype=array.dtype)
+    grown[: len(array)] = array
+    return grown
+
+
+class NetworkStorage:
+    """
+    The NetworkStorage holds the data of all nodes and tracks in flat arrays. Node and Track objects are lightweight
+    handles that only know their index into these arrays. The adjacency of the nodes is kept in compressed sparse row
+    form. Single edits only rebuild the rows of the nodes they touch, which are kept in an overflow until enough of
+    them have piled up to rebuild the whole adjacency.
+
+    Attributes:
+        coordinates (np.ndarray): The coordinates of every node as a (capacity, 2) float matrix
+        switch_states (np.ndarray): The switch state of every node, only meaningful for switches
+        node_handles (List): The Node handle of every node index
+        node_labels (Dict): The human-readable labels of the nodes that were named or looked at, by node index
+        endpoints (np.ndarray): The indices of the two nodes of every track as a (capacity, 2) int matrix
+        max_velocities (np.ndarray): The maximum velocity of every track
+        connection_order (np.ndarray): The order in which tracks were connected to the network, -1 if never connected
+        track_handles (List): The Track handle of every track index
+        track_labels (Dict): The labels of the tracks that were named or looked at, by track index. A label can also be
+            a tuple of a parent track index and a suffix.
+        occupancies (Dict): The TrackOccupancy of every track that has been occupied, by track index
+        adjacency_offsets (np.ndarray): Where the adjacency of every node starts in adjacency_nodes and adjacency_tracks
+        adjacency_nodes (np.ndarray): The indices of the adjacent nodes, grouped by node
+        adjacency_tracks (np.ndarray): The indices of the tracks leading to the adjacent nodes, grouped by node
+        adjacency_pending (List): The tracks connected or disconnected since the adjacency was last updated
+        adjacency_overflow (Dict): The (nodes, tracks) rows of the nodes edited since the last rebuild, which replace
+            their rows in the compressed arrays
+        switch_slots (np.ndarray): The row of every node in the transition table, -1 for nodes that are no switches
+        transitions (np.ndarray): The (slot, state, entry index) -> exit index table of all switches, -1 where no
+            transition exists
+        switch_state_counts (np.ndarray): The number of configured states of every switch slot
+    """
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        self.coordinates = np.zeros((capacity, 2))
+        self.switch_states = np.zeros(capacity, dtype=np.int8)
+        self.node_handles = []
+        self.node_labels = {}
+
+        self.endpoints = np.zeros((capacity, 2), dtype=np.int32)
+        self.max_velocities = np.zeros(capacity)
+        self.connection_order = np.full(capacity, -1, dtype=np.int64)
+        self.track_handles = []
+        self.track_labels = {}
+        self.occupancies = {}
+        self.connections = 0
+
+        self.adjacency_offsets = np.zeros(1, dtype=np.int64)
+        self.adjacency_nodes = np.zeros(0, dtype=np.int32)
+        self.adjacency_tracks = np.zeros(0, dtype=np.int32)
+        self.adjacency_pending = []
+        self.adjacency_overflow = {}
+
+        self.switch_slots = np.full(capacity, -1, dtype=np.int32)
+        self.transitions = np.full(
+            (0, MAX_SWITCH_STATES, MAX_SWITCH_PORTS), -1, dtype=np.int8
+        )
+        self.switch_state_counts = np.zeros(0, dtype=np.int8)
+        self.switch_count = 0
+
+    def getNodeCount(self) -> int:
+        return len(self.node_handles)
+
+    def getTrackCount(self) -> int:
+        return len(self.track_handles)
+
+    def addNode(self, handle, coordinates) -> int:
+        """
+        Stores the coordinates of a new node
+
+        Args:
+            handle (Node): The handle that represents the node
+            coordinates (tuple): The coordinates of the node
+
+        Returns:
+            int: The index of the node
+        """
+        index = len(self.node_handles)
+        self.coordinates = grow(self.coordinates, index + 1)
+        self.switch_states = grow(self.switch_states, index + 1)
+        self.switch_slots = grow(self.switch_slots, index + 1, -1)
+        self.coordinates[index] = coordinates
+        self.node_handles.append(handle)
+        return index
+
+    def addTrack(self, handle, from_index: int, to_index: int, max_velocity) -> int:
+        """
+        Stores the endpoints and the maximum velocity of a new track. The track is not connected to its nodes yet.
+
+        Args:
+            handle (Track): The handle that represents the track
+            from_index (int): The index of the first node
+            to_index (int): The index of the second node
+            max_velocity: The maximum velocity on the track
+
+        Returns:
+            int: The index of the track
+        """
+        index = len(self.track_handles)
+        self.endpoints = grow(self.endpoints, index + 1)
+        self.max_velocities = grow(self.max_velocities, index + 1)
+        self.connection_order = grow(self.connection_order, index + 1, -1)
+        self.endpoints[index] = (from_index, to_index)
+        self.max_velocities[index] = max_velocity
+        self.track_handles.append(handle)
+        return index
+
+    def connectTrack(self, index: int):
+        """
+        Connects a track to its nodes, so that they become adjacent
+
+        Args:
+            index (int): The index of the track
+        """
+        if self.connection_order[index] < 0:
+            self.connection_order[index] = self.connections
+            self.connections += 1
+            self.adjacency_pending.append(index)
+
+    def disconnectTrack(self, index: int):
+        """
+        Removes a track from the adjacency of its nodes. The transition tables of switches at its ends are shifted
+        so that their remaining transitions keep pointing at the same tracks.
+
+        Args:
+            index (int): The index of the track
+        """
+        if self.connection_order[index] < 0:
+            return
+        for node in set(self.endpoints[index].tolist()):
+            slot = self.switch_slots[node]
+            if slot >= 0:
+                port = self.getAdjacency(node)[1].tolist().index(index)
+                self.removeSwitchPort(node, port)
+        self.connection_order[index] = -1
+        self.adjacency_pending.append(index)
+
+    def removeSwitchPort(self, index: int, port: int):
+        """
+        Drops an adjacency index from the transition table of a switch and renumbers the ones after it. States that
+        only connected the dropped index are removed as well, the current state keeps pointing at the same state.
+
+        Args:
+            index (int): The index of the switch node
+            port (int): The adjacency index of the track that is disconnected
+        """
+        slot = self.switch_slots[index]
+        count = self.switch_state_counts[slot]
+        table = self.transitions[slot, :count].astype(np.int16)
+        table = np.where(table == port, -1, np.where(table > port, table - 1, table))
+        table = np.delete(table, port, axis=1)
+        kept = np.flatnonzero((table >= 0).any(axis=1))
+        if len(kept) == 0:
+            kept = np.arange(count)
+        state = self.switch_states[index]
+        if state in kept:
+            self.switch_states[index] = int(np.searchsorted(kept, state))
+        else:
+            self.switch_states[index] = 0
+        self.transitions[slot] = -1
+        self.transitions[slot, : len(kept), :-1] = table[kept]
+        self.switch_state_counts[slot] = len(kept)
+
+    def buildAdjacency(self):
+        """
+        Rebuilds the compressed sparse row adjacency from the connected tracks. The adjacency of every node is ordered
+        by the time its tracks were connected.
+        """
+        self.adjacency_pending = []
+        self.adjacency_overflow = {}
+        track_count = len(self.track_handles)
+        connected = np.flatnonzero(self.connection_order[:track_count] >= 0)
+        endpoints = self.endpoints[connected]
+        order = self.connection_order[connected]
+
+        owners = np.concatenate((endpoints[:, 0], endpoints[:, 1]))
+        neighbours = np.concatenate((endpoints[:, 1], endpoints[:, 0]))
+        tracks = np.concatenate((connected, connected))
+        sorting = np.lexsort((np.concatenate((order, order)), owners))
+
+        self.adjacency_nodes = neighbours[sorting].astype(np.int32)
+        self.adjacency_tracks = tracks[sorting].astype(np.int32)
+        self.adjacency_offsets = np.zeros(len(self.node_handles) + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(owners, minlength=len(self.node_handles)),
+            out=self.adjacency_offsets[1:],
+        )
+
+    def updateAdjacency(self):
+        """
+        Applies the pending connections and disconnections. Only the rows of the nodes at their ends are rebuilt into
+        the overflow. Tracks connected last come last in a row, so the rows stay ordered by connection time. Bulk edits
+        and an overflow that outgrew ADJACENCY_OVERFLOW_SHARE of the nodes rebuild the whole adjacency instead.
+        """
+        pending = self.adjacency_pending
+        limit = max(
+            MIN_ADJACENCY_OVERFLOW,
+            int(len(self.node_handles) * ADJACENCY_OVERFLOW_SHARE),
+        )
+        if len(pending) + len(self.adjacency_overflow) > limit:
+            self.buildAdjacency()
+            return
+        self.adjacency_pending = []
+        changed = set(pending)
+        connected = sorted(
+            (track for track in changed if self.connection_order[track] >= 0),
+            key=lambda track: self.connection_order[track],
+        )
+        for node in set(self.endpoints[list(changed)].ravel().tolist()):
+            nodes, tracks = self.getRow(node)
+            row = [
+                (adjacent, track)
+                for adjacent, track in zip(nodes.tolist(), tracks.tolist())
+                if track not in changed
+            ]
+            for track in connected:
+                from_index, to_index = self.endpoints[track].tolist()
+                if from_index == node:
+                    row.append((to_index, track))
+                if to_index == node:
+                    row.append((from_index, track))
+            self.adjacency_overflow[node] = (
+                np.array([adjacent for adjacent, _ in row], dtype=np.int32),
+                np.array([track for _, track in row], dtype=np.int32),
+            )
+
+    def getRow(self, index: int):
+        """
+        Returns the current row of a node, from the overflow or from the compressed arrays
+        """
+        row = self.adjacency_overflow.get(index)
+        if row is not None:
+            return row
+        if index + 1 >= len(self.adjacency_offsets):
+            return self.adjacency_nodes[:0], self.adjacency_tracks[:0]
+        start, end = self.adjacency_offsets[index], self.adjacency_offsets[index + 1]
+        return self.adjacency_nodes[start:end], self.adjacency_tracks[start:end]
+
+    def getAdjacency(self, index: int):
+        """
+        Returns the adjacent node indices and the track indices leading to them for a node
+
+        Args:
+            index (int): The index of the node
+
+        Returns:
+            tuple: Two integer arrays with the adjacent nodes and the tracks to them
+        """
+        if len(self.adjacency_pending) > 0:
+            self.updateAdjacency()
+        return self.getRow(index)
+
+    def getTrackBetween(self, from_index: int, to_index: int):
+        """
+        Returns the handle of the first connected track between two nodes or None if they are not adjacent
+        """
+        nodes, tracks = self.getAdjacency(from_index)
+        for node, track in zip(nodes.tolist(), tracks.tolist()):
+            if node == to_index:
+                return self.track_handles[track]
+        return None
+
+    def setSwitchStates(self, index: int, states: list):
+        """
+        Writes the transition table of a switch. Every state is a list of pairs of adjacency indices that are
+        connected in that state, in both directions.
+
+        Args:
+            index (int): The index of the switch node
+            states (list): The connected pairs of every state
+        """
+        if len(states) > MAX_SWITCH_STATES:
+            raise ValueError(f"A switch can have at most {MAX_SWITCH_STATES} states")
+        slot = self.switch_slots[index]
+        if slot < 0:
+            slot = self.switch_count
+            self.switch_count += 1
+            self.transitions = grow(self.transitions, slot + 1, -1)
+            self.switch_state_counts = grow(self.switch_state_counts, slot + 1)
+            self.switch_slots[index] = slot
+        self.transitions[slot] = -1
+        for state, pairs in enumerate(states):
+            for entry, exit in pairs:
+                if max(entry, exit) >= MAX_SWITCH_PORTS:
+                    raise ValueError(
+                        f"A switch can have at most {MAX_SWITCH_PORTS} tracks"
+                    )
+                self.transitions[slot, state, entry] = exit
+                self.transitions[slot, state, exit] = entry
+        self.switch_state_counts[slot] = len(states)
+
+    def getSwitchStates(self, index: int) -> list:
+        """
+        Reads the connected pairs of every state of a switch back from the transition table
+        """
+        slot = self.switch_slots[index]
+        states = []
+        for state in range(self.switch_state_counts[slot]):
+            exits = self.transitions[slot, state].tolist()
+            states.append(
+                [(entry, exit) for entry, exit in enumerate(exits) if entry < exit]
+            )
+        return states
+
+    def getSwitchExit(self, index: int, entry: int) -> int:
+        """
+        Returns the adjacency index through which a train entering a switch at entry leaves it in the current state
+
+        Args:
+            index (int): The index of the switch node
+            entry (int): The adjacency index of the track the train comes from
+
+        Returns:
+            int: The adjacency index of the exit or -1 if there is no transition
+        """
+        slot = self.switch_slots[index]
+        if slot < 0 or not 0 <= entry < MAX_SWITCH_PORTS:
+            return -1
+        exit = int(self.transitions[slot, self.switch_states[index], entry])
+        if exit >= len(self.getAdjacency(index)[0]):
+            return -1
+        return exit
+
+    def resolveTransitions(self, indices: np.ndarray, entries: np.ndarray):
+        """
+        Resolves the transitions of many switches at once, for example for every train that stands on a switch.
+
+        Args:
+            indices (np.ndarray): The indices of the switch nodes
+            entries (np.ndarray): The adjacency index through which each train entered its switch
+
+        Returns:
+            tuple: The exit node indices and the exit track indices, -1 where a switch does not lead anywhere
+        """
+        # The lookup works on the compressed arrays only
+        if len(self.adjacency_pending) > 0 or len(self.adjacency_overflow) > 0:
+            self.buildAdjacency()
+        indices = np.asarray(indices)
+        entries = np.asarray(entries)
+        slots = self.switch_slots[indices]
+        valid = (slots >= 0) & (entries >= 0) & (entries < MAX_SWITCH_PORTS)
+        exits = np.where(
+            valid,
+            self.transitions[
+                np.where(valid, slots, 0),
+                self.switch_states[indices],
+                np.where(valid, entries, 0),
+            ],
+            -1,
+        )
+        degrees = self.adjacency_offsets[indices + 1] - self.adjacency_offsets[indices]
+        valid &= (exits >= 0) & (exits < degrees)
+        positions = np.where(valid, self.adjacency_offsets[indices] + exits, 0)
+        exit_nodes = np.where(valid, self.adjacency_nodes[positions], -1)
+        exit_tracks = np.where(valid, self.adjacency_tracks[positions], -1)
+        return exit_nodes, exit_tracks
+
+    def getTrackLabel(self, index: int) -> str:
+        """
+        Returns the label of a track, generating and storing it on first use
+
+        Args:
+            index (int): The index of the track
+
+        Returns:
+            str: The label of the track
+        """
+        label = self.track_labels.get(index)
+        if isinstance(label, str):
+            return label
+        if label is None:
+            label = f"Track No. {index}"
+        else:
+            parent, suffix = label
+            label = f"{self.getTrackLabel(parent)}{suffix}"
+        self.track_labels[index] = label
+        return label
+
+    def getOccupancy(self, index: int):
+        """
+        Returns the occupancy of a track, creating it when the track is first looked at
+
+        Args:
+            index (int): The index of the track
+        """
+        occupancy = self.occupancies.get(index)
+        if occupancy is None:
+            occupancy = TrackOccupancy()
+            self.occupancies[index] = occupancy
+        return occupancy
+
+
+STORAGE = NetworkStorage()
+
+
+def getNodeHandle(index: int):
+    """
+    Returns the canonical Node handle of an index. Used when handles are unpickled in another process that shares
+    the same storage, so that identity checks between handles keep working.
+    """
+    return STORAGE.node_handles[index]
+
+
+def getTrackHandle(index: int):
+    """
+    Returns the canonical Track handle of an index
+    """
+    return STORAGE.track_handles[index]
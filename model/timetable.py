@@ -0,0 +1,235 @@
+import csv
+import heapq
+
+from model.changes import ChangeKind
+from model.trains import LongDistanceTrain
+from model.trains import RegionalTrain
+from model.trains import CargoTrain
+
+TRAIN_TYPES = {
+    "LongDistanceTrain": LongDistanceTrain,
+    "RegionalTrain": RegionalTrain,
+    "CargoTrain": CargoTrain,
+}
+
+
+class Departure:
+    """
+    A Departure is a single scheduled run of a train
+
+    Attributes:
+        train_id (str): The ID of the train that is created for the run
+        train_type (str): The name of the train class, one of TRAIN_TYPES
+        origin (int): The ID of the node where the train starts
+        stops (List): The IDs of the nodes the train has to pass in order, the last one being its destination
+        departure_time (float): The simulated time of departure in seconds after midnight
+    """
+
+    def __init__(
+        self,
+        train_id: str,
+        train_type: str,
+        origin: int,
+        stops: list,
+        departure_time: float,
+    ):
+        if train_type not in TRAIN_TYPES:
+            raise ValueError(f"Unknown train type {train_type} for train {train_id}")
+        self.train_id = train_id
+        self.train_type = train_type
+        self.origin = origin
+        self.stops = stops
+        self.departure_time = departure_time
+
+
+def parseTime(time: str) -> float:
+    """
+    Converts a time of the form HH:MM, HH:MM:SS or plain seconds into seconds after midnight
+
+    Args:
+        time (str): The time to be converted
+
+    Returns:
+        float: The time in seconds
+    """
+    if ":" not in time:
+        return float(time)
+    seconds = 0.0
+    for part in time.split(":"):
+        seconds = seconds * 60 + float(part)
+    if time.count(":") == 1:
+        seconds *= 60
+    return seconds
+
+
+def loadTimetable(path: str) -> list:
+    """
+    Reads departures from a CSV file with the columns train_id, type, origin, stops and departure.
+    Origin and stops are node IDs, the stops separated by spaces.
+
+    Args:
+        path (str): The path of the timetable file
+
+    Returns:
+        list: The departures of the file
+    """
+    departures = []
+    with open(path, newline="") as file:
+        for row in csv.DictReader(file):
+            departures.append(
+                Departure(
+                    row["train_id"],
+                    row["type"],
+                    int(row["origin"]),
+                    [int(stop) for stop in row["stops"].split()],
+                    parseTime(row["departure"]),
+                )
+            )
+    return departures
+
+
+class Dispatcher:
+    """
+    The Dispatcher injects the trains of a timetable into the network at their departure time and retires
+    them once they arrived. Pending departures are kept in a heap ordered by departure time. It can also set
+    switches at scheduled times, so that planned routes are run without manual switching.
+
+    Attributes:
+        network (RailNetwork): The network the trains run on
+        departures (List): The heap of pending departures
+        switch_settings (List): The heap of pending (time, sequence, node ID, state) switch settings
+        active_trains (Dict): The trains that are currently running, by their ID
+        routes (Dict): The nodes of the shortest route between every (from, to) pair of node IDs that was dispatched,
+            dropped when tracks are added or removed
+    """
+
+    def __init__(self, network, departures: list = None):
+        self.network = network
+        self.departures = []
+        self.switch_settings = []
+        self.active_trains = {}
+        self.routes = {}
+        self.sequence = 0
+        network.addListener(self.handleNetworkChange)
+        if departures is not None:
+            for departure in departures:
+                self.departures.append(
+                    (departure.departure_time, self.sequence, departure)
+                )
+                self.sequence += 1
+            heapq.heapify(self.departures)
+
+    def handleNetworkChange(self, change):
+        if change.kind in (
+            ChangeKind.NODE_REMOVED,
+            ChangeKind.TRACK_ADDED,
+            ChangeKind.TRACK_REMOVED,
+        ):
+            self.routes.clear()
+
+    def addDeparture(self, departure: Departure):
+        """
+        Schedules a single departure
+
+        Args:
+            departure (Departure): The departure to schedule
+        """
+        heapq.heappush(
+            self.departures, (departure.departure_time, self.sequence, departure)
+        )
+        self.sequence += 1
+
+    def addSwitchSetting(self, time: float, node_id: int, state: int):
+        """
+        Schedules a switch to be set to a state
+
+        Args:
+            time (float): The simulated time at which the switch is set
+            node_id (int): The ID of the switch
+            state (int): The state the switch is set to
+        """
+        heapq.heappush(self.switch_settings, (time, self.sequence, node_id, state))
+        self.sequence += 1
+
+    def getNextDepartureTime(self) -> float:
+        """
+        Returns the time of the next pending departure or switch setting or None if there is none
+        """
+        times = [
+            heap[0][0]
+            for heap in (self.departures, self.switch_settings)
+            if len(heap) > 0
+        ]
+        if len(times) == 0:
+            return None
+        return min(times)
+
+    def update(self, time: float) -> list:
+        """
+        Sets the switches and creates the trains of all departures that are due at the given simulated time
+
+        Args:
+            time (float): The current simulated time in seconds
+
+        Returns:
+            list: The trains that departed
+        """
+        while len(self.switch_settings) > 0 and self.switch_settings[0][0] <= time:
+            _, _, node_id, state = heapq.heappop(self.switch_settings)
+            self.network.setSwitchState(self.network.getNode(node_id), state)
+        departed = []
+        while len(self.departures) > 0 and self.departures[0][0] <= time:
+            departure = heapq.heappop(self.departures)[2]
+            departed.append(self.dispatch(departure))
+        return departed
+
+    def dispatch(self, departure: Departure):
+        """
+        Creates the train of a departure, routes it over its stops and puts it on the network
+
+        Args:
+            departure (Departure): The departure that is due
+
+        Returns:
+            Train: The new train
+        """
+        origin = self.network.getNode(departure.origin)
+        train = TRAIN_TYPES[departure.train_type](departure.train_id, origin)
+        route = []
+        previous_stop = origin
+        for stop in departure.stops:
+            next_stop = self.network.getNode(stop)
+            route.extend(self.getRoute(previous_stop, next_stop))
+            previous_stop = next_stop
+        train.addRoute(route)
+        train.scheduled_departure = departure.departure_time
+        self.network.trains.append(train)
+        self.active_trains[train.id] = train
+        return train
+
+    def getRoute(self, from_node, to_node) -> tuple:
+        """
+        Returns the nodes of the shortest route between two nodes without from_node, searching it only once
+        """
+        key = (from_node.id, to_node.id)
+        route = self.routes.get(key)
+        if route is None:
+            route = tuple(self.network.findRoute(from_node, to_node))
+            self.routes[key] = route
+        return route
+
+    def retire(self, trains: list):
+        """
+        Removes arrived trains of the timetable from the network
+
+        Args:
+            trains (list): The trains that arrived
+        """
+        retired = []
+        for train in trains:
+            if self.active_trains.pop(train.id, None) is train:
+                for track in train.occupied_tracks:
+                    track.occupancy.release(train)
+                retired.append(train)
+        if len(retired) > 0:
+            self.network.removeTrains(retired)
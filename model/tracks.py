@@ -1,5 +1,10 @@
 import numpy as np
 from model.nodes import Node
+from model.storage import STORAGE
+from model.storage import getTrackHandle
+
+# The distance between parallel lanes and the length the lanes are shortened by at each end, in meters
+RAMP_LENGTH = 21
 
 """
 TO-DO:
@@ -12,18 +17,63 @@ TO-DO:
 
 class Track:
     """
-    A Track is a line where trains can ride on
+    A Track is a line where trains can ride on. The track itself is only a handle, its data lives in the global
+    NetworkStorage.
 
     Attributes:
-        id (str): The ID of the Track
-        nodes (np.ndarray): The two nodes that the track connects
+        id (int): The ID of the Track, which is also its index in the NetworkStorage
+        label (str): The human-readable name of the Track, by default built from its ID
+        nodes (tuple): The two nodes that the track connects
         max_velocity (int): The maximum velocity in km/h that a train can drive on this track. 180 km/h if kept empty.
+        occupancy (TrackOccupancy): The stretches of the track that are currently occupied by trains
     """
 
-    def __init__(self, id: str, from_node: Node, to_node: Node, max_velocity=180):
-        self.id = id
-        self.nodes = np.array((from_node, to_node))
-        self.max_velocity = max_velocity
+    __slots__ = ("id",)
+
+    def __init__(
+        self, from_node: Node, to_node: Node, max_velocity=180, label=None
+    ):
+        """
+        Args:
+            from_node (Node): The first node of the track
+            to_node (Node): The second node of the track
+            max_velocity (int, optional): The maximum velocity on the track. Defaults to 180.
+            label (optional): A label for the track or a tuple of a parent track id and a suffix that is appended to the
+                label of the parent once the label is needed. Defaults to a label built from the ID.
+        """
+        self.id = STORAGE.addTrack(self, from_node.id, to_node.id, max_velocity)
+        if label is not None:
+            STORAGE.track_labels[self.id] = label
+
+    @property
+    def label(self) -> str:
+        return STORAGE.getTrackLabel(self.id)
+
+    @property
+    def nodes(self) -> tuple:
+        from_index, to_index = STORAGE.endpoints[self.id].tolist()
+        return STORAGE.node_handles[from_index], STORAGE.node_handles[to_index]
+
+    @property
+    def max_velocity(self) -> float:
+        return STORAGE.max_velocities[self.id]
+
+    @max_velocity.setter
+    def max_velocity(self, max_velocity: float):
+        STORAGE.max_velocities[self.id] = max_velocity
+
+    @property
+    def occupancy(self):
+        return STORAGE.getOccupancy(self.id)
+
+    def __reduce__(self):
+        return getTrackHandle, (self.id,)
+
+    def connect(self):
+        """
+        Connects the track to its nodes, so that they become adjacent to each other
+        """
+        STORAGE.connectTrack(self.id)
 
     def getDirection(self, to_node: Node, from_node: Node = None) -> np.ndarray:
         """
@@ -43,6 +93,30 @@ class Track:
         translated_vector = to_node.coordinates - from_node.coordinates
         return translated_vector / np.linalg.norm(translated_vector)
 
+    def getLength(self) -> float:
+        """
+        Returns the length of the track
+
+        Returns:
+            float: The distance between the two nodes of the track
+        """
+        return self.nodes[0].getDistanceToNode(self.nodes[1])
+
+    def getOffset(self, node: Node, distance: float = 0) -> float:
+        """
+        Converts a distance measured from one of the track's nodes into an offset from the first node of the track
+
+        Args:
+            node (Node): The node from which the distance is measured
+            distance (float, optional): The distance along the track. Defaults to 0.
+
+        Returns:
+            float: The offset from the first node of the track
+        """
+        if node == self.nodes[0]:
+            return distance
+        return self.getLength() - distance
+
     def isParallel(self, other):
         """
         Checks if the track is parallel to another track
@@ -55,11 +129,14 @@ class Track:
         """
         if not isinstance(other, Track):
             return False
-        if all(self.nodes[i] == other.nodes[i] for i in range(2)):
+        if all(
+            np.array_equal(self.nodes[i].coordinates, other.nodes[i].coordinates)
+            for i in range(2)
+        ):
             return True
         return False
 
-    def getRampStructure(track, ramp_length: int = 21, to_right=True):
+    def getRampStructure(track, ramp_length: int = RAMP_LENGTH, to_right=True):
         """
         Creates a ramp structure for a track. The ramp structure consists of two ramp nodes and a track between them.
         The ramp nodes are connected to the track and the track is connected to the nodes of the original track.
@@ -70,29 +147,49 @@ class Track:
             to_right (bool, optional): If True, the ramp is created to the right of the track, if False, the ramp is created to the left of the track. Defaults to True.
         """
         from_node, to_node = track.nodes
-        direction = from_node.getDirectionTo(to_node)
-
-        if to_right:
-            perp_vector = [-direction[1], direction[0]]
-        else:
-            perp_vector = [direction[1], -direction[0]]
-
-        on_ramp_direction = direction + perp_vector
-        off_ramp_direction = -direction + perp_vector
-
-        on_ramp_coordinates = from_node.coordinates + on_ramp_direction * ramp_length
-        off_ramp_coordinates = to_node.coordinates + off_ramp_direction * ramp_length
-
-        on_ramp_node = Node(
-            f"RAMP{on_ramp_coordinates[0]} {on_ramp_coordinates[1]}",
-            on_ramp_coordinates,
-        )
-        off_ramp_node = Node(
-            f"RAMP{off_ramp_coordinates[0]} {off_ramp_coordinates[1]}",
-            off_ramp_coordinates,
+        on_ramp_coordinates, off_ramp_coordinates = getLaneCoordinates(
+            np.array([from_node.coordinates]),
+            np.array([to_node.coordinates]),
+            np.ones(1),
+            np.array([1 if to_right else -1]),
+            ramp_length,
         )
 
+        on_ramp_node = Node(on_ramp_coordinates[0])
+        off_ramp_node = Node(off_ramp_coordinates[0])
+
         return from_node, on_ramp_node, off_ramp_node, to_node
 
     def __str__(self):
-        return f"{self.id}          Coords. {self.nodes[0].coordinates} to {self.nodes[1].coordinates}"
+        return f"{self.label}          Coords. {self.nodes[0].coordinates} to {self.nodes[1].coordinates}"
+
+
+def getLaneCoordinates(
+    from_coordinates: np.ndarray,
+    to_coordinates: np.ndarray,
+    levels: np.ndarray,
+    sides: np.ndarray,
+    ramp_length: float = RAMP_LENGTH,
+) -> tuple:
+    """
+    Computes the end points of many parallel lanes at once. A lane of level L lies L * ramp_length beside its track
+    and is shortened by L * ramp_length at both ends, so that the ramps to it run at 45 degrees.
+
+    Args:
+        from_coordinates (np.ndarray): The (n, 2) coordinates of the first nodes of the tracks
+        to_coordinates (np.ndarray): The (n, 2) coordinates of the second nodes of the tracks
+        levels (np.ndarray): How many lanes away from its track each lane lies
+        sides (np.ndarray): 1 for lanes to the right of their track, -1 for lanes to the left
+        ramp_length (float, optional): The distance between neighbouring lanes in meters
+
+    Returns:
+        tuple: The (n, 2) coordinates of the on-ramp nodes and of the off-ramp nodes of the lanes
+    """
+    direction = to_coordinates - from_coordinates
+    direction = direction / np.linalg.norm(direction, axis=1)[:, np.newaxis]
+    perpendicular = np.column_stack((-direction[:, 1], direction[:, 0]))
+    perpendicular *= np.asarray(sides)[:, np.newaxis]
+    offsets = np.asarray(levels)[:, np.newaxis] * ramp_length
+    on_coordinates = from_coordinates + (direction + perpendicular) * offsets
+    off_coordinates = to_coordinates + (perpendicular - direction) * offsets
+    return on_coordinates, off_coordinates
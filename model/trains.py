@@ -1,12 +1,19 @@
 import numpy as np
-import pygame
 
 from model.nodes import Node
 from model.nodes import SimpleSwitch
 from model.tracks import Track
-from collections import deque
+from model.routes import getRoute
+from model.events import EVENT_BUS
+from model.events import NodeReached
+from model.events import RouteCompleted
+from model.events import SwitchBlocked
+from model.events import TrackCleared
+from model.events import TrackEntered
+from model.events import VelocityLimitChanged
 
-clock = pygame.time.Clock()
+CAR_LENGTH = 26
+WAGON_LENGTH = 15
 
 
 class Train:
@@ -16,14 +23,22 @@ class Train:
     Attributes:
         id (str): Used to identify a train
         home_node (Node): Node where the trains starts and will return to
-        route (Deque): A deque that holds the route the train is currently on
+        route (Route): The shared route the train is currently on, starting with the passed nodes still beneath it
+        cursor (int): The index of the node of the route the train passed last
+        trail_start (int): The index of the first passed node of the route that may still lie beneath the train
         number_cars (int): The number of cars in the train
         number_waggons (int): The number of waggons in the train
         color (pygame.Color): Color of the train
-        position (np.ndarray): Coordinates of the current position of the train
+        length (float): The physical length of the train in meters, derived from its cars and waggons
+        position (np.ndarray): Coordinates of the current position of the head of the train
+        tail_position (np.ndarray): Coordinates of the current position of the tail of the train
+        occupied_tracks (List): The tracks the train currently occupies, starting with the one under its head
+        speed_profile (SpeedProfile): The shared braking curves of the current route, its sections are indexed by
+            the cursor
         max_velocity (int): Maximum velocity the train can ride in meters per second
         velocity (int): The current velocity of the train in meter per second
         max_acceleration (int): Maximum acceleration the train can achieve in meters per second squared
+        scheduled_departure (float): The departure time of the train in the timetable, None if it has none
 
     """
 
@@ -39,27 +54,84 @@ class Train:
         self.id = id
         self.home_node = home_node
         self.track = None
-        self.route = deque()
-        self.route.append(home_node)
+        self.route = getRoute((home_node.id,))
+        self.cursor = 0
+        self.trail_start = 0
         self.previous_node = home_node
 
         self.number_wagons = number_wagons
         self.number_cars = number_cars
+        self.length = number_cars * CAR_LENGTH + number_wagons * WAGON_LENGTH
 
         self.position = home_node.coordinates
+        self.tail_position = home_node.coordinates
+        self.occupied_tracks = []
+        self.speed_profile = None
         self.max_velocity = max_velocity
         self.velocity = 0
         self.max_acceleration = max_acceleration
+        self.scheduled_departure = None
 
-    def getTrack(self, current_node) -> Track:
+    def setTrack(self, track: Track):
+        """
+        Sets the track under the head of the train and emits the events of the change
+
+        Args:
+            track (Track): The new track or None if the train stands in front of a blocked switch
+        """
+        previous_track = self.track
+        self.track = track
+        if track is previous_track:
+            return
+        if track is not None and EVENT_BUS.wants(TrackEntered):
+            EVENT_BUS.emit(TrackEntered(EVENT_BUS.time, self, track, previous_track))
+        if EVENT_BUS.wants(VelocityLimitChanged):
+            velocity_limit = self.getVelocityLimit(track)
+            previous_velocity_limit = self.getVelocityLimit(previous_track)
+            if velocity_limit != previous_velocity_limit:
+                EVENT_BUS.emit(
+                    VelocityLimitChanged(
+                        EVENT_BUS.time, self, velocity_limit, previous_velocity_limit
+                    )
+                )
+
+    def getVelocityLimit(self, track: Track) -> float:
+        """
+        Returns the highest velocity the train may drive on a track, 0 for no track
+        """
+        if track is None:
+            return 0
+        return min(float(track.max_velocity), self.max_velocity)
+
+    def getCurrentNode(self) -> Node:
+        """
+        Returns the node of the route the train passed last
+        """
+        return self.route[self.cursor]
+
+    def getNextNode(self) -> Node:
+        """
+        Returns the node of the route the train drives to, None if it has arrived
+        """
+        if self.getHasArrived():
+            return None
+        return self.route[self.cursor + 1]
+
+    def getRemainingRoute(self) -> list:
+        """
+        Returns the node the train passed last and the nodes it still has to pass
+        """
+        return self.route.getNodes(self.cursor)
+
+    def getTrack(self) -> Track:
         """
         Returns the track the train is currently on
 
         Returns:
             Track: The track the train is currently on
         """
-        if len(self.route) > 1:
-            return current_node.getTrackTo(next_node=self.route[1])
+        if not self.getHasArrived():
+            return self.route.getTrack(self.cursor)
         return None
 
     def getTrainDirection(self) -> np.ndarray:
@@ -69,10 +141,11 @@ class Train:
         returns:
             np.ndarray: Direction of the train
         """
-        if len(self.route) > 1:
-            return self.route[0].getDirectionTo(self.route[1])
+        current_node = self.getCurrentNode()
+        if not self.getHasArrived():
+            return current_node.getDirectionTo(self.route[self.cursor + 1])
         else:
-            return self.route[0].getDirectionTo(self.route[0].adj_nodes[0])
+            return current_node.getDirectionTo(current_node.adj_nodes[0])
 
     def getTargetVelocity(self, target_velocity: int) -> int:
         """
@@ -93,23 +166,32 @@ class Train:
         target_velocity = min(
             target_velocity, self.max_velocity, self.track.max_velocity
         )
+        if self.speed_profile is not None:
+            target_velocity = min(
+                target_velocity,
+                self.speed_profile.getTargetVelocity(
+                    self.cursor, self.getDistanceFromNode(self.getNextNode())
+                ),
+            )
         return target_velocity
 
     def getRouteLogs(self) -> str:
         string = f"{self.id} Route # "
-        for node in self.route:
-            string += f"# {node.id} \n "
+        for node in self.getRemainingRoute():
+            string += f"# {node.label} \n "
         return string
 
     def addRoute(self, nodes: list):
         """
-        Adds a list of nodes to the trains route
+        Adds a list of nodes to the trains route and looks up the speed profile of the resulting route
 
         Args:
             nodes (list): List of nodes to add to the route
         """
-        for node in nodes:
-            self.addNodeToRoute(node)
+        self.extendRoute(nodes)
+        self.speed_profile = self.route.getSpeedProfile(
+            self.max_velocity, self.max_acceleration
+        )
 
     def addNodeToRoute(self, node: Node):
         """
@@ -118,11 +200,32 @@ class Train:
         Args:
             node (Node): The node to add
         """
-        if node in self.route[-1].adj_nodes:
-            self.route.append(node)
-            self.has_arrived = False
-            if len(self.route) == 2:
-                self.track = self.route[0].getTrackTo(self.route[1])
+        self.extendRoute([node])
+
+    def extendRoute(self, nodes: list):
+        """
+        Switches the train to the route that continues its current one with those of the nodes that are adjacent to
+        their predecessor. Nodes that are no longer beneath the train are left out of the new route.
+
+        Args:
+            nodes (list): The nodes to add
+        """
+        node_ids = []
+        last_node = self.route[-1]
+        for node in nodes:
+            if node in last_node.adj_nodes:
+                node_ids.append(node.id)
+                last_node = node
+        if len(node_ids) == 0:
+            return
+        was_arrived = self.getHasArrived()
+        kept_node_ids = self.route.node_ids[self.trail_start :]
+        self.route = getRoute(kept_node_ids + tuple(node_ids))
+        self.cursor -= self.trail_start
+        self.trail_start = 0
+        self.has_arrived = False
+        if was_arrived:
+            self.setTrack(self.route.getTrack(self.cursor))
 
     def getHasArrived(self) -> bool:
         """
@@ -131,10 +234,7 @@ class Train:
         Returns:
             bool: True if there is a another destination in its route, False if there is not
         """
-        if len(self.route) < 2:
-            return True
-        else:
-            return False
+        return self.cursor >= len(self.route) - 1
 
     def accelerate(
         self,
@@ -163,7 +263,12 @@ class Train:
             new_velocity = min(new_velocity, self.track.max_velocity)
         self.velocity = new_velocity
 
-    def decelerate(self, deceleration: float = None, speed_coefficient: float = 1.0):
+    def decelerate(
+        self,
+        deceleration: float = None,
+        speed_coefficient: float = 1.0,
+        target_velocity: float = 0,
+    ):
         """
         Decelerates (i.e. decreases self.velocity) the train. Deceleration will always
         be higher or equal to 0 and lower or equal to self.max_acceleration
@@ -171,11 +276,14 @@ class Train:
         Args:
             deceleration (float, optional): How fast the train should decelerate. Defaults to self.max_acceleration
             speed_coefficient (float, optional): A coefficient that can be used to slow down the deceleration. Defaults to 1.0
+            target_velocity (float, optional): The velocity the train should not fall below. Defaults to 0
         """
         if deceleration is None:
             deceleration = self.max_acceleration
         deceleration = min(max(deceleration, 0), self.max_acceleration)
-        self.velocity = max(self.velocity - deceleration * speed_coefficient, 0)
+        self.velocity = max(
+            self.velocity - deceleration * speed_coefficient, target_velocity, 0
+        )
 
     def drive(self, fps: int, target_velocity_in_ms: int = 100, global_speed: int = 1):
         """
@@ -194,17 +302,21 @@ class Train:
         if self.velocity < target_velocity:
             self.accelerate(target_velocity, speed_coefficient=global_speed / fps)
         elif self.velocity > target_velocity:
-            self.decelerate(target_velocity, speed_coefficient=global_speed / fps)
+            self.decelerate(
+                speed_coefficient=global_speed / fps, target_velocity=target_velocity
+            )
 
         delta_s = self.velocity * global_speed / fps
         if self.reachedNode(delta_s):
             self.handleNodeReached()
         else:
-            if isinstance(self.route[0], SimpleSwitch):
-                current_node = self.route[0]
-                if current_node.getNextNodeFrom(self.previous_node) == self.route[1]:
-                    self.track = self.route[0].getTrackTo(self.route[1])
+            current_node = self.getCurrentNode()
+            if isinstance(current_node, SimpleSwitch):
+                next_node = current_node.getNextNodeFrom(self.previous_node)
+                if next_node == self.getNextNode():
+                    self.setTrack(self.route.getTrack(self.cursor))
             self.moveTrain(delta_s)
+        self.updateExtent()
 
     def getDistanceFromNode(self, node: Node) -> float:
         """
@@ -229,34 +341,131 @@ class Train:
             bool: True if the train reached its next destination
         """
         if node is None:
-            node = self.route[1]
+            node = self.getNextNode()
         if self.getDistanceFromNode(node) < epsilon:
             return True
         return False
 
     def handleNodeReached(self):
-        self.previous_node = self.route.popleft()
-        current_node = self.route[0]
+        self.previous_node = self.getCurrentNode()
+        self.cursor += 1
+        current_node = self.getCurrentNode()
         self.position = current_node.coordinates
+        if EVENT_BUS.wants(NodeReached):
+            EVENT_BUS.emit(
+                NodeReached(EVENT_BUS.time, self, current_node, self.previous_node)
+            )
 
         if self.getHasArrived():
-            print(self.getHasArrived())
+            if EVENT_BUS.wants(RouteCompleted):
+                EVENT_BUS.emit(
+                    RouteCompleted(EVENT_BUS.time, self, current_node, self.track)
+                )
             return
 
-        next_node = self.route[1]
+        next_node = self.getNextNode()
         if isinstance(current_node, SimpleSwitch):
             if current_node.getNextNodeFrom(self.previous_node) != next_node:
-                self.track = None
+                if EVENT_BUS.wants(SwitchBlocked):
+                    EVENT_BUS.emit(
+                        SwitchBlocked(EVENT_BUS.time, self, current_node, self.track)
+                    )
+                self.setTrack(None)
                 self.velocity = 0
                 return
             else:
-                self.track = current_node.getTrackFrom(self.previous_node)
+                self.setTrack(current_node.getTrackFrom(self.previous_node))
         else:
-            self.track = next_node.getTrackTo(next_node)
+            self.setTrack(self.route.getTrack(self.cursor))
 
     def moveTrain(self, delta_s: float):
         self.position = self.position + self.getTrainDirection() * delta_s
 
+    def updateExtent(self):
+        """
+        Walks back from the head of the train over the nodes it has passed and marks the stretch covered by its length
+        as occupied on every track beneath it. Tracks the train has cleared are released and the trail is shortened to
+        the passed nodes that are still beneath the train.
+        """
+        occupied_tracks = []
+        remaining = self.length
+        node = self.getCurrentNode()
+        self.tail_position = self.position
+
+        if not self.getHasArrived():
+            distance = self.getDistanceFromNode(node)
+            if distance > 0:
+                track = self.route.getTrack(self.cursor)
+                covered = min(distance, remaining)
+                track.occupancy.occupy(
+                    self,
+                    track.getOffset(node, distance - covered),
+                    track.getOffset(node, distance),
+                )
+                occupied_tracks.append(track)
+                remaining -= covered
+                self.tail_position = self.position - self.getTrainDirection() * covered
+
+        used_nodes = 0
+        for index in range(self.cursor - 1, self.trail_start - 1, -1):
+            if remaining <= 0:
+                break
+            previous_node = self.route[index]
+            track = self.route.getTrack(index)
+            covered = min(track.getLength(), remaining)
+            if any(track is other for other in occupied_tracks):
+                # A reversing train covers the track with its head and its tail
+                track.occupancy.add(
+                    self, track.getOffset(node), track.getOffset(node, covered)
+                )
+            else:
+                track.occupancy.occupy(
+                    self, track.getOffset(node), track.getOffset(node, covered)
+                )
+            occupied_tracks.append(track)
+            remaining -= covered
+            self.tail_position = (
+                node.coordinates + node.getDirectionTo(previous_node) * covered
+            )
+            node = previous_node
+            used_nodes += 1
+
+        self.trail_start = self.cursor - used_nodes
+        for track in self.occupied_tracks:
+            if all(track is not other for other in occupied_tracks):
+                track.occupancy.release(self)
+                if EVENT_BUS.wants(TrackCleared):
+                    EVENT_BUS.emit(TrackCleared(EVENT_BUS.time, self, track))
+        self.occupied_tracks = occupied_tracks
+
+    def getDistanceToTrainAhead(self, max_distance: float = np.inf):
+        """
+        Follows the route of the train and looks up the closest occupied stretch of another train on each track ahead.
+
+        Args:
+            max_distance (float, optional): The distance after which the search stops. Defaults to no limit.
+
+        Returns:
+            tuple: The distance to the tail of the train ahead and the train itself, or (None, None) if the route ahead is free
+        """
+        travelled = 0
+        distance_on_track = self.getDistanceFromNode(self.getCurrentNode())
+        for i in range(self.cursor, len(self.route) - 1):
+            if travelled > max_distance:
+                break
+            from_node = self.route[i]
+            track = self.route.getTrack(i)
+            distance, train = track.occupancy.getNextOccupant(
+                track.getOffset(from_node, distance_on_track),
+                towards_end=from_node == track.nodes[0],
+                exclude=self,
+            )
+            if train is not None and travelled + distance <= max_distance:
+                return travelled + distance, train
+            travelled += track.getLength() - distance_on_track
+            distance_on_track = 0
+        return None, None
+
 
 class LongDistanceTrain(Train):
     pass
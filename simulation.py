@@ -3,10 +3,22 @@ import pygame.font
 import controller.controls as controls
 from view.map_view import MapView
 from view.window_view import WindowView
+from view.dirty_view import DirtyRectView
+from view.heatmap_view import HeatmapView
+from view.tile_view import TilePyramid
+from view.windows import glyph_cache
 from model.environment import Map
 from enum import Enum
-import numpy as np
-from model.trains import Train
+from model.timetable import Dispatcher
+from model.timetable import loadTimetable
+from controller.server import ControlServer
+from model.engine import SimulationEngine
+from model.integrator import AdaptiveIntegrator
+from model.shared_state import SharedStateWriter
+from model.statistics import OperationsStatistics
+from model.scenarios import SAMPLE_ADJACENCY_MATRIX
+from model.scenarios import SAMPLE_MAX_VELOCITIES_IN_KMH
+from model.scenarios import SAMPLE_NODE_COORDINATES
 
 """
 Utility Methods
@@ -48,45 +60,19 @@ network = map.getRailNetwork(False)
 """
 Rails
 """
-node_coordinates = [
-    [0, 0],
-    [0, 310],
-    [0, -40],
-    [0, -250],
-    [240, -160],
-    [0, -510],
-    [870, -160],
-    [0, 1120],
-]
-adjacency_matrix = [
-    [0, 4, 1, 0, 0, 0, 0, 0],
-    [4, 0, 0, 0, 0, 0, 0, 2],
-    [1, 0, 0, 1, 1, 0, 0, 0],
-    [0, 0, 1, 0, 1, 2, 0, 0],
-    [0, 0, 1, 1, 0, 0, 1, 0],
-    [0, 0, 0, 2, 0, 0, 0, 0],
-    [0, 0, 0, 0, 1, 0, 0, 0],
-    [0, 2, 0, 0, 0, 0, 0, 0],
-]
-max_velocities_in_kmh = np.array(
-    [100, 100, 80, 60, 80, 180, 200, 200, 200, 160, 320, 200, 160, 160]
+network.initNodesAndTracks(
+    SAMPLE_NODE_COORDINATES,
+    SAMPLE_ADJACENCY_MATRIX,
+    kmh_to_ms(SAMPLE_MAX_VELOCITIES_IN_KMH),
 )
-max_velocities_in_ms = kmh_to_ms(max_velocities_in_kmh)
-network.initNodesAndTracks(node_coordinates, adjacency_matrix, max_velocities_in_ms)
 for node in network.nodes[0].adj_nodes:
     print(node)
 
 """
 Trains
 """
-train1 = Train("766RHZ", network.nodes[0])
-network.trains.append(train1)
-train1.addRoute([network.nodes[i] for i in [1, 7, 1, 0]])
-
-train2 = Train("K677D8", network.nodes[0])
-network.trains.append(train2)
-train2.addRoute([network.nodes[i] for i in [2, 4, 6, 4, 3, 5, 3, 2, 0]])
-print(train2.getRouteLogs())
+TIMETABLE_PATH = "assets/timetable.csv"
+dispatcher = Dispatcher(network, loadTimetable(TIMETABLE_PATH))
 for node in network.nodes:
     print(node)
 
@@ -97,9 +83,100 @@ pygame.init()
 window = pygame.display.set_mode((1280, 720))
 map_view = MapView(map)
 window_view = WindowView()
+# Only redraw and upload the parts of the screen that changed. Set to False to draw every frame completely.
+DIRTY_RECTS = True
+# The tracks and nodes are composed from pre-rendered tiles. Set a cache path to keep the tiles between runs.
+tiles = TilePyramid(map, cache_path=None)
+dirty_view = DirtyRectView(map, map_view, window_view, tiles=tiles)
+HEATMAP_KEY = pygame.K_h
+heatmap = HeatmapView(map, refresh_interval=2.0)
+show_heatmap = False
 pygame.display.set_caption("Traffic Network Simulator")
 key_state = {}
 running = True
+server = ControlServer()
+try:
+    server.start()
+except (OSError, TimeoutError) as error:
+    # The simulation runs without remote control if the server cannot listen
+    print(f"The control server could not be started: {error}")
+    server = None
+SHARED_STATE_NAME = "railnetsim"
+try:
+    exporter = SharedStateWriter(SHARED_STATE_NAME, network)
+except FileExistsError as error:
+    # Another simulation exports under the same name, viewers keep showing that one
+    print(f"The shared state is not exported: {error}")
+    exporter = None
+# Set an export path to append the running statistics to a JSON lines file every few simulated minutes
+statistics = OperationsStatistics(export_path=None, network=network)
+engine = SimulationEngine(
+    network,
+    dispatcher,
+    server,
+    step_rate=60,
+    global_speed=GLOBAL_SPEED.value,
+    exporter=exporter,
+    statistics=statistics,
+    # Substeps keep the trains accurate at high global speeds
+    integrator=AdaptiveIntegrator(),
+)
+# The inspectors read the live objects of the network, which the engine changes on its own thread
+window_view.lock = engine.lock
+engine.start()
+
+"""
+Fast-forward
+"""
+FAST_FORWARD_KEY = pygame.K_f
+CANCEL_KEY = pygame.K_ESCAPE
+FAST_FORWARD_DURATION = 30 * 60
+PROGRESS_RECT = pygame.Rect(440, 340, 400, 40)
+
+
+def format_time(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def draw_progress(fraction: float):
+    pygame.draw.rect(window, (160, 160, 160), PROGRESS_RECT)
+    bar = PROGRESS_RECT.inflate(-8, -8)
+    bar.width = int(bar.width * fraction)
+    pygame.draw.rect(window, (25, 50, 77), bar)
+    glyph_cache.render(
+        window,
+        f"Fast-forward {format_time(engine.simulated_time)} - Esc to cancel",
+        (PROGRESS_RECT.left + 8, PROGRESS_RECT.bottom + 4),
+    )
+    pygame.display.update(PROGRESS_RECT.inflate(0, 40))
+
+
+def fast_forward_cancelled() -> bool:
+    global running
+    for event in pygame.event.get():
+        if event.type == pygame.QUIT:
+            running = False
+            return True
+        if event.type == pygame.KEYDOWN and event.key == CANCEL_KEY:
+            return True
+    return False
+
+
+def fast_forward(target_time: float):
+    """
+    Suspends rendering and input handling and runs the engine without pause until the target time is reached or
+    the cancel key is pressed
+    """
+    engine.stop()
+    draw_progress(0)
+    engine.fastForward(
+        target_time, progress=draw_progress, cancelled=fast_forward_cancelled
+    )
+    key_state.clear()
+    dirty_view.invalidate()
+    engine.start()
+
 
 while running:
     clock.tick(60)
@@ -108,28 +185,42 @@ while running:
             running = False
         if event.type == pygame.KEYDOWN:
             key_state[event.key] = True
+            if event.key == FAST_FORWARD_KEY:
+                fast_forward(engine.simulated_time + FAST_FORWARD_DURATION)
+            if event.key == HEATMAP_KEY:
+                show_heatmap = not show_heatmap
+                if show_heatmap:
+                    dirty_view.add_overlay(heatmap)
+                else:
+                    dirty_view.remove_overlay(heatmap)
         elif event.type == pygame.KEYUP:
             key_state[event.key] = False
 
     controls.handle_view_controls(map_view, key_state)
-    controls.handle_mouse_input(map_view, window_view)
+    with engine.lock:
+        controls.handle_mouse_input(map_view, window_view)
 
     # Game logic
     map_view.clamp()
 
-    # Map
-    map.render(window, map_view)
-    window_view.draw_windows(window)
-
-    # Trains
-    fps = clock.get_fps()
-    train1.drive(
-        fps, target_velocity_in_ms=kmh_to_ms(100), global_speed=GLOBAL_SPEED.value
-    )
-    train2.drive(
-        fps, target_velocity_in_ms=kmh_to_ms(200), global_speed=GLOBAL_SPEED.value
-    )
-
-    pygame.display.update()
-
+    # Map, with the trains of the engine one step in the past
+    trains = engine.buffer.getInterpolated(delay=1 / engine.step_rate)
+    if DIRTY_RECTS:
+        pygame.display.update(
+            dirty_view.render(window, trains, simulated_time=engine.simulated_time)
+        )
+    else:
+        map.render(window, map_view, trains=trains)
+        if show_heatmap:
+            heatmap.update(trains, engine.simulated_time)
+            heatmap.draw(window, map_view)
+        window_view.draw_windows(window)
+        pygame.display.update()
+
+engine.stop()
+if server is not None:
+    server.stop()
+if exporter is not None:
+    exporter.close()
+tiles.close()
 pygame.quit()
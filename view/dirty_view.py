@@ -0,0 +1,215 @@
+import pygame
+import numpy as np
+
+from model.changes import ChangeKind
+from model.models import NodeModel
+from model.models import TrainModel
+from model.storage import STORAGE
+
+# Antialiased edges can reach one pixel beyond the rectangle reported by pygame.draw
+DIRTY_MARGIN = 2
+
+
+class DirtyRectView:
+    """
+    Draws the map with dirty rectangles. Tracks and idle nodes are drawn once into a cached map layer, overlays like
+    the heatmap are drawn over it into the background whenever they change. Every frame,
+    the areas of the moving parts of the last frame are restored from the background and the moving parts are drawn
+    again. Only the areas of parts that appeared, moved or disappeared are returned for pygame.display.update, so a
+    frame without changes uploads nothing.
+
+    Attributes:
+        map (Map): The map that is drawn
+        map_view (MapView): The view that determines the currently shown area
+        window_view (WindowView): The windows that are drawn on top of the map
+        tiles (TilePyramid): The pre-rendered tiles the map layer is composed from, or None to draw it from the
+            network
+        base (pygame.Surface): The cached tracks and nodes for the current view
+        background (pygame.Surface): The map layer with the overlays
+        overlays (list): The overlays drawn over the map layer. An overlay has a version that changes with its image,
+            update(trains, simulated_time) and draw(surface, view).
+        items (dict): The signature and screen area of every moving part of the last frame
+    """
+
+    def __init__(
+        self,
+        map,
+        map_view,
+        window_view,
+        dark_theme=False,
+        aa_mode=True,
+        tiles=None,
+    ):
+        self.map = map
+        self.map_view = map_view
+        self.window_view = window_view
+        self.tiles = tiles
+        self.dark_theme = dark_theme
+        self.aa_mode = aa_mode
+        self.base = None
+        self.background = None
+        self.background_key = None
+        self.overlays = []
+        self.overlay_versions = ()
+        self.node_ids = np.zeros(0, dtype=np.int64)
+        self.items = {}
+        self.map.getRailNetwork().addListener(self.handle_network_change)
+
+    def handle_network_change(self, change):
+        # Switch states are only shown for hovered nodes, which are not part of the background
+        if change.kind != ChangeKind.SWITCH_CHANGED:
+            self.base = None
+
+    def invalidate(self):
+        """
+        Forces the next frame to be drawn completely
+        """
+        self.base = None
+
+    def add_overlay(self, overlay):
+        self.overlays.append(overlay)
+        self.background = None
+
+    def remove_overlay(self, overlay):
+        if overlay in self.overlays:
+            self.overlays.remove(overlay)
+            self.background = None
+
+    def get_background_key(self, surface: pygame.Surface) -> tuple:
+        return (
+            tuple(self.map_view.position),
+            self.map_view.zoom,
+            surface.get_size(),
+            self.tiles.revision if self.tiles is not None else 0,
+        )
+
+    def render_base(self, surface: pygame.Surface):
+        self.base = pygame.Surface(surface.get_size())
+        if self.tiles is not None:
+            self.tiles.compose(self.base, self.map_view)
+        else:
+            self.map.render(
+                self.base,
+                self.map_view,
+                self.dark_theme,
+                self.aa_mode,
+                trains=[],
+                hover=False,
+            )
+        self.background_key = self.get_background_key(surface)
+        self.node_ids = np.array(
+            [node.id for node in self.map.getRailNetwork().nodes], dtype=np.int64
+        )
+
+    def render_background(self, surface: pygame.Surface):
+        if self.base is None or self.get_background_key(surface) != self.background_key:
+            self.render_base(surface)
+        if len(self.overlays) == 0:
+            self.background = self.base
+        else:
+            self.background = self.base.copy()
+            for overlay in self.overlays:
+                overlay.draw(self.background, self.map_view)
+        self.overlay_versions = self.get_overlay_versions()
+
+    def get_overlay_versions(self) -> tuple:
+        return tuple(overlay.version for overlay in self.overlays)
+
+    def get_hovered_nodes(self) -> list:
+        """
+        Returns the nodes whose activation area contains the mouse
+        """
+        if len(self.node_ids) == 0:
+            return []
+        radius = NodeModel(self.map.getRailNetwork().nodes[0]).radius * 2
+        centers = self.map_view.screen_coordinates(STORAGE.coordinates[self.node_ids])
+        mouse_position = np.array(pygame.mouse.get_pos())
+        hovered = np.flatnonzero(
+            np.all(
+                (centers - radius <= mouse_position)
+                & (mouse_position < centers + radius),
+                axis=1,
+            )
+        )
+        return [STORAGE.node_handles[node_id] for node_id in self.node_ids[hovered]]
+
+    def get_signatures(self, trains: list, hovered_nodes: list) -> dict:
+        signatures = {}
+        for train in trains:
+            signatures[("train", train.id)] = (
+                tuple(train.position),
+                tuple(train.getTrainDirection()),
+            )
+        for node in hovered_nodes:
+            signatures[("node", node.id)] = (node.switch_state,)
+        for i, window in enumerate(self.window_view.windows):
+            signatures[("window", i)] = (tuple(window.rect), window.get_state())
+        return signatures
+
+    def render(
+        self, surface: pygame.Surface, trains: list = None, simulated_time: float = None
+    ) -> list:
+        """
+        Brings the surface up to date
+
+        Args:
+            surface (pygame.Surface): The surface to draw on
+            trains (list, optional): The trains or train snapshots to draw. Defaults to the trains of the network.
+            simulated_time (float, optional): The simulated time of the trains, passed on to the overlays
+
+        Returns:
+            list: The rectangles of the surface that changed
+        """
+        if trains is None:
+            trains = self.map.getRailNetwork().trains
+        for overlay in self.overlays:
+            overlay.update(trains, simulated_time)
+        full_redraw = (
+            self.base is None
+            or self.background is None
+            or self.get_background_key(surface) != self.background_key
+            or self.get_overlay_versions() != self.overlay_versions
+        )
+        if full_redraw:
+            self.render_background(surface)
+            self.items = {}
+
+        hovered_nodes = self.get_hovered_nodes()
+        signatures = self.get_signatures(trains, hovered_nodes)
+        if not full_redraw and signatures == {
+            key: signature for key, (signature, _) in self.items.items()
+        }:
+            return []
+
+        if full_redraw:
+            surface.blit(self.background, (0, 0))
+        else:
+            for _, rect in self.items.values():
+                surface.blit(self.background, rect, rect)
+
+        items = {}
+        for train in trains:
+            rect = TrainModel(train).draw(surface, self.map_view)
+            key = ("train", train.id)
+            items[key] = (signatures[key], rect.inflate(DIRTY_MARGIN, DIRTY_MARGIN))
+        for node in hovered_nodes:
+            rect = NodeModel(node).draw(surface, self.map_view, hover=True)
+            key = ("node", node.id)
+            items[key] = (signatures[key], rect.inflate(DIRTY_MARGIN, DIRTY_MARGIN))
+        for i, window in enumerate(self.window_view.windows):
+            rect = window.draw(surface, self.window_view)
+            key = ("window", i)
+            items[key] = (signatures[key], rect.copy())
+
+        if full_redraw:
+            dirty_rects = [surface.get_rect()]
+        else:
+            dirty_rects = []
+            for key, item in items.items():
+                if self.items.get(key) != item:
+                    dirty_rects.append(item[1])
+            for key, item in self.items.items():
+                if items.get(key) != item:
+                    dirty_rects.append(item[1])
+        self.items = items
+        return dirty_rects
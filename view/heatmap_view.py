@@ -0,0 +1,183 @@
+import time
+
+import numpy as np
+import pygame
+
+DEFAULT_CELL_SIZE = 40
+DEFAULT_REFRESH_INTERVAL = 2.0
+DEFAULT_BLUR_RADIUS = 3
+DEFAULT_HALF_LIFE = 600
+MAX_ALPHA = 170
+
+# Color stops of the heatmap from idle to saturated
+COLOR_STOPS = np.array(
+    [
+        [0.0, 40, 80, 200],
+        [0.35, 40, 200, 120],
+        [0.65, 240, 220, 40],
+        [1.0, 220, 30, 30],
+    ]
+)
+
+
+def build_color_lut() -> tuple:
+    """
+    Interpolates the color stops into lookup tables for 256 intensity levels
+
+    Returns:
+        tuple: The (256, 3) color table and the (256,) alpha table
+    """
+    levels = np.linspace(0, 1, 256)
+    colors = np.stack(
+        [np.interp(levels, COLOR_STOPS[:, 0], COLOR_STOPS[:, i]) for i in range(1, 4)],
+        axis=1,
+    ).astype(np.uint8)
+    alphas = (np.sqrt(levels) * MAX_ALPHA).astype(np.uint8)
+    return colors, alphas
+
+
+def gaussian_blur(grid: np.ndarray, radius: int) -> np.ndarray:
+    """
+    Blurs a grid with a separable gaussian kernel, one shifted sum per kernel entry and axis
+
+    Args:
+        grid (np.ndarray): The grid to blur
+        radius (int): The radius of the kernel in cells
+
+    Returns:
+        np.ndarray: The blurred grid
+    """
+    if radius <= 0:
+        return grid
+    offsets = np.arange(-radius, radius + 1)
+    kernel = np.exp(-(offsets**2) / (2 * (radius / 2) ** 2))
+    kernel /= kernel.sum()
+    for axis in range(2):
+        padding = [(0, 0), (0, 0)]
+        padding[axis] = (radius, radius)
+        padded = np.pad(grid, padding)
+        blurred = np.zeros_like(grid)
+        length = grid.shape[axis]
+        for i, weight in enumerate(kernel):
+            blurred += weight * np.take(padded, np.arange(i, i + length), axis=axis)
+        grid = blurred
+    return grid
+
+
+class HeatmapView:
+    """
+    The HeatmapView shows where the network is busy. Every frame, the trains are counted into a grid over the map
+    that decays over simulated time. At a low rate, the grid is blurred, mapped to colors and uploaded into a surface
+    with pygame.surfarray, which is then drawn over the map with a single blit.
+
+    Attributes:
+        map (Map): The map the heatmap covers
+        cell_size (float): The edge length of a grid cell in map units
+        refresh_interval (float): The seconds of wall time between two refreshes of the image
+        blur_radius (int): The radius of the blur in cells
+        half_life (float): The simulated seconds after which counted occupancy has lost half of its weight
+        grid (np.ndarray): The accumulated occupancy of every cell, indexed by (x, y)
+        version (int): Increased whenever the image changed
+    """
+
+    def __init__(
+        self,
+        map,
+        cell_size: float = DEFAULT_CELL_SIZE,
+        refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+        blur_radius: int = DEFAULT_BLUR_RADIUS,
+        half_life: float = DEFAULT_HALF_LIFE,
+    ):
+        self.map = map
+        self.cell_size = cell_size
+        self.refresh_interval = refresh_interval
+        self.blur_radius = blur_radius
+        self.half_life = half_life
+        self.origin = -np.array(map.size, dtype=float) / 2
+        self.shape = tuple(
+            int(np.ceil(map.size[i] / cell_size)) for i in range(2)
+        )
+        self.grid = np.zeros(self.shape)
+        self.colors, self.alphas = build_color_lut()
+        self.image = None
+        self.version = 0
+        self.last_refresh = -np.inf
+        self.simulated_time = None
+
+    def update(self, trains: list, simulated_time: float = None):
+        """
+        Counts the trains into the grid and refreshes the image if the refresh interval has passed
+
+        Args:
+            trains (list): The trains or train snapshots
+            simulated_time (float, optional): The current simulated time, used for the decay. Without it, every
+                update counts as one second.
+        """
+        if simulated_time is None:
+            elapsed = 1.0
+        elif self.simulated_time is None:
+            elapsed = 0.0
+        else:
+            elapsed = max(simulated_time - self.simulated_time, 0.0)
+        self.simulated_time = simulated_time
+        if elapsed > 0:
+            self.grid *= 0.5 ** (elapsed / self.half_life)
+
+        if len(trains) > 0:
+            positions = np.array([train.position for train in trains], dtype=float)
+            cells = ((positions - self.origin) // self.cell_size).astype(np.int64)
+            inside = np.all((cells >= 0) & (cells < self.shape), axis=1)
+            cells = cells[inside]
+            np.add.at(self.grid, (cells[:, 0], cells[:, 1]), max(elapsed, 1e-3))
+
+        now = time.monotonic()
+        if now - self.last_refresh >= self.refresh_interval:
+            self.last_refresh = now
+            self.refresh()
+
+    def refresh(self):
+        """
+        Turns the grid into the heatmap image
+        """
+        intensity = gaussian_blur(self.grid, self.blur_radius)
+        peak = intensity.max()
+        if peak > 0:
+            intensity = intensity / peak
+        levels = (intensity * 255).astype(np.uint8)
+        image = pygame.Surface(self.shape, pygame.SRCALPHA)
+        pygame.surfarray.blit_array(image, self.colors[levels])
+        alpha = pygame.surfarray.pixels_alpha(image)
+        alpha[:] = self.alphas[levels]
+        del alpha
+        self.image = image
+        self.version += 1
+
+    def draw(self, surface: pygame.Surface, view):
+        """
+        Draws the visible part of the heatmap scaled to the view
+
+        Args:
+            surface (pygame.Surface): The surface to draw on
+            view (MapView): The view that determines the currently shown area
+        """
+        if self.image is None:
+            return
+        corners = (
+            np.array([[0, 0], surface.get_size()], dtype=float)
+            - np.array(view.position, dtype=float)
+        ) / view.zoom
+        low = np.clip(
+            np.floor((corners[0] - self.origin) / self.cell_size), 0, self.shape
+        ).astype(int)
+        high = np.clip(
+            np.ceil((corners[1] - self.origin) / self.cell_size), 0, self.shape
+        ).astype(int)
+        if np.any(high <= low):
+            return
+        visible = self.image.subsurface(pygame.Rect(tuple(low), tuple(high - low)))
+        top_left = view.screen_coordinates(self.origin + low * self.cell_size)
+        size = (high - low) * self.cell_size * view.zoom
+        scaled = pygame.transform.smoothscale(
+            visible, (int(np.ceil(size[0])), int(np.ceil(size[1])))
+        )
+        surface.blit(scaled, (int(top_left[0]), int(top_left[1])))
@@ -5,6 +5,9 @@ import model.nodes as nodes
 from model.environment import Map
 
 
+INSPECTOR_SIZE = (260, 150)
+
+
 def clamp(value, value_max, value_min):
     return max(min(value, value_max), value_min)
 
@@ -50,7 +53,8 @@ class MapView:
         """
         return coordinates * self.zoom + self.position
 
-    def handle_node_collision(self, window_view, mouse_position, left=True):
+    def handle_node_collision(self, window_view, mouse_position, left=True) -> bool:
+        hit = False
         for node in self.map.network.nodes:
             if isinstance(node, nodes.SimpleSwitch):
                 if (
@@ -59,7 +63,33 @@ class MapView:
                     )
                     < 10
                 ):
+                    hit = True
                     if left:
-                        window_view.add_window((600, 400), node.id, node)
-                    else:
-                        node.switch()
+                        window_view.add_window(INSPECTOR_SIZE, node.label, node)
+                    elif not node.isOccupied(nodes.SWITCH_CLEARANCE):
+                        self.map.network.toggleSwitch(node)
+        return hit
+
+    def handle_inspector_collision(self, window_view, mouse_position) -> bool:
+        """
+        Opens an inspector for the train or, if there is none, the track under the mouse.
+        """
+        for train in self.map.network.trains:
+            if (
+                np.linalg.norm(self.screen_coordinates(train.position) - mouse_position)
+                < 10
+            ):
+                window_view.add_window(INSPECTOR_SIZE, train.id, train)
+                return True
+        for track in self.map.network.tracks + self.map.network.ramps:
+            start = self.screen_coordinates(track.nodes[0].coordinates)
+            end = self.screen_coordinates(track.nodes[1].coordinates)
+            segment = end - start
+            length = np.dot(segment, segment)
+            if length == 0:
+                continue
+            t = np.clip(np.dot(mouse_position - start, segment) / length, 0, 1)
+            if np.linalg.norm(start + segment * t - mouse_position) < 5:
+                window_view.add_window(INSPECTOR_SIZE, track.label, track)
+                return True
+        return False
@@ -0,0 +1,246 @@
+import hashlib
+import math
+import os
+import queue
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pygame
+
+from model.changes import ChangeKind
+from model.environment import BACKGROUND_LIGHT
+from model.models import NodeModel
+from model.models import TrackModel
+from model.storage import STORAGE
+
+TILE_SIZE = 256
+# The zoom of level k is 2**k, the MapView zooms between about 0.08 and 2.2
+MIN_LEVEL = -4
+MAX_LEVEL = 2
+DEFAULT_CAPACITY = 256
+# Nodes and antialiased lines reach a few pixels beyond their coordinates
+TILE_MARGIN = 8
+
+
+class TileFrame:
+    """
+    The view of a single tile, offers the same screen_coordinates as the MapView
+    """
+
+    def __init__(self, zoom: float, position: np.ndarray):
+        self.zoom = zoom
+        self.position = position
+
+    def screen_coordinates(self, coordinates: np.ndarray) -> np.ndarray:
+        return coordinates * self.zoom + self.position
+
+
+class TileIndex:
+    """
+    The bounding boxes of everything drawn into the tiles, for one state of the network
+
+    Attributes:
+        track_ids (np.ndarray): The IDs of the tracks and then the ramps, in drawing order
+        track_min (np.ndarray): The (n, 2) lower corners of the bounding boxes of the tracks
+        track_max (np.ndarray): The (n, 2) upper corners of the bounding boxes of the tracks
+        node_ids (np.ndarray): The IDs of the nodes
+        signature (str): A hash of the drawn geometry, which names the tiles of the disk cache
+    """
+
+    def __init__(self, network):
+        self.track_ids = np.array(
+            [track.id for track in network.tracks + network.ramps], dtype=np.int64
+        )
+        self.node_ids = np.array([node.id for node in network.nodes], dtype=np.int64)
+        endpoints = STORAGE.coordinates[STORAGE.endpoints[self.track_ids]]
+        self.track_min = endpoints.min(axis=1)
+        self.track_max = endpoints.max(axis=1)
+        self.node_coordinates = STORAGE.coordinates[self.node_ids]
+        self.signature = hashlib.sha1(
+            endpoints.tobytes() + self.node_coordinates.tobytes()
+        ).hexdigest()[:16]
+
+    def get_tracks(self, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+        inside = np.all((self.track_min <= upper) & (self.track_max >= lower), axis=1)
+        return self.track_ids[inside]
+
+    def get_nodes(self, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+        inside = np.all(
+            (self.node_coordinates >= lower) & (self.node_coordinates <= upper), axis=1
+        )
+        return self.node_ids[inside]
+
+
+class TilePyramid:
+    """
+    The static tracks and nodes of the map, pre-rendered into square tiles at every zoom level between MIN_LEVEL and
+    MAX_LEVEL. A view is composed from the visible tiles of the nearest level above its zoom, scaled down to it, so
+    panning only blits tiles. Tiles are kept in memory with least-recently-used eviction and, if a cache path is
+    given, as PNG files named by the geometry they show. When the network changes, the outdated tiles are still shown
+    while a background thread renders them again.
+
+    Attributes:
+        map (Map): The map that is rendered
+        capacity (int): The number of tiles kept in memory
+        cache_path (str): The directory of the disk cache, or None
+        tiles (OrderedDict): The (signature, surface) of every cached tile by (level, x, y), least recently used first
+        revision (int): Increased whenever a tile was replaced in the background
+    """
+
+    def __init__(self, map, capacity: int = DEFAULT_CAPACITY, cache_path: str = None):
+        self.map = map
+        self.capacity = capacity
+        self.cache_path = cache_path
+        if cache_path is not None:
+            os.makedirs(cache_path, exist_ok=True)
+        self.tiles = OrderedDict()
+        self.revision = 0
+        self.index = None
+        self.scaled = {}
+        self.scaled_zoom = None
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+        self.queued = set()
+        self.worker = threading.Thread(target=self.regenerate, daemon=True)
+        self.worker.start()
+        self.map.getRailNetwork().addListener(self.handle_network_change)
+
+    def handle_network_change(self, change):
+        if change.kind != ChangeKind.SWITCH_CHANGED:
+            self.index = None
+
+    def close(self):
+        """
+        Stops the background thread
+        """
+        self.map.getRailNetwork().removeListener(self.handle_network_change)
+        self.pending.put(None)
+        self.worker.join()
+
+    def get_index(self) -> TileIndex:
+        index = self.index
+        if index is None:
+            index = TileIndex(self.map.getRailNetwork())
+            self.index = index
+        return index
+
+    def get_level(self, zoom: float) -> int:
+        return min(max(math.ceil(math.log2(zoom)), MIN_LEVEL), MAX_LEVEL)
+
+    def get_file_path(self, key: tuple, signature: str) -> str:
+        level, x, y = key
+        return os.path.join(self.cache_path, f"{signature}_{level}_{x}_{y}.png")
+
+    def render_tile(self, key: tuple, index: TileIndex) -> pygame.Surface:
+        """
+        Draws the tracks, ramps and nodes that reach into a tile, in the order of Map.render
+        """
+        level, x, y = key
+        zoom = 2.0**level
+        frame = TileFrame(zoom, -np.array([x, y], dtype=float) * TILE_SIZE)
+        lower = np.array([x, y]) * TILE_SIZE / zoom - TILE_MARGIN / zoom
+        upper = np.array([x + 1, y + 1]) * TILE_SIZE / zoom + TILE_MARGIN / zoom
+        tile = pygame.Surface((TILE_SIZE, TILE_SIZE))
+        tile.fill(BACKGROUND_LIGHT)
+        for track_id in index.get_tracks(lower, upper).tolist():
+            TrackModel(STORAGE.track_handles[track_id]).draw(tile, frame)
+        for node_id in index.get_nodes(lower, upper).tolist():
+            NodeModel(STORAGE.node_handles[node_id]).draw(tile, frame, hover=False)
+        if self.cache_path is not None:
+            pygame.image.save(tile, self.get_file_path(key, index.signature))
+        return tile
+
+    def store(self, key: tuple, signature: str, tile: pygame.Surface):
+        with self.lock:
+            self.tiles[key] = (signature, tile)
+            self.tiles.move_to_end(key)
+            while len(self.tiles) > self.capacity:
+                self.tiles.popitem(last=False)
+
+    def get_tile(self, key: tuple, index: TileIndex) -> pygame.Surface:
+        """
+        Returns a tile from memory, from disk or rendered. An outdated tile in memory is returned as it is and
+        queued for the background thread.
+        """
+        with self.lock:
+            entry = self.tiles.get(key)
+            if entry is not None:
+                self.tiles.move_to_end(key)
+        if entry is not None and entry[0] == index.signature:
+            return entry[1]
+        if self.cache_path is not None:
+            file_path = self.get_file_path(key, index.signature)
+            if os.path.exists(file_path):
+                tile = pygame.image.load(file_path)
+                self.store(key, index.signature, tile)
+                return tile
+        if entry is not None:
+            if key not in self.queued:
+                self.queued.add(key)
+                self.pending.put((key, index))
+            return entry[1]
+        tile = self.render_tile(key, index)
+        self.store(key, index.signature, tile)
+        return tile
+
+    def regenerate(self):
+        while True:
+            job = self.pending.get()
+            if job is None:
+                return
+            key, index = job
+            self.queued.discard(key)
+            # Jobs of an older network state are queued again when their tile is shown
+            if index is not self.index:
+                continue
+            tile = self.render_tile(key, index)
+            self.store(key, index.signature, tile)
+            self.revision += 1
+
+    def compose(self, surface: pygame.Surface, view):
+        """
+        Draws the static map layer for a view from the tiles of the nearest level
+
+        Args:
+            surface (pygame.Surface): The surface to draw on
+            view (MapView): The view that determines the currently shown area
+        """
+        index = self.get_index()
+        level = self.get_level(view.zoom)
+        scale = view.zoom / 2.0**level
+        tile_length = TILE_SIZE * scale
+        position = np.asarray(view.position, dtype=float)
+        size = np.array(surface.get_size())
+        # Only the tiles inside the map, whose origin lies in the center of the map
+        lower = np.maximum(-position, -np.array(self.map.size) / 2 * view.zoom)
+        upper = np.minimum(size - position, np.array(self.map.size) / 2 * view.zoom)
+        first = np.floor(lower / tile_length).astype(int)
+        last = np.ceil(upper / tile_length).astype(int)
+
+        if view.zoom != self.scaled_zoom:
+            self.scaled = {}
+            self.scaled_zoom = view.zoom
+        scaled_size = math.ceil(tile_length) + 1
+        scaled = {}
+        surface.fill(BACKGROUND_LIGHT)
+        for x in range(first[0], last[0]):
+            for y in range(first[1], last[1]):
+                key = (level, x, y)
+                tile = self.get_tile(key, index)
+                if scale != 1:
+                    source, scaled_tile = self.scaled.get(key, (None, None))
+                    if source is not tile:
+                        scaled_tile = pygame.transform.smoothscale(
+                            tile, (scaled_size, scaled_size)
+                        )
+                    scaled[key] = (tile, scaled_tile)
+                    tile = scaled_tile
+                surface.blit(
+                    tile,
+                    (
+                        math.floor(x * tile_length + position[0]),
+                        math.floor(y * tile_length + position[1]),
+                    ),
+                )
+        self.scaled = scaled
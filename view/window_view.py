@@ -1,21 +1,42 @@
 import pygame
 import numpy as np
 
-from view.windows import Window
+from view.windows import get_window_class
 
 
 class WindowView:
-    def __init__(self):
+    """
+    The WindowView holds the windows that are drawn on top of the map
+
+    Attributes:
+        windows (list): The open windows, in drawing order
+        lock: Given to new windows, which hold it while they read the objects they show, optional
+    """
+
+    def __init__(self, lock=None):
         self.windows = []
+        self.lock = lock
 
     def add_window(self, size, title, object=None):
         pos = (100 + len(self.windows) * 5, 100 + len(self.windows) * 5)
-        self.windows.append(Window(size, pos, title, object))
+        self.windows.append(
+            get_window_class(object)(size, pos, title, object, lock=self.lock)
+        )
+
+    def handle_window_collision(self, mouse_position) -> bool:
+        """
+        Closes the windows whose close icon was clicked.
 
-    def handle_window_collision(self, mouse_position):
+        Returns:
+            bool: True if the click was on a window
+        """
+        hit = False
         for window in reversed(self.windows):
+            if window.rect.collidepoint(mouse_position):
+                hit = True
             if window.is_closing(mouse_position):
                 self.windows.remove(window)
+        return hit
 
     def drag_window(self, mouse_position, relative_movement):
         for window in reversed(self.windows):
@@ -1,23 +1,97 @@
 import pygame
 import pygame.font
 
+from model.nodes import SimpleSwitch
+from model.nodes import SWITCH_CLEARANCE
+from model.storage import STORAGE
+from model.tracks import Track
+from model.trains import Train
+
 pygame.font.init()
 
 FILL_COLOR = pygame.Color(210, 210, 210)
 HEADER_COLOR = pygame.Color(160, 160, 160)
+TEXT_COLOR = pygame.Color(30, 30, 30)
+HEADER_TEXT_COLOR = pygame.Color(255, 255, 255)
+LINE_HEIGHT = 16
+CONTENT_MARGIN = 6
 
 font = pygame.font.SysFont("Arial", 12)
 close_icon = pygame.image.load("assets/close.png")
 
 
+class GlyphCache:
+    """
+    Renders text from cached glyphs. Every character is rendered once per color, so readouts whose digits change
+    every frame only need a few blits instead of a call to font.render.
+
+    Attributes:
+        font (pygame.font.Font): The font the glyphs are rendered with
+        glyphs (dict): The rendered glyph of every (character, color)
+    """
+
+    def __init__(self, font: pygame.font.Font):
+        self.font = font
+        self.glyphs = {}
+
+    def get_glyph(self, character: str, color) -> pygame.Surface:
+        key = (character, tuple(color))
+        glyph = self.glyphs.get(key)
+        if glyph is None:
+            glyph = self.font.render(character, True, color)
+            self.glyphs[key] = glyph
+        return glyph
+
+    def get_size(self, text: str) -> tuple:
+        return (
+            sum(self.get_glyph(character, TEXT_COLOR).get_width() for character in text),
+            self.font.get_linesize(),
+        )
+
+    def render(self, surface: pygame.Surface, text: str, position, color=TEXT_COLOR):
+        """
+        Blits a line of text onto a surface
+
+        Args:
+            surface (pygame.Surface): The surface to draw on
+            text (str): The text
+            position: The top left corner of the text
+            color (optional): The color of the text
+        """
+        x, y = position
+        for character in text:
+            glyph = self.get_glyph(character, color)
+            surface.blit(glyph, (x, y))
+            x += glyph.get_width()
+
+
+glyph_cache = GlyphCache(font)
+
+
 class Window:
-    def __init__(self, size, pos, title, object=None):
+    """
+    A Window is drawn from a retained surface. The surface is only rendered again when the title, the size or the
+    watched fields of the window change.
+
+    Attributes:
+        pos (tuple): The top left corner of the window on the screen
+        rect (pygame.Rect): The area of the window on the screen
+        title (str): The title shown in the header
+        object: The object the window belongs to, optional
+        lock: Held while the watched fields are read, if the object is changed by another thread, optional
+        surface (pygame.Surface): The retained content of the window
+    """
+
+    def __init__(self, size, pos, title, object=None, lock=None):
         self.width = size[0]
         self.height = size[1]
         self.pos = pos
         self.rect = pygame.Rect(self.pos[0], self.pos[1], self.width, self.height)
         self.title = title
         self.object = object
+        self.lock = lock
+        self.surface = None
+        self.rendered_state = None
 
     def drag(self, pos):
         self.pos = pos
@@ -29,10 +103,10 @@ class Window:
         ), pygame.Rect((self.pos[0] + self.width - 17), self.pos[1] + 1, 16, 16)
 
     def get_header_info(self):
-        text_surface = font.render(self.title, True, (255, 255, 255))
-        text_rect = text_surface.get_rect()
+        text_size = glyph_cache.get_size(self.title)
+        text_rect = pygame.Rect((0, 0), text_size)
         text_rect.center = self.get_header_rect()[0].center
-        return text_surface, text_rect
+        return self.title, text_rect
 
     def is_closing(self, pos):
         if self.get_header_rect()[1].collidepoint(pos):
@@ -42,13 +116,151 @@ class Window:
         if self.get_header_rect()[0].collidepoint(pos):
             return True
 
-    def draw(self, surface: pygame.Surface, view):
+    def watch(self) -> tuple:
+        """
+        Returns the values shown in the window. The window is rendered again when they change.
+        """
+        return ()
+
+    def get_lines(self, values: tuple) -> list:
+        """
+        Returns the lines of text shown below the header
+
+        Args:
+            values (tuple): The watched values, as returned by watch
+        """
+        return []
+
+    def get_state(self) -> tuple:
+        if self.lock is None:
+            values = self.watch()
+        else:
+            with self.lock:
+                values = self.watch()
+        return (self.title, self.width, self.height, values)
+
+    def render(self, values: tuple):
+        """
+        Renders the window into its retained surface, relative to its top left corner
+
+        Args:
+            values (tuple): The watched values, as returned by watch
+        """
+        self.surface = pygame.Surface((self.width, self.height))
+        self.surface.fill(FILL_COLOR)
         header, close_icon_rect = self.get_header_rect()
-        text_surface, text_rect = self.get_header_info()
+        header.move_ip(-self.pos[0], -self.pos[1])
+        close_icon_rect.move_ip(-self.pos[0], -self.pos[1])
+        pygame.draw.rect(self.surface, HEADER_COLOR, header)
+        pygame.draw.rect(self.surface, HEADER_COLOR, close_icon_rect)
+        title, text_rect = self.get_header_info()
+        text_rect.move_ip(-self.pos[0], -self.pos[1])
+        glyph_cache.render(self.surface, title, text_rect.topleft, HEADER_TEXT_COLOR)
+        self.surface.blit(close_icon, close_icon_rect)
+
+        y = header.bottom + CONTENT_MARGIN
+        for line in self.get_lines(values):
+            if y + LINE_HEIGHT > self.height:
+                break
+            glyph_cache.render(self.surface, line, (CONTENT_MARGIN, y))
+            y += LINE_HEIGHT
+
+    def draw(self, surface: pygame.Surface, view) -> pygame.Rect:
+        state = self.get_state()
+        if self.surface is None or state != self.rendered_state:
+            self.render(state[3])
+            self.rendered_state = state
+        surface.blit(self.surface, self.rect)
+        return self.rect
+
+
+class SwitchInspector(Window):
+    """
+    Shows the live state of a switch
+    """
+
+    def watch(self) -> tuple:
+        switch = self.object
+        return (
+            switch.switch_state,
+            switch.getStateCount(),
+            switch.isOccupied(SWITCH_CLEARANCE),
+        )
+
+    def get_lines(self, values: tuple) -> list:
+        switch = self.object
+        state, state_count, occupied = values
+        lines = [
+            f"State: {state + 1} of {state_count}",
+            f"Occupied: {'yes' if occupied else 'no'}",
+            "Connections:",
+        ]
+        for node in switch.adj_nodes:
+            next_node = switch.getNextNodeFrom(node)
+            target = "-" if next_node is None else next_node.label
+            lines.append(f"  {node.label} -> {target}")
+        return lines
+
+
+class TrackInspector(Window):
+    """
+    Shows the live state of a track
+    """
+
+    def watch(self) -> tuple:
+        track = self.object
+        occupancy = track.occupancy
+        return (
+            float(track.max_velocity),
+            tuple(train.id for train in occupancy.getTrains()),
+        )
+
+    def get_lines(self, values: tuple) -> list:
+        track = self.object
+        max_velocity, occupants = values
+        return [
+            f"From: {track.nodes[0].label}",
+            f"To: {track.nodes[1].label}",
+            f"Length: {track.getLength():.0f} m",
+            f"Max. velocity: {max_velocity * 3.6:.0f} km/h",
+            f"Occupied by: {', '.join(occupants) if occupants else '-'}",
+        ]
+
+
+class TrainInspector(Window):
+    """
+    Shows the live state of a train
+    """
+
+    def watch(self) -> tuple:
+        train = self.object
+        track = train.track
+        next_node = train.getNextNode()
+        return (
+            round(train.velocity * 3.6),
+            None if track is None else track.id,
+            None if next_node is None else next_node.id,
+        )
+
+    def get_lines(self, values: tuple) -> list:
+        train = self.object
+        velocity, track_id, next_node_id = values
+        return [
+            f"Type: {type(train).__name__}",
+            f"Velocity: {velocity} km/h",
+            f"Track: {'-' if track_id is None else STORAGE.getTrackLabel(track_id)}",
+            f"Next node: {'-' if next_node_id is None else STORAGE.node_handles[next_node_id].label}",
+        ]
 
-        pygame.draw.rect(surface, FILL_COLOR, self.rect)
-        pygame.draw.rect(surface, HEADER_COLOR, header)
-        pygame.draw.rect(surface, HEADER_COLOR, close_icon_rect)
 
-        surface.blit(text_surface, text_rect)
-        surface.blit(close_icon, close_icon_rect)
+def get_window_class(object) -> type:
+    """
+    Returns the inspector that shows an object, or Window for objects without one
+    """
+    if isinstance(object, SimpleSwitch):
+        return SwitchInspector
+    if isinstance(object, Track):
+        return TrackInspector
+    if isinstance(object, Train):
+        return TrainInspector
+    return Window
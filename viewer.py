@@ -0,0 +1,61 @@
+import sys
+import pygame
+import controller.controls as controls
+from view.map_view import MapView
+from view.window_view import WindowView
+from view.dirty_view import DirtyRectView
+from model.environment import Map
+from model.engine import TrainSnapshot
+from model.shared_state import SharedStateReader
+from model.storage import STORAGE
+
+"""
+Read-only viewer that draws a simulation running in another process from its shared memory export.
+Usage: python viewer.py [shared state name]
+"""
+
+SHARED_STATE_NAME = sys.argv[1] if len(sys.argv) > 1 else "railnetsim"
+
+map = Map([2 * 7680, 2 * 4320])
+network = map.getRailNetwork(False)
+reader = SharedStateReader(SHARED_STATE_NAME)
+node_ids = [node.id for node in reader.buildNetwork(network)]
+
+pygame.init()
+window = pygame.display.set_mode((1280, 720))
+map_view = MapView(map)
+window_view = WindowView()
+dirty_view = DirtyRectView(map, map_view, window_view)
+pygame.display.set_caption(f"Traffic Network Viewer - {SHARED_STATE_NAME}")
+clock = pygame.time.Clock()
+key_state = {}
+running = True
+
+while running:
+    clock.tick(60)
+    for event in pygame.event.get():
+        if event.type == pygame.QUIT:
+            running = False
+        if event.type == pygame.KEYDOWN:
+            key_state[event.key] = True
+        elif event.type == pygame.KEYUP:
+            key_state[event.key] = False
+
+    controls.handle_view_controls(map_view, key_state)
+    map_view.clamp()
+
+    frame = reader.read()
+    STORAGE.switch_states[node_ids] = frame["switch_states"]
+    trains = [
+        TrainSnapshot(train_id, position, direction, velocity)
+        for train_id, position, direction, velocity in zip(
+            frame["train_ids"],
+            frame["positions"],
+            frame["directions"],
+            frame["velocities"],
+        )
+    ]
+    pygame.display.update(dirty_view.render(window, trains))
+
+reader.close()
+pygame.quit()